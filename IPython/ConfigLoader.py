@@ -14,10 +14,16 @@ from IPython import Release
 __author__  = '%s <%s>' % Release.authors['Fernando']
 __license__ = Release.license
 
+import cPickle as pickle
 import exceptions
 import os
 from pprint import pprint
 
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
 from IPython import ultraTB
 from IPython.ipstruct import Struct
 from IPython.genutils import *
@@ -51,6 +57,9 @@ class ConfigLoader:
         self.reclimit = reclimit
         self.recdepth = 0
         self.included = []
+        # (name,incpath,file found or None) of every include lookup
+        self.lookups = []
+        self.problems = 0
         
     def load(self,fname,convert=None,recurse_key='',incpath = '.',**kw):
         """Load a configuration file, return the resulting Struct.
@@ -100,17 +109,130 @@ class ConfigLoader:
                 else:
                     found = 1
                 if found:
+                    self.lookups.append((incfilename,incpath,incfile))
                     try:
                         data.merge(self.load(incfile,convert,recurse_key,
                                              incpath,**kw),
                                    self.conflict)
                     except:
+                        self.problems += 1
                         Xinfo()
                         warn('Problem loading included file: '+
                              `incfilename` + '. Ignoring it...')
                 else:
+                    self.lookups.append((incfilename,incpath,None))
+                    self.problems += 1
                     warn('File `%s` not found. Included by %s' % (incfilename,fname))
 
         return data
 
+class CachedConfigLoader(ConfigLoader):
+
+    """ConfigLoader keeping the merged result of each top level file in a
+    pickle, under cachedir.
+
+    Along with the data, the cache remembers the path, mtime and size of every
+    file read (the whole include chain) and where each include was found.  If
+    any of those changed, the files are read again.  Loads with problems
+    (missing or broken includes) aren't cached, so their warnings show up
+    every time until they are fixed."""
+
+    def __init__(self,cachedir,conflict=None,field_sep=None,reclimit=15):
+        ConfigLoader.__init__(self,conflict,field_sep,reclimit)
+        self.cachedir = cachedir
+        # whether the last load came from the cache
+        self.cache_hit = False
+
+    def load(self,fname,convert=None,recurse_key='',incpath = '.',**kw):
+        if self.recdepth:
+            # an included file
+            return ConfigLoader.load(self,fname,convert,recurse_key,incpath,
+                                     **kw)
+        fname = filefind(fname,incpath)
+        key = self._key(fname,convert,recurse_key,incpath,kw)
+        cname = os.path.join(self.cachedir,md5(key).hexdigest() + '.pickle')
+        data = self._read_cache(cname,key)
+        self.cache_hit = data is not None
+        if self.cache_hit:
+            self.included = [s[0] for s in self._cached_stamps]
+            return data
+        data = ConfigLoader.load(self,fname,convert,recurse_key,incpath,**kw)
+        if not self.problems:
+            self._write_cache(cname,key,data)
+        return data
+
+    def _key(self,fname,convert,recurse_key,incpath,kw):
+        """Everything besides the files which the result depends on."""
+        conv = []
+        if convert:
+            for func,names in convert.items():
+                conv.append((getattr(func,'__name__',repr(func)),names))
+            conv.sort()
+        kw = kw.items()
+        kw.sort()
+        return repr((os.path.abspath(fname),Release.version,conv,recurse_key,
+                     incpath,self.field_sep,self.conflict,self.reclimit,kw))
+
+    def _stamps(self,files):
+        """The (path,mtime,size) of files."""
+        stamps = []
+        for fname in files:
+            st = os.stat(fname)
+            stamps.append((os.path.abspath(fname),st.st_mtime,st.st_size))
+        return stamps
+
+    def _read_cache(self,cname,key):
+        """Return the data cached in cname, or None if it's stale."""
+        try:
+            f = open(cname,'rb')
+            try:
+                ckey,stamps,lookups,data = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            # missing, or garbled in any of the ways unpickling can complain
+            return None
+        if ckey != key:
+            return None
+        self._cached_stamps = stamps
+        try:
+            if self._stamps([s[0] for s in stamps]) != stamps:
+                return None
+        except OSError:
+            return None
+        # a new file may now shadow an included one further down the path
+        for name,incpath,found in lookups:
+            try:
+                if os.path.abspath(filefind(name,incpath)) != found:
+                    return None
+            except IOError:
+                return None
+        return data
+
+    def _write_cache(self,cname,key,data):
+        """Save data to cname, atomically; errors are ignored."""
+        import tempfile
+        tmpname = None
+        try:
+            stamps = self._stamps(self.included)
+            lookups = [(name,incpath,os.path.abspath(found))
+                       for name,incpath,found in self.lookups]
+            if not os.path.isdir(self.cachedir):
+                os.makedirs(self.cachedir)
+            fd,tmpname = tempfile.mkstemp('.tmp','',self.cachedir)
+            f = os.fdopen(fd,'wb')
+            try:
+                pickle.dump((key,stamps,lookups,data),f,2)
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists(cname):
+                os.remove(cname)
+            os.rename(tmpname,cname)
+        except (IOError,OSError,pickle.PicklingError):
+            if tmpname is not None:
+                try:
+                    os.remove(tmpname)
+                except OSError:
+                    pass
+
 # end ConfigLoader
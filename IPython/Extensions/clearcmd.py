@@ -45,12 +45,11 @@ def clear_f(self,arg):
 
         elif target == 'shadow_compress':
             print "Compressing shadow history"
-            api.db.hcompress('shadowhist')
+            self.shadowhist.compress()
             
         elif target == 'shadow_nuke':
             print "Erased all keys from shadow history "
-            for k in ip.db.keys('shadowhist/*'):
-                del ip.db[k]
+            self.shadowhist.clear()
         elif target == 'dhist':
             print "Clearing directory history"
             del ip.user_ns['_dh'][:]
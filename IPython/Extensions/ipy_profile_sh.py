@@ -32,17 +32,21 @@ def main():
     # beefed up %env is handy in shell mode
     import envpersist
     
+    # The extensions loaded with declarations below are only imported the
+    # first time they are used (see %extensions)
+    
     # To see where mycmd resides (in path/aliases), do %which mycmd 
-    import ipy_which
+    ip.load('ipy_which', magics = ['which'])
     
     # tab completers for hg, svn, ...
-    import ipy_app_completers
+    ip.load('ipy_app_completers', completers = ['svn','hg','bzr'],
+            re_completers = ['.*apt-get'])
     
     # To make executables foo and bar in mybin usable without PATH change, do:
     # %rehashdir c:/mybin
     # %store foo
     # %store bar
-    import ipy_rehashdir
+    ip.load('ipy_rehashdir', magics = ['rehashdir'])
     import ipy_signals
     
     ip.ex('import os')
@@ -101,7 +105,7 @@ def main():
             ip.defalias(key, cmd)
 
     # mglob combines 'find', recursion, exclusion... '%mglob?' to learn more
-    ip.load("IPython.external.mglob")    
+    ip.load("IPython.external.mglob", magics = ['mglob'])
 
     # win32 is crippled w/o cygwin, try to help it a little bit
     if sys.platform == 'win32':
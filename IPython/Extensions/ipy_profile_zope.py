@@ -275,7 +275,7 @@ class ZopeDebug(object):
 zope_debug = None
 
 def ipy_set_trace():
-    import IPython; IPython.Debugger.Pdb().set_trace()
+    from IPython import Debugger; Debugger.Pdb().set_trace()
 
 def main():
     global zope_debug
@@ -17,8 +17,9 @@ import sys
 
 import ext_rescapture # var = !ls and var = %magic
 import pspersistence # %store magic
-import clearcmd # %clear
 
-import ipy_stock_completers
-
-ip.load('IPython.history')
+# The ones below are only loaded when first used (see %extensions)
+ip.load('clearcmd', magics = ['clear'])
+ip.load('ipy_stock_completers', completers = ['import','from','%run','%cd'])
+ip.load('IPython.history', magics = ['rep','hist','history'],
+        completers = ['%hist'])
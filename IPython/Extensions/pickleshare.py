@@ -39,75 +39,510 @@ import cPickle as pickle
 import UserDict
 import warnings
 import glob
+import fnmatch
+import threading
+import select
+import zlib
 
 from sets import Set as set
 
+# sqlite3 is slow to import, it's only loaded when a SqliteShareDB is made
+sqlite3 = None
+
+def have_sqlite3():
+    """Import sqlite3 if needed, return whether it's available (python 2.5
+    and later)."""
+    global sqlite3
+    if sqlite3 is None:
+        try:
+            import sqlite3
+        except ImportError:
+            return False
+    return True
+
+try:
+    import fcntl
+except ImportError:
+    # win32, locking is only done between threads of one process
+    fcntl = None
+
 def gethashfile(key):
     return ("%02x" % abs(hash(key) % 256))[-2:]
 
+def globmatch(key, pat):
+    """ Does normalized 'key' match 'pat' the way glob.glob() would match it?
+    
+    I.e. wildcards never match across '/'.
+    """
+    parts = key.split('/')
+    patparts = pat.split('/')
+    if len(parts) != len(patparts):
+        return False
+    for p, pp in zip(parts, patparts):
+        if not fnmatch.fnmatchcase(p, pp):
+            return False
+    return True
+
+def filestamp(st):
+    """ Cache validator for a file with stat result 'st' 
+    
+    Writes rename a new file over the old one, so the inode changes even
+    when mtime (which may have a resolution of one second) doesn't.
+    """
+    return (st.st_mtime, st.st_size, st.st_ino)
+
 _sentinel = object()
 
+class LRUCache:
+    """ Bounded cache of unpickled values, least recently used go first
+    
+    Both the number of entries and their total size can be limited (None
+    means no limit). The size of an entry is the size of the pickle it was 
+    read from, which is a reasonable estimate of the memory it takes.
+    When a limit is exceeded, the least recently used entries are evicted
+    until the cache is below 90% of the limit again.
+    
+    hits, misses and evictions are counted for tuning, see stats().
+    """
+    def __init__(self, maxitems = 1000, maxbytes = 64 * 1024 * 1024):
+        self.maxitems = maxitems
+        self.maxbytes = maxbytes
+        # { key : [entry, size, last_use] }
+        self.data = {}
+        self.nbytes = 0
+        self.tick = 0
+        self.hits = self.misses = self.evictions = 0
+        
+    def get(self, key, default = None):
+        """ Return the entry for 'key' and mark it as recently used """
+        d = self.data.get(key)
+        if d is None:
+            return default
+        self.tick += 1
+        d[2] = self.tick
+        return d[0]
+    
+    def put(self, key, entry, size = 0):
+        """ Store 'entry' for 'key', evicting old entries if needed """
+        self.pop(key)
+        if self.maxbytes is not None and size > self.maxbytes:
+            # would evict everything else and itself, don't bother
+            return
+        self.tick += 1
+        self.data[key] = [entry, size, self.tick]
+        self.nbytes += size
+        if ((self.maxitems is not None and len(self.data) > self.maxitems) or
+            (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            self._evict()
+    
+    def _evict(self):
+        lru = [(d[2], k) for k, d in self.data.items()]
+        lru.sort()
+        maxitems = self.maxitems is not None and int(self.maxitems * 0.9)
+        maxbytes = self.maxbytes is not None and int(self.maxbytes * 0.9)
+        for tick, k in lru:
+            if ((maxitems is False or len(self.data) <= maxitems) and
+                (maxbytes is False or self.nbytes <= maxbytes)):
+                break
+            self.pop(k)
+            self.evictions += 1
+            
+    def pop(self, key, default = None):
+        """ Remove 'key' and return its entry """
+        d = self.data.pop(key, None)
+        if d is None:
+            return default
+        self.nbytes -= d[1]
+        return d[0]
+    
+    def clear(self):
+        """ Empty the cache (the counters are kept) """
+        self.data = {}
+        self.nbytes = 0
+    
+    def __contains__(self, key):
+        return key in self.data
+    
+    def __len__(self):
+        return len(self.data)
+    
+    def stats(self):
+        """ Return a dict of the hit/miss/eviction counters and current size """
+        return {'hits' : self.hits, 'misses' : self.misses, 
+                'evictions' : self.evictions, 'items' : len(self.data),
+                'bytes' : self.nbytes }
+                
 class PickleShareDB(UserDict.DictMixin):
-    """ The main 'connection' object for PickleShare database """
-    def __init__(self,root):
+    """ The main 'connection' object for PickleShare database 
+    
+    With 'writeback' set to a number of seconds, assignments are kept in 
+    memory (repeated writes to the same key are coalesced) and written out 
+    by a background thread at most that many seconds later, or whenever 
+    flush() is called. Other processes only see the values after that.
+    
+    Values read are kept in an LRUCache of at most 'cacheitems' entries 
+    and 'cachebytes' bytes of pickles. A cached value is normally validated
+    with a stat() of its file on every read; with 'trust' set to a number 
+    of seconds it is returned without that check if it was validated less 
+    than 'trust' seconds ago. 
+    
+    hset() appends a small record to the bucket file instead of rewriting
+    the whole bucket. Reading a file replays all records appended to it,
+    and a bucket is compacted back to a single pickle once the appended 
+    records outnumber its keys (and 'hcompact_min'). Older versions read 
+    only the first pickle of a bucket, so appended buckets are kept in the 
+    'hlogdir' subdirectory of the hashroot, where they don't look for them.
+    
+    hset() and other read-modify-write operations hold an advisory fcntl 
+    lock (see lock()), so concurrent updates from several processes are not
+    lost. This doesn't hold for values held back by 'writeback'.
+    """
+    
+    hcompact_min = 32
+    hlogdir = 'log'
+    
+    def __init__(self,root, writeback = 0, trust = 0, cacheitems = 1000,
+                 cachebytes = 64 * 1024 * 1024):
         """ Return a db object that will manage the specied directory"""
         self.root = Path(root).expanduser().abspath()
         if not self.root.isdir():
             self.root.makedirs()
-        # cache has { 'key' : (obj, orig_mod_time) }
-        self.cache = {}
+        # cache has { 'key' : [obj, filestamp, last_validated, 
+        #                      end_offset, records, read_time] }
+        self.cache = LRUCache(cacheitems, cachebytes)
+        self.trust = trust
+        # values waiting to be written, { fil : obj }
+        self.pending = {}
+        self.writeback = writeback
+        self._lock = threading.RLock()
+        self._stopflusher = threading.Event()
+        if writeback:
+            t = threading.Thread(target = self._flushloop)
+            t.setDaemon(True)
+            t.start()
+        self._initlocks(self.root / '.lock', self.root / '.waiters')
+        
+    def _initlocks(self, lockfile, waitdir):
+        """ Set up lock() and waitget() notification state """
+        self._lockfile = lockfile
+        self._lockfd = None
+        self._lockdepth = {}
+        self._locklock = threading.RLock()
+        self._waitdir = waitdir
+        
+    def lock(self, name):
+        """ Acquire the advisory lock 'name', shared by all processes
+        
+        Locks are reentrant and also exclude other threads of the same 
+        process. Reads done while holding a lock always validate the cache,
+        regardless of 'trust'. Call unlock(name) when done, e.g.::
+        
+            db.lock('counter')
+            try:
+                db['counter'] = db.get('counter', 0) + 1
+            finally:
+                db.unlock('counter')
+        """
+        self._locklock.acquire()
+        depth = self._lockdepth.get(name, 0)
+        if depth == 0 and fcntl is not None:
+            if self._lockfd is None:
+                self._lockfd = os.open(self._lockfile, 
+                                       os.O_RDWR | os.O_CREAT, 0666)
+            try:
+                # one byte per lock name, collisions only cost concurrency
+                fcntl.lockf(self._lockfd, fcntl.LOCK_EX, 1, 
+                            zlib.crc32(name) & 0xffff)
+            except:
+                self._locklock.release()
+                raise
+        self._lockdepth[name] = depth + 1
+        
+    def unlock(self, name):
+        """ Release the lock 'name' taken with lock() """
+        depth = self._lockdepth[name] - 1
+        if depth == 0:
+            del self._lockdepth[name]
+            if fcntl is not None:
+                fcntl.lockf(self._lockfd, fcntl.LOCK_UN, 1, 
+                            zlib.crc32(name) & 0xffff)
+        else:
+            self._lockdepth[name] = depth
+        self._locklock.release()
+        
+    def _trusted(self):
+        """ Current trust window, no trust while holding a lock """
+        if self._lockdepth:
+            return 0
+        return self.trust
+        
+    def _notify(self):
+        """ Wake up waitget() calls of all processes waiting on this db """
+        try:
+            waiters = os.listdir(self._waitdir)
+        except OSError:
+            return
+        for w in waiters:
+            try:
+                fd = os.open(os.path.join(self._waitdir, w), 
+                             os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                # ENXIO: the waiter is gone without cleaning up
+                try:
+                    os.remove(os.path.join(self._waitdir, w))
+                except OSError:
+                    pass
+                continue
+            try:
+                try:
+                    os.write(fd, 'x')
+                except OSError:
+                    # pipe full, it will wake up anyway
+                    pass
+            finally:
+                os.close(fd)
         
 
     def __getitem__(self,key):
         """ db['key'] reading """
         fil = self.root / key
+        if fil in self.pending:
+            return self.pending[fil]
+        cache = self.cache
+        now = time.time()
+        ent = cache.get(fil)
+        if ent is not None and now - ent[2] < self._trusted():
+            cache.hits += 1
+            return ent[0]
         try:
-            mtime = (fil.stat()[stat.ST_MTIME])
+            st = fil.stat()
         except OSError:
+            cache.pop(fil)
             raise KeyError(key)
 
-        if fil in self.cache and mtime == self.cache[fil][1]:
-            return self.cache[fil][0]
+        stamp = filestamp(st)
+        if (ent is not None and self._lockdepth and ent[4] == 1 and 
+            ent[5] - ent[1][0] < 1):
+            # Read-modify-write under a lock can't risk a stale value: a
+            # rewrite within the mtime resolution that happened to reuse 
+            # the inode and size would go unnoticed. Same as git's "racily
+            # clean" index entries. (Append logs are only ever rewritten
+            # by compaction, which changes their size.)
+            ent = None
+        if ent is not None and stamp == ent[1]:
+            cache.hits += 1
+            ent[2] = now
+            return ent[0]
+        cache.misses += 1
         try:
-            # The cached item has expired, need to read
-            obj = pickle.load(fil.open())
-        except:
+            f = fil.open('rb')
+        except IOError:
+            raise KeyError(key)
+        try:
+            if (ent is not None and st.st_ino and st.st_ino == ent[1][2] 
+                and st.st_size > ent[3]):
+                # Same file, it was only appended to by hset(); just 
+                # replay the new records on top of what we have
+                f.seek(ent[3])
+                obj, offset, nrec = self._replay(f, ent[0], ent[3], ent[4])
+            else:
+                # The cached item has expired, need to read
+                obj, offset, nrec = self._replay(f)
+        finally:
+            f.close()
+        if obj is _sentinel:
+            cache.pop(fil)
             raise KeyError(key)
             
-        self.cache[fil] = (obj,mtime)
+        cache.put(fil, [obj, stamp, now, offset, nrec, now], st.st_size)
         return obj
     
+    def _replay(self, f, obj = _sentinel, offset = 0, nrec = 0):
+        """ Read a pickle from 'f' and apply the dict records appended to it
+        
+        Returns (obj, offset, records), where offset is the end of the last
+        complete record. A truncated record (from a crash in the middle of
+        an append) ends the replay.
+        """
+        while 1:
+            try:
+                rec = pickle.load(f)
+            except:
+                # EOF or a partial record
+                break
+            if obj is _sentinel:
+                obj = rec
+            else:
+                obj.update(rec)
+            nrec += 1
+            offset = f.tell()
+        return obj, offset, nrec
+    
     def __setitem__(self,key,value):
         """ db['key'] = 5 """
         fil = self.root / key
+        if self.writeback:
+            self._lock.acquire()
+            try:
+                self.pending[fil] = value
+            finally:
+                self._lock.release()
+            return
+        self._write(fil, value)
+
+    def _write(self, fil, value):
+        """ Atomically replace file 'fil' with the pickle of 'value'
+        
+        The pickle goes to a temporary file first, which is then renamed 
+        over 'fil', so readers never see a truncated pickle.
+        """
         parent = fil.parent
         if parent and not parent.isdir():
             parent.makedirs()
-        pickled = pickle.dump(value,fil.open('w'))
+        import tempfile
+        fd, tmpname = tempfile.mkstemp(prefix = '.' + fil.basename() + '-',
+                                       dir = parent)
+        f = os.fdopen(fd, 'wb')
         try:
-            self.cache[fil] = (value,fil.mtime)
+            try:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            try:
+                os.rename(tmpname, fil)
+            except OSError:
+                # win32 can't rename over an existing file
+                fil.remove()
+                os.rename(tmpname, fil)
+        except:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+        try:
+            st = fil.stat()
         except OSError,e:
             if e.errno != 2:
                 raise
+        else:
+            now = time.time()
+            self.cache.put(fil, [value, filestamp(st), now, st.st_size, 1, 
+                                 now], st.st_size)
+        self._notify()
+
+    def flush(self):
+        """ Write out all values held back by 'writeback' mode """
+        self._lock.acquire()
+        try:
+            for fil, value in self.pending.items():
+                # write first, so readers never miss the key in between
+                self._write(fil, value)
+                del self.pending[fil]
+        finally:
+            self._lock.release()
+
+    # shelve compatible name
+    sync = flush
+
+    def _flushloop(self):
+        """ Background thread body for 'writeback' mode """
+        while not self._stopflusher.isSet():
+            self._stopflusher.wait(self.writeback)
+            try:
+                self.flush()
+            except (IOError, OSError), e:
+                warnings.warn("PickleShareDB: writeback failed: %s" % e)
+
+    def close(self):
+        """ Flush pending writes and stop the writeback thread """
+        self._stopflusher.set()
+        self.flush()
     
     def hset(self, hashroot, key, value):
         """ hashed set """
-        hroot = self.root / hashroot
-        if not hroot.isdir():
-            hroot.makedirs()
-        hfile = hroot / gethashfile(key)
-        d = self.get(hfile, {})
-        d.update( {key : value})
-        self[hfile] = d                
+        self.lock(hashroot)
+        try:
+            self._hset(hashroot, key, value)
+        finally:
+            self.unlock(hashroot)
+            
+    def _hset(self, hashroot, key, value):
+        bucket = gethashfile(key)
+        hfile = self.root / hashroot / bucket
+        lfile = self.root / hashroot / self.hlogdir / bucket
+        d = self.get(lfile, _sentinel)
+        if d is _sentinel:
+            d = self.get(hfile, _sentinel)
+            if d is _sentinel or self.writeback:
+                # new bucket, or it's going to be written out later anyway
+                if d is _sentinel:
+                    d = {}
+                d.update( {key : value})
+                self[hfile] = d
+                return
+            # start appending; the log is in place before the plain bucket
+            # goes away, so readers always find one of them
+            d[key] = value
+            self._write(lfile, d)
+            del self[hfile]
+            return
+        
+        ent = self.cache.get(lfile)
+        if self.writeback or ent is None:
+            d[key] = value
+            self[lfile] = d
+            return
+        
+        # an older version doesn't know about the log and may have started
+        # a new plain bucket next to it
+        stray = self.get(hfile, None)
+        offset, nrec = ent[3], ent[4]
+        waste = nrec - 1
+        if (stray is not None or offset != ent[1][1] or
+            waste >= max(self.hcompact_min, len(d))):
+            # too many records to replay (or junk after the last one), 
+            # write the whole bucket out again as a plain one
+            if stray is not None:
+                stray.update(d)
+                d = stray
+            d[key] = value
+            self._write(hfile, d)
+            del self[lfile]
+            return
+        
+        rec = pickle.dumps({key : value}, pickle.HIGHEST_PROTOCOL)
+        # a single write of a small record in append mode doesn't get mixed
+        # up with appends from other processes
+        f = open(lfile, 'ab')
+        try:
+            f.write(rec)
+        finally:
+            f.close()
+        try:
+            st = lfile.stat()
+        except OSError:
+            self.cache.pop(lfile)
+            return
+        if st.st_ino == ent[1][2] and st.st_size == offset + len(rec):
+            # nobody else touched it, no need to read it back
+            d[key] = value
+            now = time.time()
+            self.cache.put(lfile, [d, filestamp(st), now, st.st_size, 
+                                   nrec + 1, now], st.st_size)
+        else:
+            self.cache.pop(lfile)
+        self._notify()
 
     
     
     def hget(self, hashroot, key, default = _sentinel, fast_only = True):
         """ hashed get """
-        hroot = self.root / hashroot
-        hfile = hroot / gethashfile(key)
-        
-        d = self.get(hfile, _sentinel )
+        bucket = gethashfile(key)
+        d = _sentinel
+        if self.hlogdir:
+            d = self.get(hashroot + '/' + self.hlogdir + '/' + bucket, 
+                         _sentinel)
+        if d is _sentinel:
+            d = self.get(hashroot + '/' + bucket, _sentinel)
         #print "got dict",d,"from",hfile
         if d is _sentinel:
             if fast_only:
@@ -121,15 +556,28 @@ class PickleShareDB(UserDict.DictMixin):
         
         return d.get(key, default)
 
-    def hdict(self, hashroot):
-        """ Get all data contained in hashed category 'hashroot' as dict """
+    def hbuckets(self, hashroot):
+        """ Keys of the bucket files of hashed category 'hashroot'
+        
+        Updating a dict with the buckets in this order gives the current 
+        contents: the hcompress()ed bucket comes first, appended buckets
+        last.
+        """
         hfiles = self.keys(hashroot + "/*")
         hfiles.sort()
         last = len(hfiles) and hfiles[-1] or ''
         if last.endswith('xx'):
             # print "using xx"
             hfiles = [last] + hfiles[:-1]
-            
+        if self.hlogdir:
+            logs = self.keys(hashroot + '/' + self.hlogdir + '/*')
+            logs.sort()
+            hfiles.extend(logs)
+        return hfiles
+        
+    def hdict(self, hashroot):
+        """ Get all data contained in hashed category 'hashroot' as dict """
+        hfiles = self.hbuckets(hashroot)
         all = {}
         
         for f in hfiles:
@@ -151,7 +599,14 @@ class PickleShareDB(UserDict.DictMixin):
         hset before hcompress).
         
         """
-        hfiles = self.keys(hashroot + "/*")
+        self.lock(hashroot)
+        try:
+            self._hcompress(hashroot)
+        finally:
+            self.unlock(hashroot)
+            
+    def _hcompress(self, hashroot):
+        hfiles = self.hbuckets(hashroot)
         all = {}
         for f in hfiles:
             # print "using",f
@@ -160,17 +615,21 @@ class PickleShareDB(UserDict.DictMixin):
             
         self[hashroot + '/xx'] = all
         for f in hfiles:
-            p = self.root / f
-            if p.basename() == 'xx':
+            if f.endswith('/xx'):
                 continue
-            p.remove()
+            del self[f]
             
             
         
     def __delitem__(self,key):
         """ del db["key"] """
         fil = self.root / key
-        self.cache.pop(fil,None)
+        self.cache.pop(fil)
+        self._lock.acquire()
+        try:
+            self.pending.pop(fil,None)
+        finally:
+            self._lock.release()
         try:
             fil.remove()
         except OSError:
@@ -189,7 +648,15 @@ class PickleShareDB(UserDict.DictMixin):
             files = self.root.walkfiles()
         else:
             files = [Path(p) for p in glob.glob(self.root/globpat)]
-        return [self._normalized(p) for p in files if p.isfile()]
+        res = [self._normalized(p) for p in files 
+               if p.isfile() and not p.basename().startswith('.')]
+        for fil in self.pending.keys():
+            k = self._normalized(fil)
+            if k in res:
+                continue
+            if globpat is None or globmatch(k, globpat.replace('\\','/')):
+                res.append(k)
+        return res
 
     def uncache(self,*items):
         """ Removes all, or specified items from cache
@@ -200,12 +667,12 @@ class PickleShareDB(UserDict.DictMixin):
          
         """
         if not items:
-            self.cache = {}
+            self.cache.clear()
         for it in items:
-            self.cache.pop(it,None)
+            self.cache.pop(self.root / it)
             
     def waitget(self,key, maxwaittime = 60 ):
-        """ Wait (poll) for a key to get a value
+        """ Wait for a key to get a value
         
         Will wait for `maxwaittime` seconds before raising a KeyError.
         The call exits normally if the `key` field in db gets a value
@@ -216,26 +683,76 @@ class PickleShareDB(UserDict.DictMixin):
         in another process (which causes all 'get' operation to cause a 
         KeyError for the duration of pickling) won't screw up your program 
         logic. 
+        
+        Where named pipes are available, every write to the db wakes up the
+        waiting processes immediately; the db is still polled with growing
+        intervals (up to a second) for writers that don't notify.
         """
         
         wtimes = [0.2] * 3 + [0.5] * 2 + [1]
         tries = 0
-        waited = 0
-        while 1:
-            try:
-                val = self[key]
-                return val
-            except KeyError:
-                pass
-            
-            if waited > maxwaittime:
-                raise KeyError(key)
+        deadline = time.time() + maxwaittime
+        fifo = self._openwaiter()
+        try:
+            while 1:
+                try:
+                    val = self[key]
+                    return val
+                except KeyError:
+                    pass
+                
+                left = deadline - time.time()
+                if left < 0:
+                    raise KeyError(key)
+                
+                wtime = min(wtimes[tries], left)
+                if fifo is None:
+                    time.sleep(wtime)
+                else:
+                    r, w, x = select.select([fifo[0]], [], [], wtime)
+                    if r:
+                        os.read(fifo[0], 4096)
+                if tries < len(wtimes) -1:
+                    tries+=1
+        finally:
+            self._closewaiter(fifo)
             
-            time.sleep(wtimes[tries])
-            waited+=wtimes[tries]
-            if tries < len(wtimes) -1:
-                tries+=1
+    def _openwaiter(self):
+        """ Create a named pipe _notify() will write to
+        
+        Returns (read_fd, write_fd, path), or None if that's not possible.
+        """
+        if not hasattr(os, 'mkfifo'):
+            return None
+        try:
+            if not os.path.isdir(self._waitdir):
+                os.makedirs(self._waitdir)
+            import tempfile
+            path = tempfile.mktemp(prefix = '%d-' % os.getpid(), 
+                                   dir = self._waitdir)
+            os.mkfifo(path, 0600)
+            rfd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+            # keep a writer open ourselves, otherwise select() reports EOF
+            wfd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            return None
+        return rfd, wfd, path
     
+    def _closewaiter(self, fifo):
+        if fifo is None:
+            return
+        rfd, wfd, path = fifo
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        os.close(wfd)
+        os.close(rfd)
+    
+    def cache_stats(self):
+        """ Return cache hit/miss/eviction counts and current cache size """
+        return self.cache.stats()
+
     def getlink(self,folder):
         """ Get a convenient link for accessing items  """
         return PickleShareLink(self, folder)
@@ -244,6 +761,205 @@ class PickleShareDB(UserDict.DictMixin):
         return "PickleShareDB('%s')" % self.root
         
         
+class SqliteShareDB(PickleShareDB):
+    """ PickleShareDB that keeps all keys in a single sqlite file
+    
+    The dict, hset/hget/hdict, keys(globpat) and waitget API is the same as
+    with PickleShareDB, but everything lives in one file instead of a file
+    per key. Reads don't need a stat() per key and writes don't create new
+    inodes, which helps a lot on network file systems. 
+
+    Every assignment is its own transaction, so other processes see the 
+    change as soon as the assignment returns. Each stored row gets a fresh,
+    never reused id, which is what the read cache is validated against.
+
+    The connection can be used from any thread (the threaded shells create
+    the db in the main thread and run the shell in another one); a lock
+    serializes the statements.
+    
+    """
+    def __init__(self,root, trust = 0, cacheitems = 1000,
+                 cachebytes = 64 * 1024 * 1024):
+        """ Return a db object that will manage the specified sqlite file """
+        if not have_sqlite3():
+            raise ImportError("SqliteShareDB requires the sqlite3 module")
+        self.root = Path(root).expanduser().abspath()
+        parent = self.root.parent
+        if parent and not parent.isdir():
+            parent.makedirs()
+        self._lock = threading.RLock()
+        self.con = sqlite3.connect(self.root, timeout = 60,
+                                   check_same_thread = False)
+        self.con.text_factory = str
+        # The directory based db doesn't fsync either; an application crash
+        # is still safe, only an OS crash can lose the last transactions.
+        self.con.execute('PRAGMA synchronous = OFF')
+        self.con.execute('CREATE TABLE IF NOT EXISTS pickleshare '
+                         '(id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'key TEXT UNIQUE NOT NULL, value BLOB)')
+        self.con.commit()
+        # cache has { 'key' : [obj, row_id, last_validated] }
+        self.cache = LRUCache(cacheitems, cachebytes)
+        self.trust = trust
+        self._initlocks(self.root + '.lock', self.root + '.waiters')
+        
+    def _key(self, key):
+        """ Normalize 'key' the way PickleShareDB.keys() would report it """
+        return str(key).replace('\\','/').strip('/')
+    
+    def __getitem__(self,key):
+        """ db['key'] reading """
+        key = self._key(key)
+        cache = self.cache
+        now = time.time()
+        ent = cache.get(key)
+        if ent is not None and now - ent[2] < self._trusted():
+            cache.hits += 1
+            return ent[0]
+        self._lock.acquire()
+        try:
+            row = self.con.execute('SELECT id FROM pickleshare WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                cache.pop(key)
+                raise KeyError(key)
+            rowid = row[0]
+            if ent is not None and rowid == ent[1]:
+                cache.hits += 1
+                ent[2] = now
+                return ent[0]
+            
+            cache.misses += 1
+            row = self.con.execute('SELECT value FROM pickleshare '
+                                   'WHERE id = ?', (rowid,)).fetchone()
+        finally:
+            self._lock.release()
+        try:
+            # The cached item has expired, need to read
+            data = str(row[0])
+            obj = pickle.loads(data)
+        except:
+            # also covers the row having been replaced in the meantime
+            raise KeyError(key)
+        
+        cache.put(key, [obj, rowid, now], len(data))
+        return obj
+    
+    def __setitem__(self,key,value):
+        """ db['key'] = 5 """
+        key = self._key(key)
+        rowid, size = self._putmany([(key,value)])
+        self.cache.put(key, [value, rowid, time.time()], size)
+        
+    def _putmany(self, items):
+        """ Store all (key, value) pairs of 'items' in one transaction 
+        
+        Returns the row id and pickle size of the last stored item.
+        """
+        rowid = size = None
+        self._lock.acquire()
+        try:
+            try:
+                for key,value in items:
+                    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                    cur = self.con.execute('INSERT OR REPLACE INTO '
+                                           'pickleshare (key, value) '
+                                           'VALUES (?, ?)', 
+                                           (self._key(key),
+                                            sqlite3.Binary(data)))
+                    rowid, size = cur.lastrowid, len(data)
+            except:
+                self.con.rollback()
+                raise
+            self.con.commit()
+        finally:
+            self._lock.release()
+        self._notify()
+        return rowid, size
+        
+    # rewriting a row is cheap enough, no need for append logs here
+    hlogdir = None
+    
+    def _hset(self, hashroot, key, value):
+        hfile = hashroot + '/' + gethashfile(key)
+        self._lock.acquire()
+        try:
+            d = self.get(hfile, {})
+            d.update( {key : value})
+            self[hfile] = d                
+        finally:
+            self._lock.release()
+        
+    def __delitem__(self,key):
+        """ del db["key"] """
+        key = self._key(key)
+        self.cache.pop(key)
+        self._lock.acquire()
+        try:
+            self.con.execute('DELETE FROM pickleshare WHERE key = ?', (key,))
+            self.con.commit()
+        finally:
+            self._lock.release()
+        
+    def keys(self, globpat = None):
+        """ All keys in DB, or all keys matching a glob"""
+        self._lock.acquire()
+        try:
+            if globpat is None:
+                rows = self.con.execute('SELECT key FROM pickleshare')
+                return [r[0] for r in rows]
+            
+            pat = self._key(globpat)
+            # sqlite GLOB lets '*' match '/' as well, so the segments are 
+            # checked again to get the same results as glob.glob() would
+            rows = self.con.execute('SELECT key FROM pickleshare '
+                                    'WHERE key GLOB ?', (pat,))
+            return [k for (k,) in rows if globmatch(k, pat)]
+        finally:
+            self._lock.release()
+    
+    def uncache(self,*items):
+        """ Removes all, or specified items from cache """
+        if not items:
+            self.cache.clear()
+        for it in items:
+            self.cache.pop(self._key(it))
+    
+    def flush(self):
+        """ No-op, every assignment is committed right away """
+        pass
+
+    sync = flush
+
+    def close(self):
+        """ Close the underlying sqlite connection """
+        self._lock.acquire()
+        try:
+            self.con.close()
+        finally:
+            self._lock.release()
+        
+    def __repr__(self):
+        return "SqliteShareDB('%s')" % self.root
+
+    
+def migrate(src, dest):
+    """ Copy directory based PickleShareDB 'src' to SqliteShareDB 'dest'
+    
+    The old directory is left alone. Returns the new db object.
+    """
+    old = PickleShareDB(src)
+    new = SqliteShareDB(dest)
+    items = []
+    for k in old.keys():
+        try:
+            items.append((k, old[k]))
+        except KeyError:
+            print "Skipping unreadable key",k
+        old.uncache()
+    new._putmany(items)
+    return new
+
                 
 class PickleShareLink:
     """ A shortdand for accessing nested PickleShare data conveniently.
@@ -293,10 +1009,11 @@ def test():
     lnk.bar = lnk.foo + 5
     print lnk.bar # 7
 
-def stress():
-    db = PickleShareDB('~/fsdbtest')
+def stress(db = None, rounds = 1000):
+    if db is None:
+        db = PickleShareDB('~/fsdbtest')
     import time,sys
-    for i in range(1000):
+    for i in range(rounds):
         for j in range(1000):
             if i % 15 == 0 and i < 200:
                 if str(j) in db:
@@ -314,6 +1031,22 @@ def stress():
         if i % 10 == 0:
             db.uncache()
     
+def bench(rounds = 20):
+    """ Time stress() with the directory and the sqlite backends """
+    import tempfile,shutil
+    tmp = tempfile.mkdtemp()
+    try:
+        backends = [('PickleShareDB', PickleShareDB(tmp + '/dir'))]
+        if have_sqlite3():
+            backends.append(('SqliteShareDB', SqliteShareDB(tmp + '/db.sqlite')))
+        for name, db in backends:
+            t = time.time()
+            stress(db, rounds)
+            print
+            print "%s: %d rounds in %.2f s" % (name, rounds, time.time() - t)
+    finally:
+        shutil.rmtree(tmp)
+    
 def main():
     import textwrap
     usage = textwrap.dedent("""\
@@ -324,6 +1057,8 @@ def main():
         pickleshare dump /path/to/db > dump.txt
         pickleshare load /path/to/db < dump.txt
         pickleshare test /path/to/db
+        pickleshare migrate /path/to/db /path/to/db.sqlite
+        pickleshare bench [rounds]
     """)
     DB = PickleShareDB
     import sys
@@ -352,6 +1087,11 @@ def main():
     elif cmd == 'test':
         test()
         stress()
+    elif cmd == 'migrate':
+        db = migrate(args[0], args[1])
+        print "Migrated %d keys to %s" % (len(db.keys()), db.root)
+    elif cmd == 'bench':
+        bench(*map(int,args))
     
 if __name__== "__main__":
     main()
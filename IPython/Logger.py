@@ -22,9 +22,116 @@ __author__  = '%s <%s>\n%s <%s>' % \
 __license__ = Release.license
 
 # Python standard modules
+import errno
 import glob
 import os
+import sys
+import threading
 import time
+from collections import deque
+
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+
+#****************************************************************************
+# Compressed and rotated log files
+
+# file name extension for each compressed log mode
+compress_exts = {'gzip' : '.gz', 'bz2' : '.bz2'}
+
+_size_units = {'' : 1, 'k' : 1024, 'm' : 1024**2, 'g' : 1024**3}
+_time_units = {'' : 1, 's' : 1, 'm' : 60, 'h' : 3600, 'd' : 86400}
+
+def _parse_amount(amount,units):
+    """Parse '10', '10k', '1.5h'... with the given unit suffixes."""
+    unit = amount[-1:].lower()
+    if unit in units and unit:
+        amount = amount[:-1]
+    else:
+        unit = ''
+    return int(float(amount) * units[unit])
+
+def log_open(fname,mode='r'):
+    """Open a log file, compressed or not according to its extension."""
+
+    if fname.endswith('.gz'):
+        import gzip
+        return gzip.open(fname,mode+'b')
+    elif fname.endswith('.bz2'):
+        if bz2 is None:
+            raise IOError('bz2 support not available to open %s' % fname)
+        return bz2.BZ2File(fname,mode)
+    else:
+        return open(fname,mode)
+
+def _segment_split(fname):
+    """Split a log name into the parts a segment number goes between."""
+    for ext in compress_exts.values():
+        if fname.endswith(ext):
+            return fname[:-len(ext)], ext
+    return fname, ''
+
+def log_segments(fname):
+    """Return the files making up a (possibly rotated) log, oldest first.
+
+    A log rotated by the 'size' or 'time' modes is kept as name.001,
+    name.002, ... with the live part under the log's own name (compressed
+    logs have the extension last, as in name.001.gz)."""
+
+    root, ext = _segment_split(fname)
+    segs = []
+    for f in glob.glob(root + '.*' + ext):
+        num = f[len(root)+1:len(f)-len(ext)]
+        if num.isdigit():
+            segs.append((int(num),f))
+    segs.sort()
+    segs = [f for n,f in segs]
+    if os.path.isfile(fname):
+        segs.append(fname)
+    return segs
+
+class LogReader(object):
+    """Stream the lines of a log, through all its rotated segments.
+
+    Compressed segments are decompressed on the fly, so even very large logs
+    are never loaded into memory as a whole."""
+
+    def __init__(self,fname):
+        self.fnames = log_segments(fname)
+        if not self.fnames:
+            raise IOError(errno.ENOENT,'No such file or directory',fname)
+        self.file = None
+
+    def readline(self):
+        while 1:
+            if self.file is None:
+                if not self.fnames:
+                    return ''
+                self.file = log_open(self.fnames.pop(0))
+            line = self.file.readline()
+            if line:
+                return line
+            self.file.close()
+            self.file = None
+
+    def __iter__(self):
+        while 1:
+            if self.file is None:
+                if not self.fnames:
+                    return
+                self.file = log_open(self.fnames.pop(0))
+            for line in self.file:
+                yield line
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.fnames = []
 
 #****************************************************************************
 # FIXME: This class isn't a mixin anymore, but it still needs attributes from
@@ -41,6 +148,13 @@ class Logger(object):
         # which won't exist until later. What a mess, clean up later...
         self.shell = shell
 
+        # 'size' and 'time' modes: start a new segment when the current one
+        # has this many (uncompressed) bytes, or is this many seconds old
+        self.rotate_size = 100*1024**2
+        self.rotate_interval = 86400
+        self._seg_bytes = 0
+        self._seg_started = 0
+
         self.logfname = logfname
         self.loghead = loghead
         self.logmode = logmode
@@ -58,11 +172,67 @@ class Logger(object):
         # activity control flags
         self.log_active = False
 
-    # logmode is a validated property
+        # buffered mode: a background thread writes the log out every
+        # flush_interval seconds, or as soon as flush_size bytes are waiting
+        self.buffered = False
+        self.flush_interval = 1.0
+        self.flush_size = 65536
+        # durability: write out what is buffered when a traceback is shown
+        # and when IPython exits
+        self.flush_on_error = True
+        self.flush_on_exit = True
+        self._writer = None
+        # appended to by log_write() and consumed by the writer, both
+        # without locking; the condition is only used to wake the writer up
+        self._buf = deque()
+        self._buf_since = 0
+        self._full = False
+        self._cond = threading.Condition()
+        self._wlock = threading.Lock()
+        self._stopping = False
+        # what made the writer thread give up, until it's been reported
+        self._error = None
+        self._lost = 0
+
+        # statistics for logstate()
+        self._reset_stats()
+
+        # timestamps only change once a second, cache the formatted one
+        self._stamp_time = None
+        self._stamp = ''
+
+    # logmode is a validated property.  It is one of the basic modes,
+    # optionally followed by '+gzip' or '+bz2' for a compressed log, or just
+    # 'gzip'/'bz2' (meaning 'backup+gzip', 'backup+bz2').  The rotating modes
+    # can be given a limit: 'size:50M', 'time:1h'.
     def _set_mode(self,mode):
-        if mode not in ['append','backup','global','over','rotate']:
+        parts = mode.split('+')
+        base = parts[0]
+        compress = None
+        if len(parts) == 1 and base in compress_exts:
+            base,compress = 'backup',base
+        elif len(parts) == 2:
+            compress = parts[1]
+        if len(parts) > 2 or (compress and compress not in compress_exts):
+            raise ValueError,'invalid log mode %s given' % mode
+        if compress == 'bz2' and bz2 is None:
+            raise ValueError,'bz2 compressed logs are not available'
+        base,limit = (base.split(':',1) + [None])[:2]
+        try:
+            if base == 'size' and limit:
+                self.rotate_size = _parse_amount(limit,_size_units)
+            elif base == 'time' and limit:
+                self.rotate_interval = _parse_amount(limit,_time_units)
+            elif limit:
+                raise ValueError
+        except ValueError:
+            raise ValueError,'invalid log mode %s given' % mode
+        if base not in ['append','backup','global','over','rotate',
+                        'size','time']:
             raise ValueError,'invalid log mode %s given' % mode
         self._logmode = mode
+        self._basemode = base
+        self.compress = compress
 
     def _get_mode(self):
         return self._logmode
@@ -70,9 +240,13 @@ class Logger(object):
     logmode = property(_get_mode,_set_mode)
     
     def logstart(self,logfname=None,loghead=None,logmode=None,
-                 log_output=False,timestamp=False,log_raw_input=False):
+                 log_output=False,timestamp=False,log_raw_input=False,
+                 buffered=False):
         """Generate a new log-file with a default header.
 
+        With buffered=True, writes are queued and done by a background
+        thread, see flush_interval and flush_size.
+
         Raises RuntimeError if the log has already been started"""
 
         if self.logfile is not None:
@@ -90,10 +264,21 @@ class Logger(object):
         self.timestamp = timestamp
         self.log_output = log_output
         self.log_raw_input = log_raw_input
+        self.buffered = buffered
         
         # init depending on the log mode requested
         isfile = os.path.isfile
-        logmode = self.logmode
+        logmode = self._basemode
+        if self.compress is None:
+            # keep writing a compressed log compressed, e.g. with -logplay
+            for compress,ext in compress_exts.items():
+                if self.logfname.endswith(ext):
+                    self.compress = compress
+        if self.compress:
+            ext = compress_exts[self.compress]
+            if not self.logfname.endswith(ext):
+                self.logfname += ext
+        open = self._open
 
         if logmode == 'append':
             self.logfile = open(self.logfname,'a')
@@ -129,11 +314,194 @@ class Logger(object):
                         os.rename(f, root+'.'+`num`.zfill(3)+'~')
                 os.rename(self.logfname, self.logfname+'.001~')
             self.logfile = open(self.logfname,'w')
+
+        elif logmode in ('size','time'):
+            # carry on the same series of segments
+            self._new_segment()
+            self.logfile = open(self.logfname,'w')
             
         if logmode != 'append':
             self.logfile.write(self.loghead)
+            self._seg_bytes = len(self.loghead)
+
+        self._flush_file()
+        self._reset_stats()
+
+        if buffered:
+            self._stopping = False
+            self._writer = threading.Thread(target=self._write_loop,
+                                            name='IPython log writer')
+            self._writer.setDaemon(True)
+            self._writer.start()
+
+    def _open(self,fname,mode):
+        """Open the log file for writing, with compression if requested."""
+
+        if mode == 'a' and self.compress == 'bz2':
+            # bz2 files can't be appended to, continue in a new segment
+            # (log readers treat the segments as one file)
+            if os.path.isfile(fname):
+                self._new_segment()
+            mode = 'w'
+        self._seg_bytes = 0
+        self._seg_started = time.time()
+        return log_open(fname,mode)
+
+    def _new_segment(self):
+        """Move the current log file out of the way as its last segment."""
+
+        if self.logfile is not None:
+            self.logfile.close()
+            self.logfile = None
+        if os.path.isfile(self.logfname):
+            segs = log_segments(self.logfname)
+            root, ext = _segment_split(self.logfname)
+            num = 1
+            if len(segs) > 1:
+                num = int(segs[-2][len(root)+1:len(segs[-2])-len(ext)]) + 1
+            os.rename(self.logfname,'%s.%03d%s' % (root,num,ext))
+
+    def _rotate(self):
+        """Start a new segment of a 'size' or 'time' mode log."""
+
+        self._new_segment()
+        self.logfile = self._open(self.logfname,'w')
+        self.logfile.write(self.loghead)
+        self._seg_bytes = len(self.loghead)
+
+    def _flush_file(self):
+        # bz2 files can't be flushed: they are written out a block at a time
+        flush = getattr(self.logfile,'flush',None)
+        if flush is not None:
+            flush()
+
+    def _emit(self,data):
+        """Really write data out, rotating the log when it's time."""
+
+        self.logfile.write(data)
+        self._flush_file()
+        self.nwritten += len(data)
+        self.nflushes += 1
+        self._seg_bytes += len(data)
+        mode = self._basemode
+        if (mode == 'size' and self._seg_bytes >= self.rotate_size) or \
+           (mode == 'time' and
+            time.time() - self._seg_started >= self.rotate_interval):
+            self._rotate()
+
+    def _reset_stats(self):
+        self.log_started = time.time()
+        self.nbytes = 0
+        self.nentries = 0
+        self.nflushes = 0
+        self.nwritten = 0
+        self.max_lag = 0.0
+
+    def _write(self,data):
+        """Write data now, or queue it for the writer thread."""
+
+        self.nbytes += len(data)
+        self.nentries += 1
+        if self._writer is not None and not self._writer.isAlive():
+            # it gave up after an error (see _write_loop), which turned the
+            # log off; when it's turned on again, write directly
+            self._writer = None
+        if self._writer is None:
+            self._emit(data)
+            return
+        buf = self._buf
+        buf.append(data)
+        if len(buf) == 1:
+            # the writer may be asleep waiting for data
+            self._buf_since = time.time()
+            self._wake()
+        elif not self._full and \
+                 self.nbytes - self.nwritten >= self.flush_size:
+            self._full = True
+            self._wake()
+
+    def _wake(self):
+        self._cond.acquire()
+        try:
+            self._cond.notify()
+        finally:
+            self._cond.release()
 
-        self.logfile.flush()
+    def _drain(self):
+        """Write out and flush everything queued so far."""
+
+        # only one drain at a time, so chunks can't be written out of order
+        self._wlock.acquire()
+        try:
+            since = self._buf_since
+            popleft = self._buf.popleft
+            chunks = []
+            try:
+                while 1:
+                    chunks.append(popleft())
+            except IndexError:
+                pass
+            self._full = False
+            if chunks:
+                self._emit(''.join(chunks))
+                self.max_lag = max(self.max_lag, time.time() - since)
+        finally:
+            self._wlock.release()
+
+    def _write_loop(self):
+        """Main loop of the buffered mode writer thread."""
+
+        cond = self._cond
+        while 1:
+            cond.acquire()
+            try:
+                while not self._buf and not self._stopping:
+                    cond.wait()
+                # give the buffer time to fill up, unless it already has
+                while not self._stopping and not self._full:
+                    left = self._buf_since + self.flush_interval - time.time()
+                    if left <= 0:
+                        break
+                    cond.wait(left)
+                stopping = self._stopping
+            finally:
+                cond.release()
+            try:
+                self._drain()
+            except:
+                # nothing would write the queue out anymore (disk full,
+                # failed rotation...): stop logging and drop it, the error
+                # is reported by the next log_write() or logstate()
+                self.log_active = False
+                self._error = sys.exc_info()[1]
+                self._lost = self.nbytes - self.nwritten
+                self.nbytes = self.nwritten
+                self._buf.clear()
+                return
+            if stopping:
+                return
+
+    def _report_error(self):
+        """Tell the user the writer thread failed, once."""
+
+        if self._error is not None:
+            print 'Logging to %s stopped after a write error: %s' % \
+                  (self.logfname,self._error)
+            if self.logfile is None:
+                # a failed rotation leaves no file to go on with
+                how = '%logstart to start a new log'
+            else:
+                how = '%logon to carry on'
+            print '%d bytes of log were lost.  Use %s.' % (self._lost,how)
+            self._error = None
+
+    def flush(self):
+        """Write out whatever the buffered mode is holding back.
+
+        Does nothing if the log isn't buffered."""
+
+        if self._writer is not None:
+            self._drain()
 
     def switch_log(self,val):
         """Switch logging on/off. val should be ONLY a boolean."""
@@ -162,6 +530,7 @@ which already exists. But you must first start the logging process with
 
     def logstate(self):
         """Print a status message about the logger."""
+        self._report_error()
         if self.logfile is None:
             print 'Logging has not been activated.'
         else:
@@ -172,6 +541,18 @@ which already exists. But you must first start the logging process with
             print 'Raw input log  :',self.log_raw_input
             print 'Timestamping   :',self.timestamp
             print 'State          :',state
+            elapsed = max(time.time() - self.log_started, 1e-6)
+            print 'Throughput     : %d entries, %d bytes (%.1f KB/s), %d writes' % \
+                  (self.nentries, self.nbytes, self.nbytes / elapsed / 1024,
+                   self.nflushes)
+            if self._writer is not None:
+                lag = 0.0
+                if self._buf:
+                    lag = time.time() - self._buf_since
+                print 'Buffering      : every %gs or %d bytes' % \
+                      (self.flush_interval, self.flush_size)
+                print 'Lag            : %.2fs now, %.2fs max, %d bytes queued' % \
+                      (lag, self.max_lag, self.nbytes - self.nwritten)
 
     def log(self,line_ori,line_mod,continuation=None):
         """Write the line to a log and create input cache variables _i*.
@@ -242,18 +623,23 @@ which already exists. But you must first start the logging process with
         """Write data to the log file, if active"""
 
         #print 'data: %r' % data # dbg
+        if self._error is not None:
+            self._report_error()
         if self.log_active and data:
-            write = self.logfile.write
             if kind=='input':
                 if self.timestamp:
-                    write(time.strftime('# %a, %d %b %Y %H:%M:%S\n',
-                                        time.localtime()))
-                write('%s\n' % data)
+                    now = int(time.time())
+                    if now != self._stamp_time:
+                        self._stamp_time = now
+                        self._stamp = time.strftime(
+                            '# %a, %d %b %Y %H:%M:%S\n', time.localtime(now))
+                    self._write('%s%s\n' % (self._stamp,data))
+                else:
+                    self._write('%s\n' % data)
             elif kind=='output' and self.log_output:
                 odata = '\n'.join(['#[Out]# %s' % s
                                    for s in data.split('\n')])
-                write('%s\n' % odata)
-            self.logfile.flush()
+                self._write('%s\n' % odata)
 
     def logstop(self):
         """Fully stop logging and close log file.
@@ -262,8 +648,16 @@ which already exists. But you must first start the logging process with
         made, possibly (though not necessarily) with a new filename, mode and
         other options."""
         
-        self.logfile.close()
-        self.logfile = None
+        if self._writer is not None:
+            self._cond.acquire()
+            self._stopping = True
+            self._cond.notify()
+            self._cond.release()
+            self._writer.join()
+            self._writer = None
+        if self.logfile is not None:
+            self.logfile.close()
+            self.logfile = None
         self.log_active = False
 
     # For backwards compatibility, in case anyone was using this.
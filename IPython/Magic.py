@@ -21,14 +21,11 @@ __license__ = Release.license
 
 # Python standard modules
 import __builtin__
-import bdb
 import inspect
 import os
-import pdb
 import pydoc
 import sys
 import re
-import tempfile
 import time
 import cPickle as pickle
 import textwrap
@@ -50,7 +47,7 @@ except ImportError:
 
 # Homebrewed
 import IPython
-from IPython import Debugger, OInspect, wildcard
+from IPython import OInspect, wildcard
 from IPython.FakeModule import FakeModule
 from IPython.Itpl import Itpl, itpl, printpl,itplns
 from IPython.PyColorize import Parser
@@ -60,6 +57,7 @@ from IPython.genutils import *
 from IPython import platutils
 import IPython.generics
 import IPython.ipapi
+from IPython import profiling
 from IPython.ipapi import UsageError
 #***************************************************************************
 # Utility functions
@@ -108,6 +106,7 @@ class Magic:
         self.options_table = {}
         if profile is None:
             self.magic_prun = self.profile_missing_notice
+            self.magic_prundiff = self.profile_missing_notice
         self.shell = shell
 
         # namespace for holding state we may need
@@ -1042,10 +1041,46 @@ Currently the magic system has the following functions:\n"""
         # execution protection
         self.shell._user_main_modules[:] = []
 
+    def magic_codecache(self, parameter_s=''):
+        """Show or reset the cache of compiled input.
+
+        %codecache [-c] [-n items] [-b bytes]
+
+        IPython keeps the code objects of recently compiled input, so that
+        running the same source again (macros, %rep, _ip.ex() in a loop...)
+        skips the compiler.  Without options, print how well it works.
+
+        Options:
+
+          -c: empty the cache.
+
+          -n items: keep at most this many code objects (default 500).
+
+          -b bytes: keep code for at most this much source (default 4 MB)."""
+
+        opts,args = self.parse_options(parameter_s,'cn:b:')
+        cache = self.shell.code_cache
+        if opts.has_key('c'):
+            cache.clear()
+        if opts.has_key('n'):
+            cache.maxitems = int(opts['n'])
+        if opts.has_key('b'):
+            cache.maxbytes = int(opts['b'])
+        if parameter_s.strip():
+            return
+        st = cache.stats()
+        lookups = st['hits'] + st['misses']
+        print 'Hits      : %d (%.0f%%)' % (st['hits'],
+                                         100.0*st['hits']/max(lookups,1))
+        print 'Misses    : %d' % st['misses']
+        print 'Evictions : %d' % st['evictions']
+        print 'Entries   : %d of %s' % (st['items'],cache.maxitems)
+        print 'Source    : %d of %s bytes' % (st['bytes'],cache.maxbytes)
+
     def magic_logstart(self,parameter_s=''):
         """Start logging anywhere in a session.
 
-        %logstart [-o|-r|-t] [log_name [log_mode]]
+        %logstart [-o|-r|-t|-b] [-i interval] [-s size] [log_name [log_mode]]
 
         If no name is given, it defaults to a file named 'ipython_log.py' in your
         current directory, in 'rotate' mode (see below).
@@ -1059,7 +1094,18 @@ Currently the magic system has the following functions:\n"""
           backup: rename (if exists) to name~ and start name.\\
           global: single logfile in your home dir, appended to.\\
           over  : overwrite existing log.\\
-          rotate: create rotating logs name.1~, name.2~, etc.
+          rotate: create rotating logs name.1~, name.2~, etc.\\
+          size  : continue the log in name.001, name.002, etc. every 100 MB,
+          or at the size given as in size:10M.\\
+          time  : continue the log in name.001, name.002, etc. every day, or
+          after the time given as in time:2h.\\
+          gzip, bz2: like backup, but the log is compressed on the fly.
+
+        Any mode can be combined with compression as in 'size:1G+gzip'; the
+        matching extension is added to the log name.  Compressed logs and the
+        numbered parts of 'size' and 'time' logs are read back as one file by
+        %runlog and -logplay.  Note that bz2 logs are only written out a block
+        (900 KB) at a time.
 
         Options:
 
@@ -1081,12 +1127,26 @@ Currently the magic system has the following functions:\n"""
           exactly as typed, with no transformations applied.
 
           -t: put timestamps before each input line logged (these are put in
-          comments)."""
+          comments).
+
+          -b: buffered logging.  Instead of flushing the log after every
+          line, a background thread writes it out every second or once 64 KB
+          are waiting.  Whatever is buffered is still written out when a
+          traceback is shown and when IPython exits (see the flush_on_error
+          and flush_on_exit attributes of the logger).  %logstate reports
+          the throughput and how far the file lags behind.
+
+          -i interval: with -b, write out at least every 'interval' seconds
+          (implies -b).
+
+          -s size: with -b, write out as soon as 'size' bytes are waiting
+          (implies -b)."""
         
-        opts,par = self.parse_options(parameter_s,'ort')
+        opts,par = self.parse_options(parameter_s,'ortbi:s:')
         log_output = 'o' in opts
         log_raw_input = 'r' in opts
         timestamp = 't' in opts
+        buffered = 'b' in opts or 'i' in opts or 's' in opts
 
         rc = self.shell.rc
         logger = self.shell.logger
@@ -1111,8 +1171,13 @@ Currently the magic system has the following functions:\n"""
         rc.opts.logfile = logfname
         loghead = self.shell.loghead_tpl % (rc.opts,rc.args)
         try:
+            if 'i' in opts:
+                logger.flush_interval = float(opts.i)
+            if 's' in opts:
+                logger.flush_size = int(opts.s)
             started  = logger.logstart(logfname,loghead,logmode,
-                                       log_output,timestamp,log_raw_input)
+                                       log_output,timestamp,log_raw_input,
+                                       buffered)
         except:
             rc.opts.logfile = old_logfile
             warn("Couldn't start log: %s" % sys.exc_info()[1])
@@ -1235,6 +1300,8 @@ Currently the magic system has the following functions:\n"""
 
         The given statement (which doesn't require quote marks) is run via the
         python profiler in a manner similar to the profile.run() function.
+        The profiler is cProfile, or the (much slower) pure python profile
+        module if cProfile isn't available.
         Namespaces are internally managed to work correctly; profile.run
         cannot be used in IPython because it makes certain assumptions about
         namespaces which do not hold under IPython.
@@ -1306,6 +1373,14 @@ Currently the magic system has the following functions:\n"""
         is generated by a call to the dump_stats() method of profile
         objects. The profile is still shown on screen.
 
+        -C <filename>: save the profile in callgrind format, for KCachegrind
+        and the other tools that read callgrind files.
+
+        -A <filename>: accumulate several runs.  The new profile is added to
+        the one saved in the given file (if it exists), the total is saved
+        back and it is the total that gets printed (and returned by -r,
+        saved by -C...).  Use %prundiff to compare saved profiles.
+
         If you want to run complete programs under the profiler's control, use
         '%run -p [prof_opts] filename.py [args to program]' where prof_opts
         contains profiler specific options as described here.
@@ -1313,12 +1388,12 @@ Currently the magic system has the following functions:\n"""
         You can read the complete documentation for the profile module with:\\
           In [1]: import profile; profile.help() """
 
-        opts_def = Struct(D=[''],l=[],s=['time'],T=[''])
+        opts_def = Struct(D=[''],l=[],s=['time'],T=[''],C=[''],A=[''])
         # protect user quote marks
         parameter_s = parameter_s.replace('"',r'\"').replace("'",r"\'")
         
         if user_mode:  # regular user call
-            opts,arg_str = self.parse_options(parameter_s,'D:l:rs:T:',
+            opts,arg_str = self.parse_options(parameter_s,'D:l:rs:T:C:A:',
                                               list_all=1)
             namespace = self.shell.user_ns
         else:  # called to run a program by %run -p
@@ -1340,7 +1415,15 @@ Currently the magic system has the following functions:\n"""
         except SystemExit:
             sys_exit = """*** SystemExit exception caught in code being profiled."""
 
-        stats = pstats.Stats(prof).strip_dirs().sort_stats(*opts.s)
+        stats = pstats.Stats(prof)
+        accum_file = opts.A[0]
+        if accum_file:
+            stats = profiling.accumulate(stats,accum_file)
+        callgrind_file = opts.C[0]
+        if callgrind_file:
+            # before strip_dirs, the tools want the full file names
+            profiling.write_callgrind(stats,callgrind_file)
+        stats.strip_dirs().sort_stats(*opts.s)
 
         lims = opts.l
         if lims:
@@ -1389,17 +1472,267 @@ Currently the magic system has the following functions:\n"""
             pfile.close()
             print '\n*** Profile printout saved to text file',\
                   `text_file`+'.',sys_exit
+        if callgrind_file:
+            print '\n*** Profile saved in callgrind format to file',\
+                  `callgrind_file`+'.',sys_exit
+        if accum_file:
+            print '\n*** Accumulated profile saved to file',\
+                  `accum_file`+'.',sys_exit
 
         if opts.has_key('r'):
             return stats
         else:
             return None
 
+    def magic_prundiff(self, parameter_s=''):
+        """Compare two profiles, function by function.
+
+        Usage:\\
+          %prundiff [-s key] [-l limit] old new
+
+        old and new are files saved with %prun -D or -A (or %run -p), or
+        variables holding pstats.Stats objects such as those returned by
+        %prun -r.  For every function, the number of calls, the internal time
+        and the cumulative time are printed for both profiles, the functions
+        that changed the most coming first.
+
+        Options:
+
+        -s <key>: what 'changed the most' means: 'time' (internal time, the
+        default), 'cumulative' or 'calls'.
+
+        -l <limit>: like the %prun option, an integer number of lines, a
+        fraction of the report or a string to look for in the function
+        names."""
+
+        opts,args = self.parse_options(parameter_s,'s:l:',mode='list')
+        if len(args) != 2:
+            raise UsageError('%prundiff needs two profiles to compare.')
+        profs = []
+        for arg in args:
+            prof = self.shell.user_ns.get(arg)
+            if not isinstance(prof,pstats.Stats):
+                prof = os.path.expanduser(arg)
+                if not os.path.isfile(prof):
+                    error('No saved profile or pstats.Stats variable %r.' % arg)
+                    return
+            profs.append(prof)
+        limit = opts.get('l')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                try:
+                    limit = float(limit)
+                except ValueError:
+                    pass
+        try:
+            lines = profiling.diff_stats(profs[0],profs[1],
+                                         opts.get('s','time'),limit)
+        except ValueError,msg:
+            error(msg)
+            return
+        page('\n'.join(lines),screen_lines=self.shell.rc.screen_length)
+
+    def magic_sprun(self, parameter_s=''):
+        """Run a statement through the sampling profiler.
+
+        Usage:\\
+          %sprun [options] statement\\
+          %sprun [options] -j <job number>
+
+        Unlike %prun, which records every single call and can slow the code
+        down many times, %sprun just looks at the stack of the running code
+        at regular intervals (100 times per second by default) and counts
+        which functions are on it.  The overhead is well under 1%, so it can
+        be used on jobs that run for hours; the price is that the numbers are
+        statistical, functions that run for less than a few intervals may not
+        show up.  Interrupting the statement with Ctrl-C still prints the
+        profile gathered so far.
+
+        The statement can also be a magic, so '%sprun %run script.py' samples
+        a whole script.  With -j, the given background job (see %bg) is
+        sampled instead, from the prompt, until it ends (or Ctrl-C).
+
+        In the main thread of Unix systems, samples are taken on SIGPROF, so
+        they count CPU time (the code must not use SIGPROF itself).
+        Otherwise (background jobs, Windows...) a helper thread takes them
+        at regular intervals of wall clock time.
+
+        Options:
+
+        -i <interval>: time between samples, in seconds (default 0.01).
+
+        -s <key>: sort by 'self' (samples in the function itself, the
+        default) or 'cumulative' (samples with the function anywhere on the
+        stack).
+
+        -l <limit>: like the %prun option, an integer number of lines, a
+        fraction of the report or a string to look for in the function
+        names.
+
+        -c: print the call tree instead of the table of functions.
+
+        -F <filename>: save the samples as collapsed stacks, one 'f1;f2;f3
+        count' line per distinct stack, for flamegraph.pl and other flame
+        graph tools.
+
+        -d <seconds>: with -j, stop sampling after this long.
+
+        -r: return the profiling.Sampler object with all the samples."""
+
+        # protect user quote marks
+        parameter_s = parameter_s.replace('"',r'\"').replace("'",r"\'")
+        opts,arg_str = self.parse_options(parameter_s,'i:s:l:cF:j:d:r')
+        try:
+            sampler = profiling.Sampler(float(opts.get('i',0.01)))
+        except ValueError:
+            raise UsageError('%sprun: invalid interval %r' % opts['i'])
+
+        sys_exit = ''
+        if opts.has_key('j'):
+            try:
+                job = self.shell.jobs[int(opts['j'])]
+            except (KeyError,ValueError):
+                error('No background job %r.' % opts['j'])
+                return
+            if job.thread_id is None or job.finished is not False:
+                error('Job #%s is not running.' % job.num)
+                return
+            duration = opts.get('d')
+            if duration is not None:
+                duration = float(duration)
+            print 'Sampling job #%s, Ctrl-C to stop...' % job.num
+            sampler.sample_thread(job.thread_id,duration)
+        else:
+            if not arg_str.strip():
+                raise UsageError('%sprun needs a statement or a job to '
+                                 'profile.')
+            try:
+                stmt = arg_str.lstrip()
+                if stmt.startswith(self.shell.ESC_MAGIC):
+                    sampler.runcall(self.shell.ipmagic,stmt[1:])
+                else:
+                    sampler.runctx(stmt,self.shell.user_ns,self.shell.user_ns)
+            except SystemExit:
+                sys_exit = """*** SystemExit exception caught in code being profiled."""
+            except KeyboardInterrupt:
+                sys_exit = """*** Interrupted, profile of the run so far."""
+
+        if opts.has_key('c'):
+            lines = sampler.tree()
+        else:
+            limit = opts.get('l')
+            if limit is not None:
+                try:
+                    limit = int(limit)
+                except ValueError:
+                    try:
+                        limit = float(limit)
+                    except ValueError:
+                        pass
+            lines = sampler.report(opts.get('s','self'),limit)
+        page('\n'.join(lines),screen_lines=self.shell.rc.screen_length)
+        print sys_exit,
+
+        collapsed_file = opts.get('F')
+        if collapsed_file:
+            sampler.write_collapsed(collapsed_file)
+            print '\n*** Collapsed stacks saved to file',\
+                  `collapsed_file`+'.',sys_exit
+        if opts.has_key('r'):
+            return sampler
+
+    def magic_lprun(self, parameter_s=''):
+        """Run a statement through the line by line profiler.
+
+        Usage:\\
+          %lprun -f func1 [-f func2 ...] [options] statement
+
+        The statement is run like with %prun, but only the functions given
+        with -f are profiled, line by line: the listing of each function is
+        printed with the number of times every line ran and the time spent on
+        it (including the time of the calls it made).  Other code runs at
+        nearly full speed.  As with %sprun, the statement can be a magic,
+        such as '%run script.py' (the functions to trace must exist before
+        it runs, though).
+
+        Options:
+
+        -f <function>: trace this function (any expression giving a
+        function or method in your namespace).  Can be given several times.
+
+        -D <filename>: save the results to this file, to compare later runs
+        with them (see -B).
+
+        -B <filename>: show the times saved with -D in an earlier run next to
+        the new ones, and the change of each line.
+
+        -T <filename>: save the listing (without colors) to a text file.  It
+        is still shown on screen.
+
+        -r: return the profiling.LineProfiler object."""
+
+        # protect user quote marks
+        parameter_s = parameter_s.replace('"',r'\"').replace("'",r"\'")
+        opts,arg_str = self.parse_options(parameter_s,'f:D:B:T:r',list_all=1)
+        if not opts.has_key('f'):
+            raise UsageError('%lprun needs at least one function to trace '
+                             '(-f).')
+        if not arg_str.strip():
+            raise UsageError('%lprun needs a statement to profile.')
+
+        prof = profiling.LineProfiler()
+        for name in opts.f:
+            try:
+                prof.add_function(eval(name,self.shell.user_ns))
+            except Exception,msg:
+                error('Could not trace %r: %s' % (name,msg))
+                return
+        baseline = None
+        if opts.has_key('B'):
+            try:
+                baseline = profiling.load_line_results(opts.B[0])
+            except Exception,msg:
+                error('Could not load the results in %r: %s' % (opts.B[0],msg))
+                return
+
+        sys_exit = ''
+        try:
+            stmt = arg_str.lstrip()
+            if stmt.startswith(self.shell.ESC_MAGIC):
+                prof.runcall(self.shell.ipmagic,stmt[1:])
+            else:
+                prof.runctx(stmt,self.shell.user_ns,self.shell.user_ns)
+        except SystemExit:
+            sys_exit = """*** SystemExit exception caught in code being profiled."""
+        except KeyboardInterrupt:
+            sys_exit = """*** Interrupted, profile of the run so far."""
+
+        output = '\n'.join(prof.listing(baseline,self.shell.inspector.format))
+        page(output.lstrip('\n'),screen_lines=self.shell.rc.screen_length)
+        print sys_exit,
+
+        if opts.has_key('D'):
+            dump_file = opts.D[0]
+            prof.save(dump_file)
+            print '\n*** Line profile saved to file',\
+                  `dump_file`+'.',sys_exit
+        if opts.has_key('T'):
+            text_file = opts.T[0]
+            pfile = file(text_file,'w')
+            pfile.write('\n'.join(prof.listing(baseline)).lstrip('\n'))
+            pfile.close()
+            print '\n*** Line profile printout saved to text file',\
+                  `text_file`+'.',sys_exit
+        if opts.has_key('r'):
+            return prof
+
     def magic_run(self, parameter_s ='',runner=None):
         """Run the named file inside IPython as a program.
 
         Usage:\\
-          %run [-n -i -t [-N<N>] -d [-b<N>] -p [profile options]] file [args]
+          %run [-n -i -t [-N<N>] -d [-b<N>] -p [profile options] -B] file [args]
         
         Parameters after the filename are passed as command-line arguments to
         the program (put in sys.argv). Then, control returns to IPython's
@@ -1500,13 +1833,21 @@ Currently the magic system has the following functions:\n"""
         Internally this triggers a call to %prun, see its documentation for
         details on the options available specifically for profiling.
 
+        -B: don't use the bytecode cache.  Normally the compiled code of the
+        script is kept under IPYTHONDIR/bytecode (keyed by the script's path,
+        mtime and size and by the Python version) and reused as long as the
+        script isn't modified, which saves compiling big scripts on every
+        run.  -B compiles the script from source and leaves the cache alone.
+        The cache can be turned off altogether with the run_bytecache option
+        in your ipythonrc.
+
         There is one special usage for which the text above doesn't apply:
         if the filename ends with .ipy, the file is run as ipython script,
         just as if the commands were written on IPython prompt.
         """
 
         # get arguments and set sys.argv for program to be run.
-        opts,arg_lst = self.parse_options(parameter_s,'nidtN:b:pD:l:rs:T:e',
+        opts,arg_lst = self.parse_options(parameter_s,'nidtN:b:pD:l:rs:T:C:A:eB',
                                           mode='list',list_all=1)
 
         try:
@@ -1525,6 +1866,8 @@ Currently the magic system has the following functions:\n"""
         
         # Control the response to exit() calls made by the script being run
         exit_ignore = opts.has_key('e')
+
+        bytecache = self.shell.rc.run_bytecache and not opts.has_key('B')
         
         # Make sure that the running script gets a proper sys.argv as if it
         # were run from a system shell.
@@ -1565,13 +1908,14 @@ Currently the magic system has the following functions:\n"""
         sys.modules[prog_ns['__name__']] = main_mod
         
         stats = None
+        histmark = self.shell.history_mark()
         try:
-            self.shell.savehist()
-
             if opts.has_key('p'):
                 stats = self.magic_prun('',0,opts,arg_lst,prog_ns)
             else:
                 if opts.has_key('d'):
+                    import bdb
+                    from IPython import Debugger
                     deb = Debugger.Pdb(self.shell.rc.colors)
                     # reset Breakpoint state, which is moronically kept
                     # in a class
@@ -1623,7 +1967,7 @@ Currently the magic system has the following functions:\n"""
                         if nruns == 1:
                             t0 = clock2()
                             runner(filename,prog_ns,prog_ns,
-                                   exit_ignore=exit_ignore)
+                                   exit_ignore=exit_ignore,bytecache=bytecache)
                             t1 = clock2()
                             t_usr = t1[0]-t0[0]
                             t_sys = t1[1]-t1[1]
@@ -1635,7 +1979,8 @@ Currently the magic system has the following functions:\n"""
                             t0 = clock2()
                             for nr in runs:
                                 runner(filename,prog_ns,prog_ns,
-                                       exit_ignore=exit_ignore)
+                                       exit_ignore=exit_ignore,
+                                       bytecache=bytecache)
                             t1 = clock2()
                             t_usr = t1[0]-t0[0]
                             t_sys = t1[1]-t1[1]
@@ -1647,7 +1992,8 @@ Currently the magic system has the following functions:\n"""
                             
                     else:
                         # regular execution
-                        runner(filename,prog_ns,prog_ns,exit_ignore=exit_ignore)
+                        runner(filename,prog_ns,prog_ns,exit_ignore=exit_ignore,
+                               bytecache=bytecache)
                 if opts.has_key('i'):
                     self.shell.user_ns['__name__'] = __name__save
                 else:
@@ -1658,7 +2004,7 @@ Currently the magic system has the following functions:\n"""
             sys.argv = save_argv
             if restore_main:
                 sys.modules['__main__'] = restore_main
-            self.shell.reloadhist()
+            self.shell.history_restore(histmark)
                 
         return stats
 
@@ -1666,33 +2012,45 @@ Currently the magic system has the following functions:\n"""
         """Run files as logs.
 
         Usage:\\
-          %runlog file1 file2 ...
+          %runlog [-v] file1 file2 ...
 
         Run the named files (treating them as log files) in sequence inside
-        the interpreter, and return to the prompt.  This is much slower than
-        %run because each line is executed in a try/except block, but it
-        allows running files with syntax errors in them.
+        the interpreter, and return to the prompt.  Unlike %run, this allows
+        running files with syntax errors in them: runs of plain Python lines
+        are compiled and run in chunks, and when a chunk fails the offending
+        line is skipped and the rest carries on.  Lines using IPython syntax
+        (magics, shell escapes...) are run one at a time.
+
+        Options:
+
+          -v: report how long each chunk took.
 
         Normally IPython will guess when a file is one of its own logfiles, so
         you can typically use %run even for logs. This shorthand allows you to
-        force any file to be treated as a log file."""
+        force any file to be treated as a log file.
+
+        Compressed logs and logs split by the 'size' and 'time' modes of
+        %logstart are decompressed and joined on the fly."""
 
-        for f in parameter_s.split():
+        opts,args = self.parse_options(parameter_s,'v',mode='list')
+        for f in args:
             self.shell.safe_execfile(f,self.shell.user_ns,
-                                     self.shell.user_ns,islog=1)
+                                     self.shell.user_ns,islog=1,
+                                     verbose='v' in opts)
 
     def magic_timeit(self, parameter_s =''):
         """Time execution of a Python statement or expression
 
         Usage:\\
-          %timeit [-n<N> -r<R> [-t|-c]] statement
+          %timeit [-n<N> -r<R> [-t|-c] -s<setup> -o -f] statement
 
         Time execution of a Python statement or expression using the timeit
         module.
 
         Options:
         -n<N>: execute the given statement <N> times in a loop. If this value
-        is not given, a fitting value is chosen. 
+        is not given, a fitting value is chosen, so that each loop takes about
+        0.2 s.
         
         -r<R>: repeat the loop iteration <R> times and take the best result.
         Default: 3
@@ -1707,23 +2065,44 @@ Currently the magic system has the following functions:\n"""
         -p<P>: use a precision of <P> digits to display the timing result.
         Default: 3
 
+        -s<setup>: statement run before each loop, not timed (quote it if it
+        has spaces).  As with the timeit module, the names it defines are
+        local to the timing function, the namespace isn't changed.
+
+        -o: return a TimeitResult object with all the timings, and their
+        mean, standard deviation, median and other percentiles.
+
+        -f: do the timing in a forked child process, so that whatever the
+        statement does to the namespace (or to memory) is thrown away with
+        it.  Not available on Windows.
+
         
         Examples:\\
           In [1]: %timeit pass
-          10000000 loops, best of 3: 53.3 ns per loop
+          37000000 loops, best of 3: 53.3 ns per loop
 
           In [2]: u = None
 
           In [3]: %timeit u is None
-          10000000 loops, best of 3: 184 ns per loop
+          11000000 loops, best of 3: 184 ns per loop
 
           In [4]: %timeit -r 4 u == None
-          1000000 loops, best of 4: 242 ns per loop
+          8200000 loops, best of 4: 242 ns per loop
 
           In [5]: import time
 
           In [6]: %timeit -n1 time.sleep(2)
           1 loops, best of 3: 2 s per loop
+
+          In [7]: %timeit -s "l = range(1000)" l.sort()
+          32000 loops, best of 3: 6.09 \xc2\xb5s per loop
+
+          In [8]: %timeit -o -r 10 sum(range(100))
+          150000 loops, best of 10: 1.31 \xc2\xb5s per loop
+          Out[8]: <TimeitResult: 150000 loops, best of 10: 1.31 \xc2\xb5s per loop (mean 1.35 \xc2\xb5s, stdev 32.1 ns)>
+
+          In [9]: _.percentile(90)
+          Out[9]: 1.3915386835734049e-06
           
 
         The times reported by %timeit will be slightly higher than those
@@ -1735,12 +2114,8 @@ Currently the magic system has the following functions:\n"""
         those from %timeit."""
 
         import timeit
-        import math
-
-        units = ["s", "ms", "\xc2\xb5s", "ns"]
-        scaling = [1, 1e3, 1e6, 1e9]
 
-        opts, stmt = self.parse_options(parameter_s,'n:r:tcp:',
+        opts, stmt = self.parse_options(parameter_s,'n:r:tcp:s:of',
                                         posix=False)
         if stmt == "":
             return
@@ -1752,18 +2127,47 @@ Currently the magic system has the following functions:\n"""
             timefunc = time.time
         if hasattr(opts, "c"):
             timefunc = clock
+        setup = getattr(opts, "s", "pass")
+        if len(setup) > 1 and setup[0] in '"\'' and setup[-1] == setup[0]:
+            setup = setup[1:-1]
+        fork = hasattr(opts, "f")
+        if fork and not hasattr(os, "fork"):
+            error('%timeit -f needs os.fork(), not available here.')
+            return
+
+        try:
+            result = self._timeit(stmt, setup, number, repeat, timefunc,
+                                  fork, precision)
+        except profiling.ChildError, msg:
+            print >> Term.cerr, msg
+            return
+        print result
+        # Minimum time above which compilation time will be reported
+        if result.compile_time > 0.1:
+            print "Compiler time: %.2f s" % result.compile_time
+        if hasattr(opts, "o"):
+            return result
+
+    def _timeit(self, stmt, setup='pass', number=0, repeat=3, timefunc=None,
+                fork=False, precision=3):
+        """Time stmt in the user namespace, return a TimeitResult.
 
-        timer = timeit.Timer(timer=timefunc)
+        The work horse of %timeit and %bench, see %timeit for the meaning of
+        the arguments.  A number of 0 means calibrating it.  With fork, the
+        exceptions of the child process are raised as ChildError."""
+
+        import timeit
+
+        timer = timeit.Timer(timer=timefunc or timeit.default_timer)
         # this code has tight coupling to the inner workings of timeit.Timer,
         # but is there a better way to achieve that the code stmt has access
         # to the shell namespace?
 
+        # (python 2.7's template also has an 'init' slot)
         src = timeit.template % {'stmt': timeit.reindent(stmt, 8),
-                                 'setup': "pass"}
+                                 'setup': timeit.reindent(setup, 4),
+                                 'init': ''}
         # Track compilation time so it can be reported if too long
-        # Minimum time above which compilation time will be reported
-        tc_min = 0.1
-        
         t0 = clock()
         code = compile(src, "<magic-timeit>", "exec")
         tc = clock()-t0
@@ -1771,28 +2175,414 @@ Currently the magic system has the following functions:\n"""
         ns = {}
         exec code in self.shell.user_ns, ns
         timer.inner = ns["inner"]
+
+        def run():
+            loops = number or profiling.calibrate(timer)
+            return loops, timer.repeat(repeat, loops)
         
-        if number == 0:
-            # determine number so that 0.2 <= total time < 2.0
-            number = 1
-            for i in range(1, 10):
-                number *= 10
-                if timer.timeit(number) >= 0.2:
-                    break
+        if fork:
+            loops, all_runs = profiling.run_in_child(run)
+        else:
+            loops, all_runs = run()
+        return profiling.TimeitResult(loops, all_runs, tc, precision)
+
+    def magic_memit(self, parameter_s =''):
+        """Measure the memory used by a Python statement or expression
+
+        Usage:\\
+          %memit [-r<R> -f -O] statement
+
+        Run the statement once and report the peak resident memory (RSS) of
+        the process while it ran, and how much above the memory in use before
+        it that peak was.  The numbers come from /proc/self/status on Linux
+        (where the peak can be reset before each run) and from
+        resource.getrusage() elsewhere (where the peak is the one of the
+        whole session, so small increments may not show: use -f).
+
+        Examples:
+
+          In [1]: memit range(10**6)
+          peak memory: 52.41 MiB, increment: 31.04 MiB
+
+          In [2]: memit -f x = [0]*10**7
+          peak memory: 97.77 MiB, increment: 76.30 MiB (in a child process)
+
+        Options:
+        -r<R>: run the statement <R> times (each one measured on its own) and
+        report the largest peak.  Default: 1
+
+        -f: run the statement in a forked child process, so that whatever it
+        leaves behind doesn't stay in IPython's memory.  Its effects on the
+        namespace are lost too.  Not available on Windows.
+
+        -O: also report the net change in the number and size of objects of
+        each type (after the first run, with -r).  Only objects tracked by the
+        garbage collector (instances, lists, dicts...) are counted, and
+        counting them all can take a while with many objects around.
+        """
+
+        opts, stmt = self.parse_options(parameter_s,'r:fO',posix=False)
+        if stmt == "":
+            return
+        repeat = int(getattr(opts, "r", 1))
+        census = hasattr(opts, "O")
+        fork = hasattr(opts, "f")
+        if fork and not hasattr(os, "fork"):
+            error('%memit -f needs os.fork(), not available here.')
+            return
+
+        code = compile(stmt, "<magic-memit>", "exec")
+        ns = self.shell.user_ns
+        def run():
+            exec code in ns
+
+        results = []
+        for i in range(repeat):
+            try:
+                if fork:
+                    res = profiling.run_in_child(profiling.measure_memory,
+                                                 run, census)
+                else:
+                    res = profiling.measure_memory(run, census)
+            except profiling.ChildError, msg:
+                print >> Term.cerr, msg
+                return
+            results.append(res)
+        res = max(results, key=lambda r: r['peak'])
+
+        MiB = 1024.0*1024
+        if res['peak'] is None:
+            error('The memory usage of the process is not available.')
+            return
+        msg = 'peak memory: %.2f MiB' % (res['peak']/MiB)
+        if res['before'] is not None:
+            increment = max(res['peak'] - res['before'], 0)
+            msg += ', increment: %.2f MiB' % (increment/MiB)
+        if repeat > 1:
+            msg = 'maximum of %d: %s' % (repeat, msg)
+        if fork:
+            msg += ' (in a child process)'
+        print msg
+        if not res['exact_peak']:
+            print ('(the peak of the session so far, the one of the '
+                   'statement may be lower; try -f)')
+
+        if census:
+            # later runs mostly replace what the first one left behind
+            types = results[0]['types'].items()
+            types.sort(key=lambda t: (-abs(t[1][1]), t[0]))
+            if not types:
+                print 'No change in the objects tracked by the gc.'
+                return
+            print '\n%10s %12s  %s' % ('objects', 'bytes', 'type')
+            for name, (count, size) in types[:20]:
+                print '%+10d %+12d  %s' % (count, size, name)
+            if len(types) > 20:
+                print '... %d more types' % (len(types)-20)
+        
+    def magic_bench(self, parameter_s =''):
+        """Define, run and track named benchmarks.
+
+        %bench -a <name> [-s<S>] <statement>  - define benchmark <name>
+        %bench -d <name>                      - remove benchmark <name>
+        %bench -l <name>                      - show the results of <name>
+        %bench                                - list all benchmarks
+        %bench [-n<N> -r<R> -p<P> -f -b -t<T>] <name> [<name> ...]
+
+        The last form times the given benchmarks, side by side, as %timeit
+        would (names may be glob patterns, like 'sort_*').  The statements run
+        in the namespace of the shell, their setup code (-s) should import or
+        build whatever they need.
+
+        Options:
+        -n<N>: execute each statement <N> times in a loop (calibrated if not
+        given).
         
-        best = min(timer.repeat(repeat, number)) / number
+        -r<R>: repeat the loop iteration <R> times and take the best result.
+        Default: 3
+
+        -p<P>: use a precision of <P> digits to display the timing results.
+        Default: 3
 
-        if best > 0.0:
-            order = min(-int(math.floor(math.log10(best)) // 3), 3)
+        -f: time each benchmark in a forked child process, see %timeit.
+
+        -b: make these results the baseline of the benchmarks.
+
+        -t<T>: regression threshold, in percent.  Default: 10
+
+        Every result is kept in the IPython database (the last 100 per
+        benchmark), with the host and Python version it was measured on.  The
+        first run on a host/Python pair becomes the baseline for that pair:
+        later runs are compared to it, and those slower by more than the
+        threshold are flagged as regressions.  Use -b to take a new baseline
+        after a deliberate change.
+
+        Examples:
+
+          In [1]: %bench -a sort_list -s "l = range(1000)" sorted(l)
+
+          In [2]: %bench -a sort_heap -s "import heapq; l = range(1000)" heapq.nsmallest(1000, l)
+
+          In [3]: %bench sort_*
+          Benchmarks on myhost, python 2.5.1
+          Benchmark       Best          Mean +- stdev      Loops   Ratio  vs baseline
+          sort_heap    22.7 \xc2\xb5s       25 \xc2\xb5s +- 2.33 \xc2\xb5s       7600   1.00x  new baseline
+          sort_list    23.1 \xc2\xb5s      23.2 \xc2\xb5s +- 106 ns       8400   1.02x  new baseline
+
+          In [4]: %bench -t 5 sort_list
+          Benchmarks on myhost, python 2.5.1
+          Benchmark       Best          Mean +- stdev      Loops   Ratio  vs baseline
+          sort_list    25.5 \xc2\xb5s     27.8 \xc2\xb5s +- 2.13 \xc2\xb5s       6600   1.00x  +10.4%  REGRESSION
+          WARNING: 1 benchmark(s) slower than the baseline by more than 5%: sort_list
+        """
+
+        import fnmatch
+
+        opts, arg = self.parse_options(parameter_s,'a:s:dln:r:p:fbt:',
+                                       posix=False)
+        benchmarks = self.db.get('benchmarks',{})
+
+        if opts.has_key('a'):
+            name, stmt = opts.a, arg.strip()
+            if not stmt:
+                raise UsageError("%bench -a: give a name and a statement")
+            if not re.match(r'[\w.-]+$',name):
+                raise UsageError("%%bench -a: invalid benchmark name '%s'" %
+                                 name)
+            setup = getattr(opts, "s", "pass")
+            if len(setup) > 1 and setup[0] in '"\'' and setup[-1] == setup[0]:
+                setup = setup[1:-1]
+            old = benchmarks.get(name)
+            benchmarks[name] = {'stmt': stmt, 'setup': setup}
+            self.db['benchmarks'] = benchmarks
+            if old is not None and old != benchmarks[name]:
+                # results of the old code are no baseline for the new one
+                del self.db['bench/'+name]
+            return
+
+        if opts.has_key('d'):
+            for name in arg.split():
+                try:
+                    del benchmarks[name]
+                except KeyError:
+                    raise UsageError(
+                        "%%bench -d: Can't delete benchmark '%s'" % name)
+                try:
+                    del self.db['bench/'+name]
+                except KeyError:
+                    pass
+            self.db['benchmarks'] = benchmarks
+            return
+
+        if opts.has_key('l'):
+            self._bench_history(arg.strip())
+            return
+
+        if not arg.strip():
+            if not benchmarks:
+                print 'No benchmarks defined, see %bench? to add some.'
+                return
+            size = max(map(len,benchmarks))
+            for name in sorted(benchmarks):
+                bm = benchmarks[name]
+                runs = len(self.db.get('bench/'+name,{}).get('history',[]))
+                print '%-*s %4d runs  %s' % (size,name,runs,bm['stmt'])
+                if bm['setup'] != 'pass':
+                    print '%-*s            setup: %s' % (size,'',bm['setup'])
+            return
+
+        names = []
+        for pattern in arg.split():
+            matches = fnmatch.filter(sorted(benchmarks),pattern)
+            if not matches:
+                raise UsageError("%%bench: no benchmark matches '%s'" %
+                                 pattern)
+            names.extend([n for n in matches if n not in names])
+
+        number = int(getattr(opts, "n", 0))
+        repeat = int(getattr(opts, "r", 3))
+        precision = int(getattr(opts, "p", 3))
+        threshold = float(getattr(opts, "t", 10)) / 100
+        fork = hasattr(opts, "f")
+        if fork and not hasattr(os, "fork"):
+            error('%bench -f needs os.fork(), not available here.')
+            return
+
+        host, python = profiling.bench_env()
+        env = host + '/' + python
+        records = []
+        baselines = {}
+        for name in names:
+            bm = benchmarks[name]
+            try:
+                result = self._timeit(bm['stmt'], bm['setup'], number, repeat,
+                                      fork=fork, precision=precision)
+            except profiling.ChildError, msg:
+                error('%s: %s' % (name, msg))
+                continue
+            except:
+                # one broken benchmark shouldn't stop the others
+                etype, value = sys.exc_info()[:2]
+                error('%s: %s: %s' % (name, etype.__name__, value))
+                continue
+            rec = profiling.bench_record(result, bm['stmt'], bm['setup'])
+            entry = self.db.get('bench/'+name, {'history': [],
+                                                'baseline': {}})
+            entry['history'] = (entry['history'] + [rec])[-100:]
+            if opts.has_key('b') or not entry['baseline'].has_key(env):
+                entry['baseline'][env] = rec
+            self.db['bench/'+name] = entry
+            baselines[name] = entry['baseline'][env]
+            records.append((name, rec))
+        if not records:
+            return
+
+        lines, regressed = profiling.bench_table(records, baselines,
+                                                 threshold, precision)
+        print 'Benchmarks on %s, python %s' % (host, python)
+        print '\n'.join(lines)
+        if regressed:
+            warn('%d benchmark(s) slower than the baseline by more than '
+                 '%g%%: %s' % (len(regressed), 100 * threshold,
+                               ', '.join(regressed)))
+
+    def _bench_history(self, name):
+        """Print the stored results of benchmark name, for %bench -l."""
+
+        bm = self.db.get('benchmarks',{}).get(name)
+        if bm is None:
+            raise UsageError("%%bench -l: no benchmark named '%s'" % name)
+        print 'Statement:', bm['stmt']
+        if bm['setup'] != 'pass':
+            print 'Setup:    ', bm['setup']
+        entry = self.db.get('bench/'+name)
+        if not entry or not entry['history']:
+            print 'Not run yet.'
+            return
+        print
+        print '\n'.join(profiling.bench_history(entry))
+
+    def magic_perfhist(self, parameter_s=''):
+        """Show the resources used by the slowest inputs.
+
+        %perfhist [-n N] [-s key] [-c] [-w] [-r]
+        %perfhist on [size]
+        %perfhist off
+
+        With the cell_stats option (or after '%perfhist on'), IPython measures
+        every input it runs: the wall clock and CPU time it takes, how much it
+        raises the peak resident memory of the process and how many garbage
+        collections happen meanwhile.  The last inputs (size of them, 1000 by
+        default) are kept, and %perfhist lists the slowest.  Put \\T in a
+        prompt to see the time of the last input.
+
+        Options:
+
+          -n N: show N inputs (default 10).
+
+          -s key: sort by wall (the default), cpu, mem, gc or in (input number,
+          oldest first).
+
+          -c: forget the measures so far (with -r, the saved ones).
+
+          -w: move the measures of this session to the database, where the
+          last 1000 are kept across sessions.
+
+          -r: show the measures saved in the database."""
+
+        opts,args = self.parse_options(parameter_s,'n:s:cwr',mode='list')
+        shell = self.shell
+        if args:
+            if args[0] == 'off' and len(args) == 1:
+                shell.cellstats = None
+            elif args[0] == 'on' and len(args) <= 2:
+                size = int((args[1:] or [1000])[0])
+                if shell.cellstats is None or shell.cellstats.size != size:
+                    shell.cellstats = profiling.CellStats(size)
+            else:
+                raise UsageError("%perfhist: unknown arguments '%s'" %
+                                 ' '.join(args))
+            return
+
+        sort_keys = {'in':0,'wall':1,'cpu':2,'mem':3,'gc':4}
+        key = getattr(opts,'s','wall')
+        if not sort_keys.has_key(key):
+            raise UsageError("%%perfhist: invalid sort key '%s'" % key)
+        number = int(getattr(opts,'n',10))
+
+        cellstats = shell.cellstats
+        if opts.has_key('r'):
+            if opts.has_key('c'):
+                self.db['perfhist'] = []
+                return
+            cells = self.db.get('perfhist',[])
+        elif cellstats is None:
+            print ('Inputs are not measured, use %perfhist on or the '
+                   'cell_stats option.')
+            return
         else:
-            order = 3
-        print "%d loops, best of %d: %.*g %s per loop" % (number, repeat,
-                                                          precision,
-                                                          best * scaling[order],
-                                                          units[order])
-        if tc > tc_min:
-            print "Compiler time: %.2f s" % tc
-        
+            hist = shell.input_hist_raw
+            cells = []
+            for rec in cellstats.cells():
+                source = ''
+                if rec[0] < len(hist):
+                    source = (hist[rec[0]].strip().splitlines() or [''])[0]
+                    if isinstance(source,unicode):
+                        source = source.encode('utf-8','replace')
+                cells.append(rec + (source,))
+            if opts.has_key('w'):
+                date = time.strftime('%Y-%m-%d %H:%M')
+                saved = self.db.get('perfhist',[])
+                saved.extend([('%s %4d' % (date,c[0]),) + c[1:]
+                              for c in cells])
+                self.db['perfhist'] = saved[-1000:]
+                cellstats.clear()
+                return
+            if opts.has_key('c'):
+                cellstats.clear()
+                return
+        if not cells:
+            print 'No inputs measured yet.'
+            return
+
+        idx = sort_keys[key]
+        if idx:
+            cells = sorted(cells,key=lambda c: -c[idx])[:number]
+        else:
+            cells = cells[-number:]
+        print '\n'.join(profiling.cells_table(cells))
+
+    def magic_extensions(self, parameter_s=''):
+        """List the extensions loaded with ipapi's load(), and what each
+        of them cost to load.
+
+        Extensions loaded lazily (see the docstring of IPython.ipapi.IPApi.load)
+        show what triggered their loading; those not used yet show what will
+        load them."""
+
+        api = self.api
+        stats = [(t,mod,trigger) for mod,(t,trigger) in
+                 api.extension_stats.items()]
+        stats.sort()
+        stats.reverse()
+        if not stats and not api.lazy_extensions:
+            print 'No extensions loaded.'
+            return
+        width = max([len(mod) for mod in api.extension_stats.keys() +
+                     api.lazy_extensions.keys()] + [9])
+        print '%-*s  %9s  %s' % (width,'Extension','Load time','Loaded')
+        total = 0
+        for t,mod,trigger in stats:
+            total += t
+            print '%-*s  %6.1f ms  %s' % (width,mod,1000*t,
+                                         trigger and 'by ' + trigger or
+                                         'eagerly')
+        lazy = api.lazy_extensions.items()
+        lazy.sort()
+        for mod,ext in lazy:
+            print '%-*s  %9s  when used: %s' % (width,mod,'-',ext)
+        print '%-*s  %6.1f ms' % (width,'Total',1000*total)
+
     def magic_time(self,parameter_s = ''):
         """Time execution of a Python statement or expression.
 
@@ -20,7 +20,6 @@ __version__ = Release.version
 # Required modules
 import __builtin__
 import os
-import socket
 import sys
 import time
 
@@ -29,6 +28,7 @@ from IPython import ColorANSI
 from IPython.Itpl import ItplNS
 from IPython.ipstruct import Struct
 from IPython.macro import Macro
+from IPython.profiling import format_time
 from IPython.genutils import *
 from IPython.ipapi import TryNext
 
@@ -81,6 +81,9 @@ PromptColors.add_scheme(__PColLightBG)
 del Colors,InputColors
 
 #-----------------------------------------------------------------------------
+# (dict, number of keys, regex) of the dicts multiple_replace() has seen
+_replace_regexes = {}
+
 def multiple_replace(dict, text):
     """ Replace in 'text' all occurences of any key in the given
     dictionary by its corresponding value.  Returns the new string."""
@@ -88,8 +91,14 @@ def multiple_replace(dict, text):
     # Function by Xavier Defrang, originally found at:
     # http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/81330
 
-    # Create a regular expression  from the dictionary keys
-    regex = re.compile("(%s)" % "|".join(map(re.escape, dict.keys())))
+    # Create a regular expression  from the dictionary keys (once: prompts
+    # are rebuilt with the same few dicts many times at startup)
+    cached = _replace_regexes.get(id(dict))
+    if cached is not None and cached[0] is dict and cached[1] == len(dict):
+        regex = cached[2]
+    else:
+        regex = re.compile("(%s)" % "|".join(map(re.escape, dict.keys())))
+        _replace_regexes[id(dict)] = (dict, len(dict), regex)
     # For each match, look-up corresponding value in dictionary
     return regex.sub(lambda mo: dict[mo.string[mo.start():mo.end()]], text)
 
@@ -118,7 +127,12 @@ HOME = os.environ.get("HOME","//////:::::ZZZZZ,,,~~~")
 # fixed once ipython starts.  This reduces the runtime overhead of computing
 # prompt strings.
 USER           = os.environ.get("USER")
-HOSTNAME       = socket.gethostname()
+try:
+    HOSTNAME   = os.uname()[1]
+except AttributeError:
+    # no uname on Windows (and socket is slow to import)
+    import socket
+    HOSTNAME   = socket.gethostname()
 HOSTNAME_SHORT = HOSTNAME.split(".")[0]
 ROOT_SYMBOL    = "$#"[os.name=='nt' or os.getuid()==0]
 
@@ -136,6 +150,8 @@ prompt_specials_color = {
     r'\w': '${os.getcwd()}',
     # Current time
     r'\t' : '${time.strftime("%H:%M:%S")}',
+    # Wall clock time of the last cell (with the cell_stats option)
+    r'\T' : '${self.cell_time()}',
     # Basename of current working directory.
     # (use os.sep to make this portable across OSes)
     r'\W' : '${os.getcwd().split("%s")[-1]}' % os.sep,
@@ -293,6 +309,13 @@ class BasePrompt(object):
         else:
             return out_str
 
+    def cell_time(self):
+        """Wall clock time taken by the last cell, if it was measured."""
+        cellstats = self.cache.shell.cellstats
+        if cellstats is None or cellstats.last is None:
+            return ''
+        return format_time(cellstats.last[1])
+
     # these path filters are put in as methods so that we can control the
     # namespace where the prompt strings get evaluated
     def cwd_filt(self,depth):
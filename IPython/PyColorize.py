@@ -38,7 +38,6 @@ _scheme_default = 'Linux'
 import cStringIO
 import keyword
 import os
-import optparse
 import string
 import sys
 import token
@@ -258,6 +257,7 @@ def main(argv=None):
 Colorize a python file or stdin using ANSI color escapes and print to stdout.
 If no filename is given, or if filename is -, read standard input."""
 
+    import optparse
     parser = optparse.OptionParser(usage=usage_msg)
     newopt = parser.add_option
     newopt('-s','--scheme',metavar='NAME',dest='scheme_name',action='store',
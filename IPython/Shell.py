@@ -22,6 +22,7 @@ __license__ = Release.license
 import __builtin__
 import __main__
 import Queue
+import imp
 import inspect
 import os
 import sys
@@ -31,8 +32,10 @@ import time
 
 from signal import signal, SIGINT
 
+# ctypes is only needed by the threaded shells: look for it, but only load it
+# when _async_raise() is used
 try:
-    import ctypes
+    imp.find_module('ctypes')
     HAS_CTYPES = True
 except ImportError:
     HAS_CTYPES = False
@@ -291,6 +294,7 @@ if HAS_CTYPES:
     # http://sebulba.wikispaces.com/recipe+thread2
     def _async_raise(tid, exctype):
         """raises the exception, performs cleanup if needed"""
+        import ctypes
         if not inspect.isclass(exctype):
             raise TypeError("Only types can be raised (not instances)")
         res = ctypes.pythonapi.PyThreadState_SetAsyncExc(tid,
@@ -390,7 +394,7 @@ class MTInteractiveShell(InteractiveShell):
             return False
         
         try:
-            code = self.compile(source, filename, symbol)
+            code = self.compile_cached(source, filename, symbol)
         except (OverflowError, SyntaxError, ValueError):
             # Case 1
             self.showsyntaxerror(filename)
@@ -42,6 +42,11 @@ import sys
 if sys.version[0:3] < '2.3':
     raise ImportError('Python Version 2.3 or above is required for IPython.')
 
+# Time the imports below too
+from IPython import startuptime
+if startuptime.requested(sys.argv):
+    startuptime.start()
+
 # Make it easy to import extensions - they are always directly on pythonpath.
 # Therefore, non-IPython modules can be added to Extensions directory
 import os
@@ -34,6 +34,7 @@ __license__ = Release.license
 
 # Code begins
 import sys
+import thread
 import threading
 
 from IPython.ultraTB import AutoFormattedTB
@@ -361,6 +362,8 @@ class BackgroundJobBase(threading.Thread):
         
         # The num tag can be set by an external job manager
         self.num = None
+        # id of the thread running the job, for %sprun -j
+        self.thread_id = None
       
         self.status    = BackgroundJobBase.stat_created
         self.stat_code = BackgroundJobBase.stat_created_c
@@ -389,6 +392,7 @@ class BackgroundJobBase(threading.Thread):
         print self._tb
         
     def run(self):
+        self.thread_id = thread.get_ident()
         try:
             self.status    = BackgroundJobBase.stat_running
             self.stat_code = BackgroundJobBase.stat_running_c
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache of compiled scripts, used by %run.
+
+Every script gets one file in the cache directory, named after a hash of its
+absolute path.  The file holds the interpreter's magic number, then the name,
+mtime and size of the script it was compiled from, then the marshalled code
+object.  If any of those doesn't match the script on disk any more, the script
+is compiled again and the entry overwritten, so the cache never needs to be
+cleaned by hand (though removing the directory is always safe).
+"""
+
+#*****************************************************************************
+#       Copyright (C) 2001-2006 Fernando Perez <fperez@colorado.edu>
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#*****************************************************************************
+
+import imp
+import marshal
+import os
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+class ScriptCache:
+    """Compile scripts, keeping the code objects in a directory.
+
+    Usage:
+
+      cache = ScriptCache('~/.ipython/bytecode')
+      exec cache.compile('script.py') in namespace
+
+    Hits, misses and failed writes are counted in the attributes of the same
+    name."""
+
+    def __init__(self,dirname):
+        self.dirname = os.path.expanduser(dirname)
+        self.magic = imp.get_magic()
+        self.hits = self.misses = self.errors = 0
+
+    def path(self,fname):
+        """Return the cache file used for script fname."""
+        key = md5(os.path.abspath(fname)).hexdigest()
+        return os.path.join(self.dirname,key + '.ipc')
+
+    def compile(self,fname):
+        """Return the code object for script fname, compiling it if needed.
+
+        Raises whatever compile() or reading the script raise (SyntaxError,
+        IOError...); problems with the cache itself are never fatal."""
+
+        st = os.stat(fname)
+        stamp = (fname,st.st_mtime,st.st_size)
+        cname = self.path(fname)
+        code = self.load(cname,stamp)
+        if code is not None:
+            self.hits += 1
+            return code
+        self.misses += 1
+        source = open(fname,'rU').read()
+        if not source.endswith('\n'):
+            source += '\n'
+        # like execfile(), but without inheriting our own __future__ flags
+        code = compile(source,fname,'exec',0,1)
+        self.save(cname,stamp,code)
+        return code
+
+    def load(self,cname,stamp):
+        """Return the code cached in file cname, or None if it's stale."""
+        try:
+            f = open(cname,'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                if f.read(len(self.magic)) != self.magic:
+                    return None
+                if marshal.load(f) != stamp:
+                    return None
+                return marshal.load(f)
+            except (EOFError,ValueError,TypeError):
+                # truncated or garbled entry, just compile again
+                return None
+        finally:
+            f.close()
+
+    def save(self,cname,stamp,code):
+        """Write code to cache file cname, atomically."""
+        import tempfile
+        tmpname = None
+        try:
+            if not os.path.isdir(self.dirname):
+                os.makedirs(self.dirname)
+            fd,tmpname = tempfile.mkstemp('.tmp','',self.dirname)
+            f = os.fdopen(fd,'wb')
+            try:
+                f.write(self.magic)
+                marshal.dump(stamp,f)
+                marshal.dump(code,f)
+            finally:
+                f.close()
+            if os.name == 'nt' and os.path.exists(cname):
+                os.remove(cname)
+            os.rename(tmpname,cname)
+        except (IOError,OSError):
+            # read-only or full ipythondir: run without the cache
+            self.errors += 1
+            if tmpname is not None:
+                try:
+                    os.remove(tmpname)
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Remove all the cached code."""
+        if not os.path.isdir(self.dirname):
+            return
+        for f in os.listdir(self.dirname):
+            if f.endswith('.ipc'):
+                try:
+                    os.remove(os.path.join(self.dirname,f))
+                except OSError:
+                    pass
@@ -22,13 +22,11 @@ __license__ = Release.license
 # required modules from the Python standard library
 import __main__
 import commands
-import doctest
 import os
 import re
 import shlex
 import shutil
 import sys
-import tempfile
 import time
 import types
 import warnings
@@ -864,10 +862,22 @@ def doctest_reload():
       modified displayhook.  Doctest expects the default displayhook behavior
       deep down, so our modification breaks it completely.  For this reason, a
       hard monkeypatch seems like a reasonable solution rather than asking
-      users to manually use a different doctest runner when under IPython."""
+      users to manually use a different doctest runner when under IPython.
 
-    import doctest
-    reload(doctest)
+    If doctest isn't loaded yet, all this happens when it is first imported
+    instead, so that IPython doesn't pay for importing it at startup."""
+
+    if 'doctest' in sys.modules:
+        import doctest
+        reload(doctest)
+        _patch_doctest(doctest)
+    else:
+        for hook in sys.meta_path:
+            if isinstance(hook,_DoctestImporter):
+                return
+        sys.meta_path.append(_DoctestImporter())
+
+def _patch_doctest(doctest):
     doctest.master=None
 
     try:
@@ -879,6 +889,20 @@ def doctest_reload():
     else:
         doctest.DocTestRunner.run = dhook_wrap(doctest.DocTestRunner.run)
 
+class _DoctestImporter:
+    """Import hook running doctest_reload()'s patches on the first import of
+    doctest."""
+
+    def find_module(self,fullname,path=None):
+        if fullname == 'doctest':
+            return self
+
+    def load_module(self,fullname):
+        sys.meta_path.remove(self)
+        import doctest
+        _patch_doctest(doctest)
+        return doctest
+
 #----------------------------------------------------------------------------
 class HomeDirError(Error):
     pass
@@ -1569,6 +1593,7 @@ def page(strng,start=0,screen_lines=0,pager_cmd = None):
                 # The default WinXP 'type' command is failing on complex strings.
                 retval = 1
             else:
+                import tempfile
                 tmpname = tempfile.mktemp('.txt')
                 tmpfile = file(tmpname,'wt')
                 tmpfile.write(strng)
@@ -3,11 +3,15 @@
 """ History related magics and functionality """
 
 # Stdlib imports
+import array
+import errno
 import fnmatch
 import os
+import re
 
 # IPython imports
 from IPython.genutils import Term, ask_yes_no
+from IPython.Extensions.pickleshare import gethashfile
 
 def magic_history(self, parameter_s = ''):
     """Print input history (_i<n> variables), with most recent last.
@@ -43,6 +47,13 @@ def magic_history(self, parameter_s = ''):
       Use '%hist -g' to show full shadow history (may be very long).
       In shadow history, every index nuwber starts with 0.
 
+      -e: with -g, the pattern is a regular expression to search for
+      instead of a glob pattern.
+
+      -R: with -g, show the most recent shadow history matches first.
+
+      -l N: with -g, show at most N shadow history matches.
+
       -f FILENAME: instead of printing the output to the screen, redirect it to
        the given file.  The file is always overwritten, though IPython asks for
        confirmation first if it already exists.
@@ -55,7 +66,7 @@ def magic_history(self, parameter_s = ''):
     if not shell.outputcache.do_full_cache:
         print 'This feature is only available if numbered prompts are in use.'
         return
-    opts,args = self.parse_options(parameter_s,'gntsrf:',mode='list')
+    opts,args = self.parse_options(parameter_s,'gntsrf:eRl:',mode='list')
 
     # Check if output to specific file was requested.
     try:
@@ -88,11 +99,33 @@ def magic_history(self, parameter_s = ''):
     if opts.has_key('g'):
         init = 1
         final = len(input_hist)
-        parts = parameter_s.split(None,1)
-        if len(parts) == 1:
-            parts += '*'
-        head, pattern = parts
-        pattern = "*" + pattern + "*"
+        # the pattern is the rest of the line as typed, shlex would eat the
+        # backslashes of regular expressions
+        pattern = parameter_s.lstrip()
+        while pattern.startswith('-'):
+            word, pattern = (pattern.split(None,1) + [''])[:2]
+            for i in range(1,len(word)):
+                if word[i] in 'fl':
+                    if i == len(word) - 1:
+                        # the option's value is the next word
+                        pattern = (pattern.split(None,1) + ['',''])[1]
+                    break
+        if opts.has_key('e'):
+            try:
+                match = re.compile(pattern).search
+            except re.error,e:
+                print 'Invalid regular expression %r: %s' % (pattern,e)
+                return
+        else:
+            pattern = "*" + pattern + "*"
+            match = lambda s: fnmatch.fnmatch(s, pattern)
+        limit = None
+        if opts.has_key('l'):
+            try:
+                limit = int(opts['l'])
+            except ValueError:
+                print '%%hist -l needs a number, not %r' % opts['l']
+                return
     elif len(args) == 0:
         final = len(input_hist)
         init = max(1,final-default_length)
@@ -111,11 +144,12 @@ def magic_history(self, parameter_s = ''):
     
     found = False
     if pattern is not None:
-        sh = ip.IP.shadowhist.all()
+        sh = ip.IP.shadowhist.grep(pattern, regex = opts.has_key('e'),
+                                   recent_first = opts.has_key('R'),
+                                   limit = limit)
         for idx, s in sh:
-            if fnmatch.fnmatch(s, pattern):
-                print "0%d: %s" %(idx, s)
-                found = True
+            print "0%d: %s" %(idx, s)
+            found = True
     
     if found:
         print "==="
@@ -124,7 +158,7 @@ def magic_history(self, parameter_s = ''):
         
     for in_num in range(init,final):        
         inline = input_hist[in_num]
-        if pattern is not None and not fnmatch.fnmatch(inline, pattern):
+        if pattern is not None and not match(inline):
             continue
             
         multiline = int(inline.count('\n') > 1)
@@ -217,24 +251,270 @@ def rep_f(self, arg):
 
 _sentinel = object()
 
+def trigrams(s):
+    """ Set of all 3 character substrings of 's' """
+    return set([s[i:i+3] for i in range(len(s) - 2)])
+
+_glob_special = re.compile(r'\[[^\]]*\]|[*?\[]')
+
+def glob_literals(pattern):
+    """ Literal strings every match of glob 'pattern' must contain """
+    return [l for l in _glob_special.split(pattern) if l]
+
+def regex_literals(rx):
+    """ Literal strings every match of regular expression 'rx' must contain
+
+    This is conservative: anything that isn't obviously literal ends a
+    literal, text inside groups is ignored (a group may be optional or 
+    hold alternatives), alternatives ('|') outside of groups or extensions 
+    ('(?') give no literals at all.
+    """
+    if '(?' in rx:
+        return []
+    lits = []
+    cur = []
+    depth = 0
+    i = 0
+    while i < len(rx):
+        c = rx[i]
+        if c == '\\':
+            nxt = rx[i+1:i+2]
+            if nxt and not nxt.isalnum():
+                if depth == 0:
+                    cur.append(nxt)
+            else:
+                # \d, \w, backreferences...
+                lits.append(''.join(cur))
+                cur = []
+            i += 2
+            continue
+        if c in '*?{':
+            # the previous character is optional
+            if cur:
+                cur.pop()
+            lits.append(''.join(cur))
+            cur = []
+            if c == '{':
+                i = rx.find('}', i)
+                if i == -1:
+                    break
+        elif c == '[':
+            lits.append(''.join(cur))
+            cur = []
+            # a ']' right after '[' or '[^' doesn't end the set
+            i = rx.find(']', i + 2 + (rx[i+1:i+2] == '^'))
+            if i == -1:
+                break
+        elif c == '|' and depth == 0:
+            return []
+        elif c in '.^$()+':
+            lits.append(''.join(cur))
+            cur = []
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+        elif depth == 0:
+            cur.append(c)
+        i += 1
+    lits.append(''.join(cur))
+    return [l for l in lits if l]
+
+def pid_alive(pid):
+    """ Is process 'pid' (of this host) running? True if we can't tell """
+    if os.name != 'posix':
+        # os.kill() is no test on windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno != errno.ESRCH
+    return True
+
+class TrigramIndex:
+    """ Inverted index of 3 character substrings -> shadow history indexes
+
+    A command can only contain a literal string if it contains every
+    trigram of it, so intersecting their posting lists narrows a search
+    down to a few candidates without reading the whole history. Trigrams
+    are taken from the lowercased commands, so the candidates are also good
+    for case insensitive searches.
+
+    Every index below 'upto' is either indexed, listed in 'missing'
+    (allocated by some session, but still unused when we looked) or known
+    to stay unused. Any saved copy of the index is therefore valid,
+    catch_up() brings it up to date with the history.
+    """
+    def __init__(self):
+        # trigram => array of idx
+        self.postings = {}
+        self.upto = 1
+        self.missing = set()
+        # idx >= upto that are indexed (or known to be unused) already
+        self.extra = set()
+
+    def add(self, idx, cmd):
+        """ Index command 'cmd' as 'idx' (no-op if it is already) """
+        if idx < self.upto:
+            if idx not in self.missing:
+                return
+            self.missing.discard(idx)
+        else:
+            if idx in self.extra:
+                return
+            self.extra.add(idx)
+        postings = self.postings
+        for t in trigrams(cmd.lower()):
+            p = postings.get(t)
+            if p is None:
+                p = postings[t] = array.array('i')
+            p.append(idx)
+
+    def dead(self, start, end):
+        """ Indexes start...end-1 were given up and will never be used """
+        for idx in range(start, end):
+            if idx < self.upto:
+                self.missing.discard(idx)
+            else:
+                self.extra.add(idx)
+
+    def catch_up(self, end, get, live = None, mine = (0, 0)):
+        """ Index everything below 'end', get(idx) returns a command or None
+        
+        Missing indexes are looked at again only if live(idx) is true, i.e.
+        they are reserved by a session which may still use them; the others
+        get a last look and are forgotten. Those in range(*mine), the unused
+        ones of our own session, aren't looked at. Without 'live', all of 
+        them are looked at again.
+
+        Returns whether anything changed.
+        """
+        changed = False
+        for idx in range(self.upto, end):
+            if idx in self.extra:
+                continue
+            cmd = get(idx)
+            if cmd is None:
+                self.missing.add(idx)
+            else:
+                self.add(idx, cmd)
+            changed = True
+        if end > self.upto:
+            self.upto = end
+            self.extra = set([i for i in self.extra if i >= end])
+        start, stop = mine
+        for idx in list(self.missing):
+            if start <= idx < stop:
+                continue
+            cmd = get(idx)
+            if cmd is not None:
+                self.add(idx, cmd)
+                changed = True
+            elif live is not None and not live(idx):
+                # its session is gone, nobody will use it anymore
+                self.missing.discard(idx)
+                changed = True
+        return changed
+
+    def candidates(self, literals):
+        """ Set of idx whose command may contain all 'literals'
+
+        Returns None if the literals are too short to narrow anything down.
+        """
+        tris = set()
+        for l in literals:
+            tris.update(trigrams(l.lower()))
+        if not tris:
+            return None
+        lists = [self.postings.get(t, ()) for t in tris]
+        lists.sort(key = len)
+        cands = set(lists[0])
+        for p in lists[1:]:
+            if not cands:
+                break
+            cands.intersection_update(p)
+        return cands
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        # much smaller and faster to pickle than lists of ints
+        d['postings'] = dict([(t, p.tostring()) 
+                              for (t, p) in self.postings.iteritems()])
+        return d
+
+    def __setstate__(self, d):
+        postings = {}
+        for t, p in d['postings'].iteritems():
+            a = postings[t] = array.array('i')
+            a.fromstring(p)
+        d['postings'] = postings
+        self.__dict__.update(d)
+
 class ShadowHist:
+    """ Persistent history of every distinct command ever entered
+
+    Each command gets a unique index. The db keeps both directions hashed:
+    'shadowhist' maps commands to indexes and 'shadowhist_rev' maps indexes
+    back to commands, so neither add() nor get() has to load the whole
+    history.
+
+    Indexes are reserved from the db in blocks of 'idx_batch', which saves
+    a db read and write for most new commands. Several sessions running at
+    once therefore leave gaps in the numbering. The blocks still in use are
+    listed in 'shadowhist_blocks' ({end: (start, (host, pid))}), so that 
+    searches only keep looking at the gaps which may still get filled.
+
+    Searches use a TrigramIndex, kept up to date by add() once it has been
+    loaded and saved to the db as 'shadowhist_index' by save_index().
+    """
+
+    idx_batch = 64
+
     def __init__(self,db):
         # cmd => idx mapping
         self.curidx = 0
         self.db = db
+        # [next, end) of the block of indexes reserved by this session
+        self.idx_block = (0, 0)
+        # whether 'shadowhist_rev' is known to be complete
+        self.rev_ok = False
+        self.index = None
+        self.index_dirty = False
     
     def inc_idx(self):
-        idx = self.db.get('shadowhist_idx', 1)
-        self.db['shadowhist_idx'] = idx + 1
-        return idx
+        nxt, end = self.idx_block
+        if nxt >= end:
+            self.db.lock('shadowhist_idx')
+            try:
+                nxt = self.db.get('shadowhist_idx', 1)
+                end = nxt + self.idx_batch
+                self.db['shadowhist_idx'] = end
+                blocks = self.db.get('shadowhist_blocks', {})
+                # the previous block is used up
+                blocks.pop(self.idx_block[1], None)
+                blocks[end] = (nxt, self.owner())
+                self.db['shadowhist_blocks'] = blocks
+            finally:
+                self.db.unlock('shadowhist_idx')
+        self.idx_block = (nxt + 1, end)
+        return nxt
         
     def add(self, ent):
-        old = self.db.hget('shadowhist', ent, _sentinel)
-        if old is not _sentinel:
-            return
-        newidx = self.inc_idx()
-        #print "new",newidx # dbg
-        self.db.hset('shadowhist',ent, newidx)
+        # another session may be adding the same command
+        self.db.lock('shadowhist')
+        try:
+            old = self.db.hget('shadowhist', ent, _sentinel)
+            if old is not _sentinel:
+                return
+            newidx = self.inc_idx()
+            #print "new",newidx # dbg
+            self.db.hset('shadowhist',ent, newidx)
+            self.db.hset('shadowhist_rev',newidx, ent)
+        finally:
+            self.db.unlock('shadowhist')
+        if self.index is not None:
+            self.index.add(newidx, ent)
+            self.index_dirty = True
     
     def all(self):
         d = self.db.hdict('shadowhist')
@@ -242,13 +522,268 @@ class ShadowHist:
         items.sort()
         return items
 
+    def grep(self, pattern, regex = False, recent_first = False, 
+             limit = None):
+        """ Sorted (idx, cmd) pairs of the commands matching glob 'pattern'
+
+        With 'regex', pattern is a regular expression to search for instead.
+        The TrigramIndex picks the candidates to look at; patterns without 
+        literals of at least 3 characters need a scan of the whole history,
+        one bucket at a time. 'recent_first' sorts the newest commands first,
+        'limit' returns at most that many of them.
+        """
+        if regex:
+            match = re.compile(pattern).search
+            literals = regex_literals(pattern)
+        else:
+            match = lambda s: fnmatch.fnmatch(s, pattern)
+            literals = glob_literals(pattern)
+
+        cands = self.load_index().candidates(literals)
+        if cands is None:
+            items = self.scan(match)
+        else:
+            found = {}
+            for i in cands:
+                s = self.get(i)
+                if s is not None and match(s):
+                    found[s] = max(i, found.get(s, i))
+            items = [(i,s) for (s,i) in found.items()]
+            items.sort()
+        if recent_first:
+            items.reverse()
+        if limit is not None:
+            items = items[:limit]
+        return items
+
+    def scan(self, match):
+        """ Sorted (idx, cmd) pairs of all commands for which match(cmd) 
+        
+        The history is scanned one bucket at a time, only the matches are
+        kept in memory.
+        """
+        found = {}
+        for f in self.db.hbuckets('shadowhist'):
+            try:
+                d = self.db[f]
+            except KeyError:
+                continue
+            for s, i in d.iteritems():
+                if match(s):
+                    found[s] = i
+            self.db.uncache(f)
+        items = [(i,s) for (s,i) in found.items()]
+        items.sort()
+        return items
+
     def get(self, idx):
-        all = self.all()
+        self.check_rev()
+        cmd = self.db.hget('shadowhist_rev', idx, None)
+        if cmd is None:
+            # hget() doesn't look in the hcompress()ed bucket once a new
+            # bucket exists for idx; it's the only other place idx can be
+            cmd = self.db.get('shadowhist_rev/xx', {}).get(idx)
+        return cmd
+
+    def check_rev(self):
+        """ Build the idx => cmd index for histories that predate it """
+        if self.rev_ok:
+            return
+        if not self.db.hbuckets('shadowhist_rev'):
+            buckets = {}
+            for s, i in self.db.hdict('shadowhist').items():
+                buckets.setdefault(gethashfile(i), {})[i] = s
+            for h, d in buckets.items():
+                self.db['shadowhist_rev/' + h] = d
+        self.rev_ok = True
+
+    def iterall(self):
+        """ All (idx, cmd) pairs, unsorted, reading one bucket at a time """
+        self.check_rev()
+        for f in self.db.hbuckets('shadowhist_rev'):
+            try:
+                d = self.db[f]
+            except KeyError:
+                continue
+            for item in d.iteritems():
+                yield item
+            self.db.uncache(f)
+
+    def load_index(self):
+        """ Return the TrigramIndex, loaded or built and brought up to date """
+        index = self.index
+        if index is None:
+            index = self.db.get('shadowhist_index', None)
+            if not isinstance(index, TrigramIndex):
+                index = TrigramIndex()
+                for idx, cmd in self.iterall():
+                    index.add(idx, cmd)
+                self.index_dirty = True
+            self.index = index
+        for start, end in self.db.get('shadowhist_dead', []):
+            index.dead(start, end)
+        live = self.live_blocks()
+        def is_live(idx):
+            for start, end in live:
+                if start <= idx < end:
+                    return True
+            return False
+        if index.catch_up(self.db.get('shadowhist_idx', 1), self.get,
+                          is_live, self.idx_block):
+            self.index_dirty = True
+        return index
+
+    def owner(self):
+        """ (host, pid) of this session, for 'shadowhist_blocks' """
+        host = None
+        if hasattr(os, 'uname'):
+            host = os.uname()[1]
+        return (host, os.getpid())
+
+    def live_blocks(self):
+        """ (start, end) of the blocks of indexes of running sessions
+
+        Blocks of sessions that died on this host without giving them back
+        are dropped from 'shadowhist_blocks'. Sessions on other hosts can't
+        be checked and are taken to be running.
+        """
+        host, pid = self.owner()
+        blocks = self.db.get('shadowhist_blocks', {})
+        dead = [end for end, (start, owner) in blocks.items()
+                if owner[0] == host and not pid_alive(owner[1])]
+        if dead:
+            self.db.lock('shadowhist_idx')
+            try:
+                blocks = self.db.get('shadowhist_blocks', {})
+                for end in dead:
+                    blocks.pop(end, None)
+                self.db['shadowhist_blocks'] = blocks
+            finally:
+                self.db.unlock('shadowhist_idx')
+        return [(start, end) for end, (start, owner) in blocks.items()]
+
+    def release_idx(self):
+        """ Give back the unused part of the reserved block of indexes """
+        nxt, end = self.idx_block
+        if not end:
+            return
+        self.db.lock('shadowhist_idx')
+        try:
+            blocks = self.db.get('shadowhist_blocks', {})
+            if blocks.pop(end, None) is not None:
+                self.db['shadowhist_blocks'] = blocks
+            if nxt < end:
+                if self.db.get('shadowhist_idx', 1) == end:
+                    self.db['shadowhist_idx'] = nxt
+                else:
+                    # somebody reserved after us, tell the search indexes
+                    dead = self.db.get('shadowhist_dead', [])
+                    dead.append((nxt, end))
+                    self.db['shadowhist_dead'] = dead[-256:]
+        finally:
+            self.db.unlock('shadowhist_idx')
+        self.idx_block = (0, 0)
+
+    def save_index(self):
+        """ Release unused indexes and save the search index, if changed """
+        self.release_idx()
+        if self.index is None or not self.index_dirty:
+            return
+        self.db.lock('shadowhist_index')
+        try:
+            self.db['shadowhist_index'] = self.index
+        finally:
+            self.db.unlock('shadowhist_index')
+        self.index_dirty = False
+
+    def compress(self):
+        """ Merge both indexes into single buckets, see db.hcompress() """
+        self.db.hcompress('shadowhist')
+        self.db.hcompress('shadowhist_rev')
+
+    def clear(self):
+        """ Permanently erase the whole shadow history """
+        for k in self.db.hbuckets('shadowhist') + \
+                self.db.hbuckets('shadowhist_rev'):
+            del self.db[k]
+        self.db.pop('shadowhist_index', None)
+        self.index = None
         
-        for k, v in all:
-            #print k,v
-            if k == idx:
-                return v
+class HistoryJournal:
+    """ The readline history file, appended to as lines are entered
+
+    Writing the whole history at exit loses the session if IPython dies,
+    and dumping/reloading it around every debugger session costs a full
+    write and read of the file. Instead, every line is appended (and
+    flushed) as soon as it is entered. Once the file holds more than twice
+    'maxlen' lines it is compacted down to the last 'maxlen' ones, so the
+    size on disk stays bounded.
+
+    The file is plain text, one line per entry, read and written here
+    rather than through readline so that the format does not depend on the
+    readline flavour (libedit escapes its history files).
+    """
+    def __init__(self, fname, maxlen = 1000):
+        self.fname = fname
+        self.maxlen = maxlen
+        self.nlines = 0
+        self.f = None
+
+    def read(self):
+        """ Return the last 'maxlen' lines of the file """
+        try:
+            lines = open(self.fname).read().splitlines()
+        except IOError:
+            lines = []
+        if lines and lines[0] == '_HiStOrY_V2_':
+            # written by libedit's write_history_file()
+            del lines[0]
+        self.nlines = len(lines)
+        return lines[-self.maxlen:]
+
+    def load(self, readline):
+        """ Replace the readline history with the contents of the file """
+        readline.clear_history()
+        for line in self.read():
+            readline.add_history(line)
+
+    def append(self, line):
+        """ Write one entered line to the end of the file """
+        if self.nlines >= 2 * self.maxlen:
+            self.compact()
+        if self.f is None:
+            self.f = open(self.fname, 'a')
+        self.f.write(line.replace('\n', ' ') + '\n')
+        self.f.flush()
+        self.nlines += 1
+
+    def compact(self):
+        """ Cut the file down to the last 'maxlen' lines
+
+        Other sessions may append to the same file, so it is reread rather
+        than rewritten from our own history. The new file is written next to
+        the old one and renamed over it, a crash leaves one or the other.
+        """
+        import tempfile
+        self.close()
+        lines = self.read()
+        if self.nlines <= self.maxlen:
+            return
+        fd, tmpname = tempfile.mkstemp(dir = os.path.dirname(self.fname) or '.')
+        try:
+            f = os.fdopen(fd, 'w')
+            f.write(''.join([l + '\n' for l in lines]))
+            f.close()
+            os.rename(tmpname, self.fname)
+        except:
+            os.unlink(tmpname)
+            raise
+        self.nlines = len(lines)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
 
 def test_shist():
     from IPython.Extensions import pickleshare
@@ -262,6 +797,41 @@ def test_shist():
     print "all",s.all()
     print s.get(2)
 
+def bench_shist(n = 100000):
+    """ Time adding n commands, looking them up and grepping for them """
+    import random, shutil, tempfile, time
+    from IPython.Extensions import pickleshare
+    tmp = tempfile.mkdtemp()
+    try:
+        s = ShadowHist(pickleshare.PickleShareDB(tmp))
+        t = time.time()
+        for i in xrange(n):
+            s.add('x = %d' % i)
+        print "add: %.1f us/cmd" % ((time.time() - t) / n * 1e6)
+        # a fresh session, nothing cached
+        s = ShadowHist(pickleshare.PickleShareDB(tmp))
+        t = time.time()
+        for i in xrange(1000):
+            s.get(random.randint(1, n))
+        print "get: %.1f us/lookup" % ((time.time() - t) / 1000 * 1e6)
+        t = time.time()
+        s.scan(lambda cmd: fnmatch.fnmatch(cmd, '*= 4242*'))
+        print "full scan: %.2f s" % (time.time() - t)
+        t = time.time()
+        s.grep('*= 4242*')
+        print "grep, building the index: %.2f s" % (time.time() - t)
+        s.save_index()
+        s = ShadowHist(pickleshare.PickleShareDB(tmp))
+        t = time.time()
+        s.grep('*= 4242*')
+        print "grep, loading the index: %.2f s" % (time.time() - t)
+        t = time.time()
+        for i in range(100):
+            s.grep('*= %d*' % random.randint(1, n))
+        print "grep: %.1f ms" % ((time.time() - t) / 100 * 1e3)
+    finally:
+        shutil.rmtree(tmp)
+
 def init_ipython(ip):
     ip.expose_magic("rep",rep_f)        
     ip.expose_magic("hist",magic_hist)            
@@ -84,7 +84,6 @@ def editor(self,filename, linenum=None):
     # Call the actual editor
     os.system('%s %s %s' % (editor,linemark,filename))
 
-import tempfile
 def fix_error_editor(self,filename,linenum,column,msg):
     """Open the editor at the given filename, linenumber, column and 
     show an error message. This is used for correcting syntax errors.
@@ -94,6 +93,7 @@ def fix_error_editor(self,filename,linenum,column,msg):
     Call ip.set_hook('fix_error_editor',youfunc) to use your own function,
     """
     def vim_quickfix_file():
+        import tempfile
         t = tempfile.NamedTemporaryFile()
         t.write('%s:%d:%d:%s\n' % (filename,linenum,column,msg))
         t.flush()
@@ -63,6 +63,7 @@ print "done!"
 # stdlib imports
 import __builtin__
 import sys
+import time
 
 try: # Python 2.3 compatibility
     set
@@ -164,6 +165,28 @@ def get(allow_dummy=False,dummy_warn=True):
         _recent = IPythonNotRunning(dummy_warn)
     return _recent
 
+def cleanup_ipy_script(script):
+    """ Make a script safe for _ip.runlines() 
+    
+    - Removes empty lines
+    - Suffixes all indented blocks that end with unindented lines with empty lines
+    
+    """
+    res = []
+    lines = script.splitlines()
+    level = 0
+    for l in lines:
+        stripped = l.lstrip()
+        if not l.strip():
+            continue
+        newlevel = len(l) - len(stripped)
+        if level > 0 and newlevel == 0:
+            # add empty line
+            res.append('')
+        res.append(l)
+        level = newlevel
+    return '\n'.join(res) + '\n'
+    
 class IPApi:
     """ The actual API class for configuring IPython 
     
@@ -198,6 +221,10 @@ class IPApi:
         self.IP = ip
 
         self.extensions = {}
+        # extensions waiting to be used, see load()
+        self.lazy_extensions = {}
+        # module -> (seconds it took to load, what triggered the load)
+        self.extension_stats = {}
 
         self.dbg = DebugTools(self)
         
@@ -248,6 +275,8 @@ class IPApi:
     
     def ex(self,cmd):
         """ Execute a normal python statement in user namespace """
+        if isinstance(cmd,basestring):
+            cmd = self.IP.compile_cached(cmd,'<string>','exec',False)
         exec cmd in self.user_ns
     
     def ev(self,expr):
@@ -264,28 +293,6 @@ class IPApi:
         Takes either all lines in one string or list of lines.
         """
 
-        def cleanup_ipy_script(script):
-            """ Make a script safe for _ip.runlines() 
-            
-            - Removes empty lines
-            - Suffixes all indented blocks that end with unindented lines with empty lines
-            
-            """
-            res = []
-            lines = script.splitlines()
-            level = 0
-            for l in lines:
-                stripped = l.lstrip()
-                if not l.strip():
-                    continue
-                newlevel = len(l) - len(stripped)
-                if level > 0 and newlevel == 0:
-                    # add empty line
-                    res.append('')
-                res.append(l)
-                level = newlevel
-            return '\n'.join(res) + '\n'
-        
         if isinstance(lines,basestring):
             script = lines            
         else:
@@ -473,7 +480,8 @@ class IPApi:
 
         self.IP.rl_next_input = s
 
-    def load(self, mod):
+    def load(self, mod, magics = (), completers = (), re_completers = (),
+             hooks = ()):
         """ Load an extension.
         
         Some modules should (or must) be 'load()':ed, rather than just imported.
@@ -483,6 +491,17 @@ class IPApi:
         - run init_ipython(ip)
         - run ipython_firstrun(ip)
         
+        If the extension is declared to provide some magics, completers
+        (str_key or re_key of its 'complete_command' hooks) or hooks, only
+        placeholders for those are registered, and the module is loaded the
+        first time one of them is used.  For example:
+        
+        ip.load('ipy_which', magics = ['which'])
+        ip.load('ipy_app_completers', completers = ['svn','hg','bzr'],
+                re_completers = ['.*apt-get'])
+        
+        The extension must then register everything it was declared with.
+        %extensions shows what each extension cost to load.
         """
         if mod in self.extensions:
             # just to make sure we don't init it twice
@@ -490,6 +509,15 @@ class IPApi:
             # imported, init_ipython gets run anyway
             
             return self.extensions[mod]
+        if magics or completers or re_completers or hooks:
+            if mod not in self.lazy_extensions:
+                self.lazy_extensions[mod] = LazyExtension(
+                    self, mod, magics, completers, re_completers, hooks)
+            return None
+        lazy = self.lazy_extensions.pop(mod, None)
+        if lazy is not None:
+            lazy.remove()
+        t0 = time.time()
         __import__(mod)
         m = sys.modules[mod]
         if hasattr(m,'init_ipython'):
@@ -503,9 +531,146 @@ class IPApi:
                 self.db['firstrun_done'] = already_loaded
             
         self.extensions[mod] = m
+        self.extension_stats[mod] = (time.time() - t0, None)
         return m
 
 
+class LazyExtension:
+    """ Placeholders for the magics, completers and hooks of an extension
+    which isn't loaded yet (see IPApi.load).
+    
+    The first placeholder called loads the extension, removing all of them,
+    and passes the call on to what the extension registered instead.  On that
+    first call, the extension's hooks run where the placeholder was in the
+    chain.
+    """
+    
+    def __init__(self, ip, mod, magics = (), completers = (),
+                 re_completers = (), hooks = ()):
+        self.ip = ip
+        self.mod = mod
+        self.magics = list(magics)
+        self.completers = list(completers)
+        self.re_completers = list(re_completers)
+        self.hooks = list(hooks)
+        self.stubs = []
+        for name in self.magics:
+            ip.expose_magic(name, self._stub(self._magic_stub(name)))
+        for key in self.completers:
+            ip.set_hook('complete_command', self._stub(
+                self._hook_stub('complete_command', str_key = key)),
+                        str_key = key)
+        for key in self.re_completers:
+            ip.set_hook('complete_command', self._stub(
+                self._hook_stub('complete_command', re_key = key)),
+                        re_key = key)
+        for name in self.hooks:
+            ip.set_hook(name, self._stub(self._hook_stub(name)))
+
+    def __str__(self):
+        provides = ['%' + name for name in self.magics]
+        provides.extend(self.completers + self.re_completers)
+        provides.extend(['hook ' + name for name in self.hooks])
+        return ', '.join(provides)
+
+    def _stub(self, func):
+        self.stubs.append(func)
+        return func
+
+    def _is_stub(self, entry):
+        return getattr(entry[1], 'im_func', None) in self.stubs
+
+    def _chains(self, name):
+        """ The command chains of hook name. """
+        IP = self.ip.IP
+        sdp = IP.strdispatchers.get(name)
+        if sdp is not None:
+            chains = sdp.strs.values() + sdp.regexs.values()
+        else:
+            chains = []
+        dp = getattr(IP.hooks, name, None)
+        if hasattr(dp, 'chain'):
+            chains.append(dp)
+        return chains
+
+    def remove(self):
+        """ Unregister the placeholders. """
+        IP = self.ip.IP
+        for name in self.magics:
+            magic = IP.__dict__.get('magic_' + name)
+            if getattr(magic, 'im_func', None) in self.stubs:
+                delattr(IP, 'magic_' + name)
+        names = self.hooks[:]
+        if self.completers or self.re_completers:
+            names.append('complete_command')
+        for name in names:
+            for dp in self._chains(name):
+                # a new list: the chain may be running now
+                dp.chain = [e for e in dp.chain if not self._is_stub(e)]
+
+    def load(self, trigger):
+        """ Load the extension now; trigger says which placeholder did it.
+        
+        Returns true if the extension loaded fine."""
+        ip = self.ip
+        try:
+            ip.load(self.mod)
+        except:
+            # the placeholders are gone anyway, don't try again
+            ip.IP.showtraceback()
+            return False
+        ip.extension_stats[self.mod] = (ip.extension_stats[self.mod][0],
+                                        trigger)
+        return True
+
+    def _magic_stub(self, name):
+        def magic(IP, parameter_s = ''):
+            if not self.load('%' + name):
+                return
+            fn = getattr(IP, 'magic_' + name, None)
+            if fn is None:
+                print 'Extension %s did not define %%%s' % (self.mod, name)
+                return
+            return fn(parameter_s)
+        magic.__doc__ = ('%%%s is in the %s extension, which will be loaded '
+                         'the first time it is used.' % (name, self.mod))
+        return magic
+
+    def _hook_stub(self, name, str_key = None, re_key = None):
+        if str_key is not None:
+            trigger = 'completing ' + str_key
+        elif re_key is not None:
+            trigger = 'completing ' + re_key
+        else:
+            trigger = 'hook ' + name
+        def hook(IP, *args, **kw):
+            before = []
+            for dp in self._chains(name):
+                before.extend(dp.chain)
+            if not self.load(trigger):
+                raise TryNext(*args, **kw)
+            if str_key is not None or re_key is not None:
+                sdp = IP.strdispatchers[name]
+                chains = [dp for key, dp in sdp.strs.items()
+                          if key == str_key]
+                chains.extend([dp for r, dp in sdp.regexs.items()
+                               if r.pattern == re_key])
+            else:
+                chains = [getattr(IP.hooks, name)]
+            for dp in chains:
+                for prio, cmd in dp:
+                    if (prio, cmd) in before:
+                        continue
+                    try:
+                        return cmd(*args, **kw)
+                    except TryNext, exc:
+                        if exc.args or exc.kwargs:
+                            args = exc.args
+                            kw = exc.kwargs
+            raise TryNext(*args, **kw)
+        return hook
+
+
 class DebugTools:
     """ Used for debugging mishaps in api usage
     
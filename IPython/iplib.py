@@ -35,10 +35,10 @@ __license__ = Release.license
 __version__ = Release.version
 
 # Python standard modules
+import __future__
 import __main__
 import __builtin__
 import StringIO
-import bdb
 import cPickle as pickle
 import codeop
 import exceptions
@@ -52,7 +52,7 @@ import re
 import shutil
 import string
 import sys
-import tempfile
+import time
 import traceback
 import types
 from sets import Set
@@ -60,12 +60,13 @@ from pprint import pprint, pformat
 
 # IPython's own modules
 #import IPython
-from IPython import Debugger,OInspect,PyColorize,ultraTB
+from IPython import OInspect,PyColorize,profiling,ultraTB
 from IPython.ColorANSI import ColorScheme,ColorSchemeTable  # too long names
 from IPython.Extensions import pickleshare
 from IPython.FakeModule import FakeModule
 from IPython.Itpl import Itpl,itpl,printpl,ItplNS,itplns
-from IPython.Logger import Logger
+from IPython.Logger import Logger, LogReader, log_open
+from IPython.bytecache import ScriptCache
 from IPython.Magic import Magic
 from IPython.Prompts import CachedOutput
 from IPython.ipstruct import Struct
@@ -86,6 +87,12 @@ raw_input_original = raw_input
 # compiled regexps for autoindent management
 dedent_re = re.compile(r'^\s+raise|^\s+return|^\s+pass')
 
+# compiler flags of all __future__ features
+future_flags = 0
+for _feature in __future__.all_feature_names:
+    future_flags |= getattr(__future__,_feature).compiler_flag
+del _feature
+
 
 #****************************************************************************
 # Some utility function definitions
@@ -160,6 +167,95 @@ class InputList(list):
     def __getslice__(self,i,j):
         return ''.join(list.__getslice__(self,i,j))
 
+class SourceState(object):
+    """Lexical state of Python source fed to it one line at a time.
+
+    runlines() uses it to know, without compiling, that the input buffered
+    so far can't be a complete statement yet: it ends inside brackets, in a
+    triple quoted string or after a backslash, or it is a block (compound
+    statement) which no empty line has closed yet.  When in doubt,
+    incomplete() answers False and the caller compiles to find out."""
+
+    special_re = re.compile(r'"""|\'\'\'|["\'#\\()\[\]{}]')
+    string_end_re = dict([(q, re.compile(r'\\.?|' + q))
+                          for q in ['"""',"'''",'"',"'"]])
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.depth = 0        # open brackets
+        self.quote = None     # delimiter of an open string
+        self.cont = False     # line ended with a backslash
+        self.block = False    # a compound statement header was seen
+        self.blank = True     # last line was empty
+        self.fed = False      # anything fed since the last reset
+        self.unsure = False   # something we don't understand was seen
+
+    def feed(self,source):
+        for line in source.split('\n'):
+            self.feed_line(line)
+
+    def feed_line(self,line):
+        if not self.fed and line[:1] in (' ','\t'):
+            # runsource() turns indented input into an 'if 1:' block
+            self.block = True
+        self.fed = True
+        quote, depth = self.quote, self.depth
+        special = self.special_re.search
+        end = len(line)
+        code_end = end
+        string_cont = False
+        self.cont = False
+        i = 0
+        while i < end:
+            if quote:
+                m = self.string_end_re[quote].search(line,i)
+                if m is None:
+                    break
+                i = m.end()
+                tok = m.group()
+                if tok == '\\':
+                    string_cont = True
+                elif tok[0] != '\\':
+                    quote = None
+                continue
+            m = special(line,i)
+            if m is None:
+                break
+            i = m.end()
+            tok = m.group()
+            if tok == '#':
+                code_end = m.start()
+                break
+            elif tok == '\\':
+                if i == end:
+                    self.cont = True
+                else:
+                    self.unsure = True
+            elif tok in '([{':
+                depth += 1
+            elif tok in ')]}':
+                depth -= 1
+            else:
+                quote = tok
+        if (quote in ('"',"'") and not string_cont) or depth < 0:
+            # unterminated string or stray bracket, let compile() complain
+            self.unsure = True
+            quote = None
+        self.quote, self.depth = quote, depth
+        code = line[:code_end].rstrip()
+        if not (quote or depth or self.cont) and code.endswith(':'):
+            self.block = True
+        self.blank = not line.strip()
+
+    def incomplete(self):
+        """True if the source fed so far surely needs more lines."""
+        if self.unsure:
+            return False
+        return bool(self.depth or self.quote or self.cont or
+                    (self.block and not self.blank))
+
 class SyntaxTB(ultraTB.ListTB):
     """Extension which holds some state: the last exception value"""
 
@@ -236,6 +332,12 @@ class InteractiveShell(object,Magic):
         # command compiler
         self.compile = codeop.CommandCompiler()
 
+        # code objects for recently compiled source, see compile_cached()
+        self.code_cache = pickleshare.LRUCache(500,4*1024*1024)
+
+        # resource use of each cell, see %perfhist (None: not measured)
+        self.cellstats = None
+
         # User input buffer
         self.buffer = []
 
@@ -636,7 +738,8 @@ class InteractiveShell(object,Magic):
         """
         rc = self.rc
         try:
-            self.db = pickleshare.PickleShareDB(rc.ipythondir + "/db")            
+            self.db = self.open_db(rc.ipythondir, rc.db_backend,
+                                   rc.db_writeback)
         except exceptions.UnicodeDecodeError:
             print "Your ipythondir can't be decoded to unicode!"
             print "Please set HOME environment variable to something that"
@@ -644,8 +747,33 @@ class InteractiveShell(object,Magic):
             print "Now it is",rc.ipythondir
             sys.exit()
         self.shadowhist = IPython.history.ShadowHist(self.db)            
+        # compiled scripts for %run
+        self.bytecache = ScriptCache(os.path.join(rc.ipythondir,'bytecode'))
             
     
+    def open_db(self, ipythondir, backend = 'dir', writeback = 0):
+        """Return the persistent database object for 'ipythondir'.
+
+        backend is 'dir' (one file per key under ipythondir/db) or 'sqlite'
+        (single file ipythondir/db.sqlite).  When switching to 'sqlite', an
+        existing 'dir' database is migrated automatically.
+
+        writeback is passed on to the 'dir' backend, see PickleShareDB."""
+
+        dirdb = os.path.join(ipythondir, 'db')
+        if backend == 'sqlite':
+            fname = os.path.join(ipythondir, 'db.sqlite')
+            try:
+                if os.path.isdir(dirdb) and not os.path.isfile(fname):
+                    print 'Migrating %s to %s ...' % (dirdb, fname)
+                    return pickleshare.migrate(dirdb, fname)
+                return pickleshare.SqliteShareDB(fname)
+            except ImportError:
+                warn('sqlite3 not available, using the db directory instead.')
+        elif backend != 'dir':
+            warn('Unknown db_backend %r, using the db directory.' % backend)
+        return pickleshare.PickleShareDB(dirdb, writeback)
+    
     def post_config_initialization(self):
         """Post configuration init method
 
@@ -704,6 +832,9 @@ class InteractiveShell(object,Magic):
         # doesn't crash if colors option is invalid)
         self.magic_colors(rc.colors)
 
+        if rc.cell_stats:
+            self.cellstats = profiling.CellStats(rc.cell_stats)
+
         # Set calling of pdb on exceptions
         self.call_pdb = rc.pdb
 
@@ -1241,6 +1372,22 @@ want to merge them back into the new files.""" % locals()
         # input history
         self.savehist()
 
+        # shadow history search index, unused history indexes
+        try:
+            self.shadowhist.save_index()
+        except (IOError, OSError):
+            print 'Unable to save the shadow history index'
+
+        # lines held back by a buffered log
+        if self.logger.flush_on_exit:
+            self.logger.flush()
+
+        # values held back by db_writeback
+        try:
+            self.db.flush()
+        except (IOError, OSError):
+            print 'Unable to write the persistent db:', self.db
+
         # Cleanup all tempfiles left around
         for tfile in self.tempfiles:
             try:
@@ -1251,23 +1398,57 @@ want to merge them back into the new files.""" % locals()
         self.hooks.shutdown_hook()
         
     def savehist(self):
-        """Save input history to a file (via readline library)."""
+        """Save input history to a file (via readline library).
+
+        Lines are journaled to the history file as they are entered, so
+        this only compacts the file if it has grown too long."""
 
         if not self.has_readline:
             return
         
         try:
-            self.readline.write_history_file(self.histfile)
-        except:
+            self.histjournal.compact()
+        except (IOError, OSError):
             print 'Unable to save IPython command history to file: ' + \
                   `self.histfile`
+        self.histjournal.close()
 
     def reloadhist(self):
         """Reload the input history from disk file."""
 
         if self.has_readline:
-            self.readline.clear_history()
-            self.readline.read_history_file(self.shell.histfile)
+            self.histjournal.load(self.readline)
+
+    def history_mark(self):
+        """Return a mark for the current state of the readline history.
+
+        Pass it to history_restore() to drop whatever was added to the
+        history since then."""
+
+        if not self.has_readline:
+            return None
+        histlen = self.readline.get_current_history_length()
+        return histlen, self.readline.get_history_item(histlen)
+
+    def history_restore(self, mark):
+        """Remove readline history items added since history_mark()."""
+
+        if mark is None:
+            return
+        histlen, last = mark
+        rl = self.readline
+        cur = rl.get_current_history_length()
+        try:
+            if cur >= histlen and rl.get_history_item(histlen) == last:
+                # get_history_item() counts from 1, remove_history_item()
+                # from 0
+                for i in range(cur - 1, histlen - 1, -1):
+                    rl.remove_history_item(i)
+                return
+        except AttributeError:
+            pass # remove_history_item is new in 2.4.
+        # the history was truncated or rewritten, start over from the file
+        self.reloadhist()
 
     def history_saving_wrapper(self, func):
         """ Wrap func for readline history saving
@@ -1279,11 +1460,11 @@ want to merge them back into the new files.""" % locals()
             return func
         
         def wrapper():
-            self.savehist()
+            mark = self.history_mark()
             try:
                 func()
             finally:
-                readline.read_history_file(self.histfile)
+                self.history_restore(mark)
         return wrapper
                 
             
@@ -1367,11 +1548,10 @@ want to merge them back into the new files.""" % locals()
             readline.set_completer_delims(delims)
             # otherwise we end up with a monster history after a while:
             readline.set_history_length(1000)
-            try:
-                #print '*** Reading readline history'  # dbg
-                readline.read_history_file(self.histfile)
-            except IOError:
-                pass  # It doesn't exist yet.
+            self.histjournal = IPython.history.HistoryJournal(self.histfile,
+                                                              1000)
+            #print '*** Reading readline history'  # dbg
+            self.histjournal.load(readline)
 
             atexit.register(self.atexit_operations)
             del atexit
@@ -1488,6 +1668,7 @@ want to merge them back into the new files.""" % locals()
             return
 
         # use pydb if available
+        from IPython import Debugger
         if Debugger.has_pydb:
             from pydb import pm
         else:
@@ -1511,6 +1692,10 @@ want to merge them back into the new files.""" % locals()
         # Though this won't be called by syntax errors in the input line,
         # there may be SyntaxError cases whith imported code.
         
+        # don't keep the lines that led here only in a buffered log
+        if self.logger.flush_on_error:
+            self.logger.flush()
+
         try:
             if exc_tuple is None:
                 etype, value, tb = sys.exc_info()
@@ -1784,15 +1969,21 @@ want to merge them back into the new files.""" % locals()
                     self.readline_startup_hook(None)
                 self.write('\n')
                 self.exit()
-            except bdb.BdbQuit:
-                warn('The Python debugger has exited with a BdbQuit exception.\n'
-                     'Because of how pdb handles the stack, it is impossible\n'
-                     'for IPython to properly format this particular exception.\n'
-                     'IPython will resume normal operation.')
             except:
-                # exceptions here are VERY RARE, but they can be triggered
-                # asynchronously by signal handlers, for example.
-                self.showtraceback()
+                # bdb is only imported with the debugger, which is the only
+                # thing raising BdbQuit
+                bdb = sys.modules.get('bdb')
+                if bdb is not None and sys.exc_info()[0] is bdb.BdbQuit:
+                    warn('The Python debugger has exited with a BdbQuit '
+                         'exception.\nBecause of how pdb handles the stack, '
+                         'it is impossible\nfor IPython to properly format '
+                         'this particular exception.\n'
+                         'IPython will resume normal operation.')
+                else:
+                    # exceptions here are VERY RARE, but they can be
+                    # triggered asynchronously by signal handlers, for
+                    # example.
+                    self.showtraceback()
             else:
                 more = self.push(line)
                 if (self.SyntaxTB.last_syntax_error and
@@ -1934,19 +2125,30 @@ want to merge them back into the new files.""" % locals()
             else:
                 self.indent_current_nsp = 0
 
-    def runlines(self,lines):
+    def runlines(self,lines,block=True):
         """Run a string of one or more lines of source.
 
         This method is capable of running a string containing multiple source
         lines, as if they had been entered at the IPython prompt.  Since it
         exposes IPython's processing machinery, the given strings can contain
-        magic calls (%magic), special shell access (!cmd), etc."""
+        magic calls (%magic), special shell access (!cmd), etc.
+
+        By default, statements that obviously aren't complete yet (open
+        brackets or strings, blocks) are only compiled once they could be,
+        instead of after every line; pasting long blocks then costs time
+        linear in their length.  block=False pushes every line as typed
+        input is."""
 
         # We must start with a clean buffer, in case this is run from an
         # interactive IPython session (via a magic, for example).
         self.resetbuffer()
         lines = lines.split('\n')
         more = 0
+        if block:
+            state = SourceState()
+            push = lambda line: self.push(line,state)
+        else:
+            push = self.push
     
         for line in lines:
             # skip blank lines so we don't mess up the prompt counter, but do
@@ -1957,7 +2159,7 @@ want to merge them back into the new files.""" % locals()
             if line or more:
                 # push to raw history, so hist line numbers stay in sync
                 self.input_hist_raw.append("# " + line + "\n")
-                more = self.push(self.prefilter(line,more))
+                more = push(self.prefilter(line,more))
                 # IPython's runsource returns None if there was an error
                 # compiling the code.  This allows us to stop processing right
                 # away, so the user gets the error message at the right place.
@@ -1968,7 +2170,7 @@ want to merge them back into the new files.""" % locals()
         # final newline in case the input didn't have it, so that the code
         # actually does get executed
         if more:
-            self.push('\n')
+            push('\n')
 
     def runsource(self, source, filename='<input>', symbol='single'):
         """Compile and run some source in the interpreter.
@@ -2008,7 +2210,7 @@ want to merge them back into the new files.""" % locals()
             source = 'if 1:\n%s' % source
 
         try:
-            code = self.compile(source,filename,symbol)
+            code = self.compile_cached(source,filename,symbol)
         except (OverflowError, SyntaxError, ValueError):
             # Case 1
             self.showsyntaxerror(filename)
@@ -2030,6 +2232,39 @@ want to merge them back into the new files.""" % locals()
         else:
             return None
 
+    def compile_cached(self,source,filename='<input>',symbol='single',
+                       interactive=True):
+        """Compile source, reusing the code object if it was seen recently.
+
+        With interactive set this is self.compile(), codeop's compiler for
+        interactive input which returns None for incomplete input and
+        remembers __future__ statements.  Otherwise it's the compile()
+        builtin.  Errors are raised as they are by those.
+
+        Recently compiled code is kept in self.code_cache (see %codecache),
+        keyed by the source, filename, symbol and the __future__ features in
+        effect, so running the same input again (macros, %rep, loops over
+        _ip.ex()...) skips the compiler."""
+
+        compiler = self.compile.compiler
+        key = (source,filename,symbol,interactive,compiler.flags)
+        cache = self.code_cache
+        entry = cache.get(key)
+        if entry is not None:
+            cache.hits += 1
+            code = entry[0]
+            if code is not None and interactive:
+                # as codeop does when it compiles a future statement
+                compiler.flags |= code.co_flags & future_flags
+            return code
+        cache.misses += 1
+        if interactive:
+            code = self.compile(source,filename,symbol)
+        else:
+            code = compile(source,filename,symbol)
+        cache.put(key,[code],len(source))
+        return code
+
     def runcode(self,code_obj):
         """Execute a code object.
 
@@ -2051,6 +2286,9 @@ want to merge them back into the new files.""" % locals()
         # code (such as magics) needs access to it.
         self.sys_excepthook = old_excepthook
         outflag = 1  # happens in more places, so it's easier as default
+        cellstats = self.cellstats
+        if cellstats is not None:
+            mark = cellstats.start()
         try:
             try:
                 # Embedded instances require separate global/local namespaces
@@ -2066,6 +2304,8 @@ want to merge them back into the new files.""" % locals()
             finally:
                 # Reset our crash handler in place
                 sys.excepthook = old_excepthook
+                if cellstats is not None:
+                    cellstats.stop(mark,self.outputcache.prompt_count)
         except SystemExit:
             self.resetbuffer()
             self.showtraceback()
@@ -2084,7 +2324,7 @@ want to merge them back into the new files.""" % locals()
         self.code_to_run = None
         return outflag
         
-    def push(self, line):
+    def push(self, line, state=None):
         """Push a line to the interpreter.
 
         The line should not have a trailing newline; it may have
@@ -2096,6 +2336,9 @@ want to merge them back into the new files.""" % locals()
         is left as it was after the line was appended.  The return
         value is 1 if more input is required, 0 if the line was dealt
         with in some way (this is the same as runsource()).
+
+        If a SourceState is given, it tracks the buffer and runsource()
+        is skipped while it says the source is incomplete.
         """
 
         # autoindent management should be done here, and not in the
@@ -2106,7 +2349,13 @@ want to merge them back into the new files.""" % locals()
         #print 'push line: <%s>' % line  # dbg
         for subline in line.splitlines():
             self.autoindent_update(subline)
+        if state is not None:
+            if not self.buffer:
+                state.reset()
+            state.feed(line)
         self.buffer.append(line)
+        if state is not None and state.incomplete():
+            return True
         more = self.runsource('\n'.join(self.buffer), self.filename)
         if not more:
             self.resetbuffer()
@@ -2140,12 +2389,20 @@ want to merge them back into the new files.""" % locals()
             self.set_completer()
         
         try:
-            line = raw_input_original(prompt).decode(self.stdin_encoding)
+            rawline = raw_input_original(prompt)
         except ValueError:
             warn("\n********\nYou or a %run:ed script called sys.stdin.close()"
                  " or sys.stdout.close()!\nExiting IPython!")
             self.exit_now = True
             return ""
+        line = rawline.decode(self.stdin_encoding)
+
+        # readline has added the line to its history, put it on disk too
+        if self.has_readline and line.strip():
+            try:
+                self.histjournal.append(rawline)
+            except (IOError, OSError):
+                pass
 
         # Try to be reasonably smart about not re-indenting pasted input more
         # than necessary.  We do this by trimming out the auto-indent initial
@@ -2477,6 +2734,7 @@ want to merge them back into the new files.""" % locals()
           - data(None): if data is given, it gets written out to the temp file
           immediately, and the file is closed again."""
 
+        import tempfile
         filename = tempfile.mktemp('.py','ipython_edit_')
         self.tempfiles.append(filename)
         
@@ -2505,6 +2763,147 @@ want to merge them back into the new files.""" % locals()
         else:
             self.exit_now = True
 
+    # log lines which must be run on their own: IPython syntax (translated
+    # to _ip calls) and future statements, which can't follow other code
+    log_special_re = re.compile(r'\b_ip\b|^\s*from\s+__future__\b',re.M)
+
+    def replay_log(self,fname,globs,locs,verbose=False,chunk_size=1000):
+        """Run the log file fname in the given namespaces.
+
+        The log is read chunk_size lines at a time, and each chunk is
+        compiled and run as a whole.  Blocks (a line and the indented lines
+        and else/elif/except/finally clauses following it) using IPython's
+        own syntax (magics, shell escapes...) are split out and run on their
+        own.  When a chunk fails to compile, its blocks are compiled one at
+        a time to find the bad one; when it raises an exception, the
+        offending block is found from the line number.  Either way the block
+        is recorded as bad, and the rest of the chunk carries on, as if the
+        blocks had been run one at a time.
+
+        Returns a list of the blocks which failed, the number of lines and
+        the number of chunks run."""
+
+        indent = re.compile('\s+\S').match
+        clause = re.compile(r'(else|elif|except|finally)\b').match
+        special = self.log_special_re.search
+        badblocks = []
+        nchunks = [0]
+
+        def starts_block(line):
+            """Can a block start at line?  Clauses belong to the one above."""
+            return not (indent(line) or clause(line))
+
+        def block_around(lines,i,first):
+            """Bounds of the block holding lines[i], not before lines[first]"""
+            i = max(first,min(i,len(lines)-1))
+            start = i
+            while start > first and not starts_block(lines[start]):
+                start -= 1
+            end = i+1
+            while end < len(lines) and not starts_block(lines[end]):
+                end += 1
+            return start,end
+
+        def bad_block(lines,first):
+            """Bounds of the first block from lines[first] on which doesn't
+            compile on its own, or None."""
+            start = first
+            while start < len(lines):
+                start,end = block_around(lines,start,start)
+                try:
+                    compile(''.join(lines[start:end]),fname,'exec')
+                except (SyntaxError,OverflowError,ValueError):
+                    return start,end
+                start = end
+            return None
+
+        def run(lines,lnum,report=True):
+            """Run lines, the first one being line lnum of the log."""
+            report = report and verbose
+            if report:
+                t = time.time()
+            todo = 0
+            while todo < len(lines):
+                nchunks[0] += 1
+                try:
+                    code = compile(''.join(lines[todo:]),fname,'exec')
+                except (SyntaxError,OverflowError,ValueError),e:
+                    # the error can be reported lines after the bad block
+                    # (an unclosed bracket swallows the lines after it)
+                    bad = bad_block(lines,todo)
+                    if bad is None:
+                        lineno = getattr(e,'lineno',None) or 1
+                        bad = block_around(lines,todo+lineno-1,todo)
+                    start,end = bad
+                    # the blocks before the bad one may be fine
+                    if start > todo:
+                        run(lines[todo:start],lnum+todo,False)
+                    badblocks.append(''.join(lines[start:end]).rstrip())
+                    todo = end
+                    continue
+                try:
+                    exec code in globs,locs
+                except:
+                    etype,value,tb = sys.exc_info()
+                    # find the line of the chunk which was running
+                    lineno = 1
+                    while tb is not None:
+                        if tb.tb_frame.f_code is code:
+                            lineno = tb.tb_lineno
+                            break
+                        tb = tb.tb_next
+                    tb = None
+                    start,end = block_around(lines,todo+lineno-1,todo)
+                    if etype is not SystemExit:
+                        badblocks.append(''.join(lines[start:end]).rstrip())
+                    todo = end
+                    continue
+                break
+            if report:
+                print >> Term.cout, '  lines %d-%d: %.3fs' % \
+                      (lnum,lnum+len(lines)-1,time.time()-t)
+
+        def run_split(lines,lnum):
+            """Run lines, giving blocks with IPython syntax their own run."""
+            start = 0
+            plain = 0
+            while start < len(lines):
+                end = start+1
+                while end < len(lines) and not starts_block(lines[end]):
+                    end += 1
+                if special(''.join(lines[start:end])):
+                    if start > plain:
+                        run(lines[plain:start],lnum+plain)
+                    run(lines[start:end],lnum+start)
+                    plain = end
+                start = end
+            if plain < len(lines):
+                run(lines[plain:],lnum+plain)
+
+        xfile = LogReader(fname)
+        lines = []
+        lnum = 1
+        try:
+            for line in xfile:
+                lines.append(line)
+                if len(lines) <= chunk_size or not starts_block(line):
+                    continue
+                # a new block starts here, run everything before it
+                chunk = lines[:-1]
+                if special(''.join(chunk)):
+                    run_split(chunk,lnum)
+                else:
+                    run(chunk,lnum)
+                lnum += len(chunk)
+                lines = lines[-1:]
+            if lines:
+                if not lines[-1].endswith('\n'):
+                    lines[-1] += '\n'
+                run_split(lines,lnum)
+        finally:
+            xfile.close()
+        return badblocks,lnum+len(lines)-1,nchunks[0]
+
     def safe_execfile(self,fname,*where,**kw):
         """A safe version of the builtin execfile().
 
@@ -2525,6 +2924,13 @@ want to merge them back into the new files.""" % locals()
           quiet : boolean (True)
 
           exit_ignore : boolean (False)
+
+          verbose : boolean (False)
+            When replaying a log, report the time taken by each chunk.
+
+          bytecache : boolean (False)
+            Take the compiled code from (and save it to) the bytecode cache
+            in the ipythondir instead of compiling the file every time.
           """
 
         def syspath_cleanup():
@@ -2548,7 +2954,12 @@ want to merge them back into the new files.""" % locals()
             add_dname = True
 
         try:
-            xfile = open(fname)
+            if kw.get('islog'):
+                # logs may be rotated into several files
+                xfile = LogReader(fname)
+            else:
+                # a name.<n> next to a script isn't part of it
+                xfile = log_open(fname)
         except:
             print >> Term.cerr, \
                   'Could not open file <%s> for safe execution.' % fname
@@ -2558,68 +2969,34 @@ want to merge them back into the new files.""" % locals()
         kw.setdefault('islog',0)
         kw.setdefault('quiet',1)
         kw.setdefault('exit_ignore',0)
+        kw.setdefault('verbose',0)
+        kw.setdefault('bytecache',0)
         
+        try:
+            globs,locs = where[0:2]
+        except:
+            try:
+                globs = locs = where[0]
+            except:
+                globs = locs = globals()
+
         first = xfile.readline()
         loghead = str(self.loghead_tpl).split('\n',1)[0].strip()
         xfile.close()
         # line by line execution
         if first.startswith(loghead) or kw['islog']:
-            print 'Loading log file <%s> one line at a time...' % fname
+            print 'Loading log file <%s>...' % fname
             if kw['quiet']:
                 stdout_save = sys.stdout
                 sys.stdout = StringIO.StringIO()
-            try:
-                globs,locs = where[0:2]
-            except:
-                try:
-                    globs = locs = where[0]
-                except:
-                    globs = locs = globals()
-            badblocks = []
-
-            # we also need to identify indented blocks of code when replaying
-            # logs and put them together before passing them to an exec
-            # statement. This takes a bit of regexp and look-ahead work in the
-            # file. It's easiest if we swallow the whole thing in memory
-            # first, and manually walk through the lines list moving the
-            # counter ourselves.
-            indent_re = re.compile('\s+\S')
-            xfile = open(fname)
-            filelines = xfile.readlines()
-            xfile.close()
-            nlines = len(filelines)
-            lnum = 0
-            while lnum < nlines:
-                line = filelines[lnum]
-                lnum += 1
-                # don't re-insert logger status info into cache
-                if line.startswith('#log#'):
-                    continue
-                else:
-                    # build a block of code (maybe a single line) for execution
-                    block = line
-                    try:
-                        next = filelines[lnum] # lnum has already incremented
-                    except:
-                        next = None
-                    while next and indent_re.match(next):
-                        block += next
-                        lnum += 1
-                        try:
-                            next = filelines[lnum]
-                        except:
-                            next = None
-                    # now execute the block of one or more lines
-                    try:
-                        exec block in globs,locs
-                    except SystemExit:
-                        pass
-                    except:
-                        badblocks.append(block.rstrip())
+            t0 = time.time()
+            badblocks, nlines, nchunks = self.replay_log(fname,globs,locs,
+                                                         kw['verbose'])
             if kw['quiet']:  # restore stdout
                 sys.stdout.close()
                 sys.stdout = stdout_save
-            print 'Finished replaying log file <%s>' % fname
+            print 'Finished replaying log file <%s>: %d lines in %d '\
+                  'chunks, %.2fs' % (fname,nlines,nchunks,time.time()-t0)
             if badblocks:
                 print >> sys.stderr, ('\nThe following lines/blocks in file '
                                       '<%s> reported errors:' % fname)
@@ -2628,18 +3005,13 @@ want to merge them back into the new files.""" % locals()
                     print >> sys.stderr, badline
         else:  # regular file execution
             try:
-                if sys.platform == 'win32' and sys.version_info < (2,5,1):
+                if kw['bytecache']:
+                    exec self.bytecache.compile(fname) in globs,locs
+                elif sys.platform == 'win32' and sys.version_info < (2,5,1):
                     # Work around a bug in Python for Windows.  The bug was
                     # fixed in in Python 2.5 r54159 and 54158, but that's still
                     # SVN Python as of March/07.  For details, see:
                     # http://projects.scipy.org/ipython/ipython/ticket/123
-                    try:
-                        globs,locs = where[0:2]
-                    except:
-                        try:
-                            globs = locs = where[0]
-                        except:
-                            globs = locs = globals()
                     exec file(fname) in globs,locs
                 else:
                     execfile(fname,*where)
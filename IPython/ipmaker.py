@@ -50,10 +50,11 @@ import types
 from pprint import pprint,pformat
 
 # Our own
-from IPython import DPyGetOpt
+from IPython import DPyGetOpt, startuptime
 from IPython.ipstruct import Struct
 from IPython.OutputTrap import OutputTrap
-from IPython.ConfigLoader import ConfigLoader
+from IPython.Logger import LogReader
+from IPython.ConfigLoader import ConfigLoader, CachedConfigLoader
 from IPython.iplib import InteractiveShell
 from IPython.usage import cmd_line_usage,interactive_usage
 from IPython.genutils import *
@@ -83,6 +84,11 @@ def make_IPython(argv=None,user_ns=None,user_global_ns=None,debug=1,
     if argv is None:
         argv = sys.argv
 
+    if startuptime.requested(argv):
+        # embedded instances get here without going through IPython/__init__
+        startuptime.start()
+    startuptime.mark('import IPython')
+
     # __IP is the main global that lives throughout and represents the whole
     # application. If the user redefines it, all bets are off as to what
     # happens.
@@ -93,6 +99,7 @@ def make_IPython(argv=None,user_ns=None,user_global_ns=None,debug=1,
 
     IP = shell_class('__IP',user_ns=user_ns,user_global_ns=user_global_ns,
                      embedded=embedded,**kw)
+    startuptime.mark('shell construction')
 
     # Put 'help' in the user namespace
     from site import _Helper
@@ -157,7 +164,9 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
 
     # Make sure there's a space before each end of line (they get auto-joined!)
     cmdline_opts = ('autocall=i autoindent! automagic! banner! cache_size|cs=i '
-                    'c=s classic|cl color_info! colors=s confirm_exit! '
+                    'cell_stats=i '
+                    'c=s classic|cl color_info! colors=s confirm_exit! db_backend=s '
+                    'db_writeback=i '
                     'debug! deep_reload! editor=s log|l messages! nosep '
                     'object_info_string_level=i pdb! '
                     'pprint! prompt_in1|pi1=s prompt_in2|pi2=s prompt_out|po=s '
@@ -165,7 +174,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
                     'pylab_import_all! '
                     'quick screen_length|sl=i prompts_pad_left=i '
                     'logfile|lf=s logplay|lp=s profile|p=s '
-                    'readline! readline_merge_completions! '
+                    'readline! readline_merge_completions! run_bytecache! '
                     'readline_omit__names! '
                     'rcfile=s separate_in|si=s separate_out|so=s '
                     'separate_out2|so2=s xmode=s wildcards_case_sensitive! '
@@ -179,7 +188,8 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
     # The "ignore" option is a kludge so that Emacs buffers don't crash, since
     # the 'C-c !' command in emacs automatically appends a -i option at the end.
     cmdline_only = ('help interact|i ipythondir=s Version upgrade '
-                    'gthread! qthread! q4thread! wthread! tkthread! pylab! tk!')
+                    'gthread! qthread! q4thread! wthread! tkthread! pylab! tk! '
+                    'startup_profile configcache!')
 
     # Build the actual name list to be used by DPyGetOpt
     opts_names = qw(cmdline_opts) + qw(cmdline_only)
@@ -194,10 +204,14 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
                       banner = 1,
                       c = '',
                       cache_size = 1000,
+                      cell_stats = 0,
                       classic = 0,
                       color_info = 0,
                       colors = 'NoColor',
+                      configcache = 1,
                       confirm_exit = 1,
+                      db_backend = 'dir',
+                      db_writeback = 0,
                       debug = 0,
                       deep_reload = 0,
                       editor = '0',
@@ -221,6 +235,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
                       prompts_pad_left = 1,
                       pylab = 0,
                       pylab_import_all = 1,
+                      startup_profile = 0,
                       q4thread = 0,
                       qthread = 0,
                       quick = 0,
@@ -229,6 +244,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
                       readline = 1,
                       readline_merge_completions = 1,
                       readline_omit__names = 0,
+                      run_bytecache = 1,
                       screen_length = 0,
                       separate_in = '\n',
                       separate_out = '\n',
@@ -316,6 +332,12 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
     # we make all decisions:
     opts_all.update(opts)
 
+    # startuptime.requested() could only guess, the parsed option decides
+    if opts_all.startup_profile:
+        startuptime.start()
+    else:
+        startuptime.finish()
+
     # Options that force an immediate exit
     if opts_all.help:
         page(cmd_line_usage)
@@ -345,6 +367,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
     # check mutually exclusive options in the *original* command line
     mutex_opts(opts,[qw('log logfile'),qw('rcfile profile'),
                      qw('classic profile'),qw('classic rcfile')])
+    startuptime.mark('command line')
 
     #---------------------------------------------------------------------------
     # Log replay
@@ -361,7 +384,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
         load_logplay = opts_all.logplay 
         opts_debug_save = opts_all.debug
         try:
-            logplay = open(opts_all.logplay)
+            logplay = LogReader(opts_all.logplay)
         except IOError:
             if opts_all.debug: IP.InteractiveTB()
             warn('Could not open logplay file '+`opts_all.logplay`)
@@ -447,7 +470,11 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
         print 'Launching IPython in quick mode. No config file read.'
     elif opts_all.rcfile:
         try:
-            cfg_loader = ConfigLoader(conflict)
+            if opts_all.configcache:
+                cfg_loader = CachedConfigLoader(
+                    os.path.join(opts_all.ipythondir,'rccache'),conflict)
+            else:
+                cfg_loader = ConfigLoader(conflict)
             rcfiledata = cfg_loader.load(opts_all.rcfile,typeconv,
                                          'include',opts_all.ipythondir,
                                          purge = 1,
@@ -462,6 +489,8 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
              'or in the IPython config. directory: '+`opts_all.ipythondir`+
              '\nProceeding with internal defaults.')
 
+    startuptime.mark('ipythonrc files')
+
     #------------------------------------------------------------------------
     # Set exception handlers in mode requested by user.
     otrap = OutputTrap(trap_out=1)  # trap messages from magic_xmode
@@ -572,6 +601,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
     IP.internal_ns.update(__main__.__dict__)
 
     #IP.internal_ns.update(locals()) # so our stuff doesn't show up in %who
+    startuptime.mark('pre-config initialization')
 
     # Now run through the different sections of the users's config
     if IP_rc.debug:    
@@ -619,6 +649,8 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
         else:
             IP.safe_execfile(os.path.expanduser(file),IP.user_ns)
 
+    startuptime.mark('ipythonrc imports and code')
+
     # finally, try importing ipy_*_conf for final configuration
     try:
         import ipy_system_conf
@@ -628,6 +660,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
     except:
         IP.InteractiveTB()
         import_fail_info('ipy_system_conf')
+    startuptime.mark('ipy_system_conf')
         
     # only import prof module if ipythonrc-PROF was not found
     if opts_all.profile and not profile_handled_by_legacy:
@@ -640,6 +673,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
             import_fail_info(profmodname)
     else:
         import ipy_profile_none
+    startuptime.mark('profile')
     try:    
         import ipy_user_conf
         
@@ -650,6 +684,7 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
             warn(conf + ' does not exist, please run %upgrade!')
 
         import_fail_info("ipy_user_conf")
+    startuptime.mark('ipy_user_conf')
 
     # finally, push the argv to options again to ensure highest priority
     IP_rc.update(opts)
@@ -757,9 +792,15 @@ object?   -> Details about 'object'. ?object also works, ?? prints more.
     # Final banner is a string
     IP.BANNER = '\n'.join(BANN_P)
 
+    startuptime.mark('command line scripts and log replay')
+
     # Finalize the IPython instance.  This assumes the rc structure is fully
     # in place.
     IP.post_config_initialization()
+    startuptime.mark('post-config initialization')
+
+    if IP_rc.startup_profile:
+        print '\n'.join(startuptime.finish() or [])
 
     return IP
 #************************ end of file <ipmaker.py> **************************
@@ -37,7 +37,13 @@ class Macro(IPyAutocall):
     def __call__(self,*args):
         Term.cout.flush()
         self._ip.user_ns['_margv'] = args
-        self._ip.runlines(self.value)
+        # what _ip.runlines() would do, but the cleaned up script is kept
+        # for the next call; the compiled code is cached by runsource()
+        script = getattr(self,'_script',None)
+        if script is None or script[0] is not self.value:
+            script = self._script = (self.value,
+                                     IPython.ipapi.cleanup_ipy_script(self.value))
+        self._ip.IP.runlines(script[1])
     
     def __getstate__(self):
         """ needed for safe pickling via %store """
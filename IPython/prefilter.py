@@ -92,7 +92,7 @@ def splitUserInput(line, pattern=None):
         except ValueError:
             #print "split failed for line '%s'" % line
             iFun,theRest = line,''
-        pre = re.match('^(\s*)(.*)',line).groups()[0]
+        pre = leading_space.match(line).group()
     else:
         pre,iFun,theRest = match.groups()
 
@@ -130,10 +130,111 @@ line_split = re.compile(r'^([,;/%?]|!!?|\s*)'
 
 shell_line_split = re.compile(r'^(\s*)(\S*\s*)(.*$)')
 
+# The indentation, for lines line_split doesn't match
+leading_space = re.compile(r'\s*')
+
 def prefilter(line_info, ip):
     """Call one of the passed-in InteractiveShell's handler preprocessors,
     depending on the form of the line.  Return the results, which must be a
     value, even if it's a blank ('')."""
+    handler = classify(line_info, ip)
+    if handler:
+        return handler(line_info)
+    return ip.handle_normal(line_info)
+
+# Sentinel for the namespace lookups of classify()
+_missing = object()
+
+def classify(line_info, ip):
+    """Return the handler (a bound method of ip) for line_info, or None if the
+    line is plain Python, for handle_normal.
+
+    This gives the same answer as running the check* functions below in
+    order (see classify_by_checks), in one pass: each namespace and table is
+    looked up at most once per line, and lines whose first word can't be
+    autocalled don't go through ofind at all."""
+    line = line_info.line
+    iFun = line_info.iFun
+    preChar = line_info.preChar
+    continue_prompt = line_info.continue_prompt
+
+    # checkEmacs, checkShellEscape
+    if line.endswith('# PYTHON-MODE'):
+        return ip.handle_emacs
+    if line.startswith(ip.ESC_SHELL,len(line_info.preWhitespace)):
+        return ip.handle_shell_escape
+
+    # checkIPyAutocall
+    user_ns = ip.user_ns
+    obj = user_ns.get(iFun,_missing)
+    if obj is not _missing and isinstance(obj,IPython.ipapi.IPyAutocall):
+        obj.set_ip(ip.api)
+        return ip.handle_auto
+
+    # checkMultiLineMagic, checkEscChars
+    rc = ip.rc
+    if continue_prompt and rc.multi_line_specials \
+           and iFun.startswith(ip.ESC_MAGIC):
+        return ip.handle_magic
+    if line[-1:] == ip.ESC_HELP and preChar != ip.ESC_SHELL \
+           and preChar != ip.ESC_SH_CAP:
+        return ip.handle_help
+    if preChar and preChar in ip.esc_handlers:
+        return ip.esc_handlers[preChar]
+
+    # checkAssignment: the fast path for most plain Python
+    rest = line_info.theRest
+    first = rest[:1]
+    if first and first in '=,':
+        return None
+
+    # checkAutomagic, checkAlias
+    dotted = '.' in iFun
+    if dotted:
+        head = iFun.split('.',1)[0]
+        head_obj = user_ns.get(head,_missing)
+    else:
+        head = iFun
+        head_obj = obj
+    alias_table = ip.alias_table
+    is_magic = rc.automagic and hasattr(ip,'magic_'+iFun) and \
+               not (continue_prompt and not rc.multi_line_specials)
+    is_alias = iFun in alias_table and (not dotted or head in alias_table)
+    if is_magic or is_alias:
+        if not (head_obj is not _missing or head in ip.internal_ns
+                or head in ip.ns_table['builtin']):
+            if is_magic:
+                return ip.handle_magic
+            return ip.handle_alias
+
+    # checkPythonOps, checkAutocall
+    if first and first in '!=()<>,+*/%^&|':
+        return None
+    if not rc.autocall or not re_fun_name.match(iFun) \
+           or re_exclude_auto.match(rest):
+        return None
+    if dotted:
+        # needs the attribute walk
+        oinfo = line_info.ofind(ip)
+        if oinfo['found'] and callable(oinfo['obj']):
+            return ip.handle_auto
+        return None
+    # what ofind would find for a plain name, in the same order
+    if obj is _missing:
+        obj = ip.internal_ns.get(iFun,_missing)
+        if obj is _missing:
+            obj = ip.ns_table['builtin'].get(iFun,_missing)
+            if obj is _missing:
+                obj = alias_table.get(iFun,_missing)
+                if obj is _missing:
+                    obj = getattr(ip,'magic_'+iFun,_missing)
+    if obj is not _missing and callable(obj):
+        return ip.handle_auto
+    return None
+
+def classify_by_checks(line_info, ip):
+    """Return the handler for line_info like classify(), by running the
+    check* functions in turn (slower, but each rule on its own)."""
     # Note: the order of these checks does matter. 
     for check in [ checkEmacs,
                    checkShellEscape,
@@ -148,9 +249,8 @@ def prefilter(line_info, ip):
                    ]:
         handler = check(line_info, ip)
         if handler:
-            return handler(line_info)
-
-    return ip.handle_normal(line_info)
+            return handler
+    return None
 
 # Handler checks
 #
@@ -163,6 +263,10 @@ def prefilter(line_info, ip):
 # In general, these checks should only take responsibility for their 'own'
 # handler.  If it doesn't get triggered, they should just return None and
 # let the rest of the check sequence run.
+#
+# prefilter() itself uses classify(), which folds them into a single pass:
+# a change to one of them has to be made there too (test_prefilter.py checks
+# that both agree).
 
 def checkShellEscape(l_info,ip):
     if l_info.line.lstrip().startswith(ip.ESC_SHELL):
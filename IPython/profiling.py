@@ -0,0 +1,926 @@
+# -*- coding: utf-8 -*-
+"""Helpers for the profiling magics (%prun, %run -p, %prundiff, %sprun,
+%lprun, %memit, %timeit).
+
+The functions working on pstats.Stats objects don't care whether the profile
+was made with cProfile or with the pure python profile module.
+"""
+
+#*****************************************************************************
+#       Copyright (C) 2001-2006 Fernando Perez <fperez@colorado.edu>
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#*****************************************************************************
+
+import cPickle as pickle
+import gc
+import inspect
+import linecache
+import math
+import os
+import signal
+import sys
+import thread
+import threading
+import time
+import traceback
+import types
+import weakref
+
+try:
+    import pstats
+except ImportError:
+    # see the note on Debian in Magic.py
+    pstats = None
+
+try:
+    import resource
+except ImportError:
+    # not on Windows
+    resource = None
+
+def func_label(func):
+    """Short name for a pstats function key (filename,lineno,name)."""
+    fname,line,name = func
+    if fname == '~':
+        # builtins and C methods
+        return name
+    return '%s:%d(%s)' % (os.path.basename(fname),line,name)
+
+def write_callgrind(stats,fname):
+    """Save a pstats.Stats object in callgrind format.
+
+    The file can be opened with KCachegrind or any other tool that reads
+    callgrind profiles.  Times are written in microseconds."""
+
+    # pstats only knows the callers of each function, callgrind wants the
+    # callees
+    callees = {}
+    for func,(cc,nc,tt,ct,callers) in stats.stats.items():
+        for caller,info in callers.items():
+            if isinstance(info,tuple):
+                # cProfile: (nc,cc,tt,ct) for the calls from this caller
+                ncalls,cumtime = info[0],info[3]
+            else:
+                # profile: just the call count, share the cumulative time
+                ncalls,cumtime = info,ct*info/max(nc,1)
+            callees.setdefault(caller,[]).append((func,ncalls,cumtime))
+
+    usec = lambda t: int(round(t*1e6))
+    out = open(fname,'w')
+    try:
+        out.write('version: 1\ncreator: IPython\n')
+        out.write('events: Microseconds\n')
+        out.write('summary: %d\n' % usec(stats.total_tt))
+        for func,(cc,nc,tt,ct,callers) in stats.stats.items():
+            filename,line,name = func
+            out.write('\nfl=%s\nfn=%s\n' % (filename,func_label(func)))
+            out.write('%d %d\n' % (line,usec(tt)))
+            for callee,ncalls,cumtime in callees.get(func,[]):
+                out.write('cfl=%s\ncfn=%s\n' % (callee[0],func_label(callee)))
+                out.write('calls=%d %d\n' % (ncalls,callee[1]))
+                out.write('%d %d\n' % (line,usec(cumtime)))
+    finally:
+        out.close()
+
+def accumulate(stats,fname):
+    """Add the profile saved in fname to stats and save the total back.
+
+    If fname doesn't exist it is created with just stats.  stats (a
+    pstats.Stats object) is updated in place and returned."""
+
+    if os.path.exists(fname):
+        stats.add(fname)
+    stats.dump_stats(fname)
+    return stats
+
+# sort keys for diff_stats: index in the pstats tuple (cc,nc,tt,ct)
+diff_keys = {'calls'      : 1,
+             'ncalls'     : 1,
+             'time'       : 2,
+             'tottime'    : 2,
+             'cumulative' : 3,
+             'cumtime'    : 3,
+             }
+
+def diff_stats(old,new,key='time',limit=None):
+    """Compare two profiles, function by function.
+
+    old and new are pstats.Stats objects (or anything pstats.Stats accepts,
+    such as the name of a file saved with %prun -D).  Returns the report as a
+    list of lines, with the functions whose 'key' changed the most (in
+    absolute value) first.  key is one of the names in diff_keys; limit works
+    like the %prun -l option (an int, a float fraction or a string to match).
+    """
+
+    if key not in diff_keys:
+        raise ValueError('unknown sort key %r, use one of: %s' %
+                         (key,', '.join(sorted(diff_keys))))
+    idx = diff_keys[key]
+    if not isinstance(old,pstats.Stats):
+        old = pstats.Stats(old)
+    if not isinstance(new,pstats.Stats):
+        new = pstats.Stats(new)
+
+    zero = (0,0,0.0,0.0)
+    rows = []
+    for func in set(old.stats) | set(new.stats):
+        a = old.stats.get(func,zero)
+        b = new.stats.get(func,zero)
+        rows.append((abs(b[idx]-a[idx]),func,a,b))
+    rows.sort(key=lambda r: (-r[0],func_label(r[1])))
+
+    if isinstance(limit,basestring):
+        rows = [r for r in rows if limit in func_label(r[1])]
+    elif isinstance(limit,float):
+        rows = rows[:int(len(rows)*limit+0.5)]
+    elif limit is not None:
+        rows = rows[:limit]
+
+    lines = ['Total time: %.3fs -> %.3fs (%+.3fs)' %
+             (old.total_tt,new.total_tt,new.total_tt-old.total_tt),
+             '',
+             '%17s %19s %19s  %s' % ('ncalls old/new','tottime old/new',
+                                     'cumtime old/new',
+                                     'filename:lineno(function)')]
+    for delta,func,a,b in rows:
+        lines.append('%8d %8d %9.3f %9.3f %9.3f %9.3f  %s' %
+                     (a[1],b[1],a[2],b[2],a[3],b[3],func_label(func)))
+    return lines
+
+class Sampler:
+    """Statistical profiler.
+
+    Instead of tracing every call like profile/cProfile, look at the stack of
+    the profiled code every 'interval' seconds and count what is running.  The
+    overhead doesn't depend on how many calls the code makes (at the default
+    100 samples per second it is well below 1%), at the price of only being
+    statistically accurate: functions that run for less than a few intervals
+    in total may not show up at all.
+
+    In the main thread of a platform with signal.setitimer(), sampling is
+    driven by SIGPROF and counts CPU time.  Elsewhere (other threads, Windows)
+    or for sample_thread(), a helper thread looks at the stack at regular
+    intervals of wall clock time.  That thread only gets to run when the
+    profiled one releases the GIL, so time spent in long C calls (that keep
+    the GIL) is charged to the python code that runs next.
+
+    Samples are kept per distinct stack, as a dict mapping tuples of code
+    objects (outermost call first) to counts; the report methods aggregate
+    them."""
+
+    def __init__(self,interval=0.01):
+        self.interval = interval
+        self.stacks = {}
+        self.nsamples = 0
+        self.mode = None
+        # frame above the profiled code, stacks are cut there
+        self._base = None
+
+    def _sample(self,frame):
+        stack = []
+        base = self._base
+        while frame is not None and frame is not base:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        stack = tuple(stack)
+        self.stacks[stack] = self.stacks.get(stack,0) + 1
+        self.nsamples += 1
+
+    def _handler(self,signum,frame):
+        self._sample(frame)
+
+    def runcall(self,func,*args,**kw):
+        """Call func(*args,**kw) while sampling it, return its result."""
+        self._base = sys._getframe()
+        if hasattr(signal,'setitimer') and \
+               threading.currentThread().getName() == 'MainThread':
+            self.mode = 'cpu'
+            old = signal.signal(signal.SIGPROF,self._handler)
+            signal.setitimer(signal.ITIMER_PROF,self.interval,self.interval)
+            try:
+                return func(*args,**kw)
+            finally:
+                signal.setitimer(signal.ITIMER_PROF,0,0)
+                signal.signal(signal.SIGPROF,old)
+        else:
+            self.mode = 'wall'
+            done = threading.Event()
+            sampler = threading.Thread(target=self._sample_loop,
+                                       args=(thread.get_ident(),done))
+            sampler.setDaemon(True)
+            sampler.start()
+            try:
+                return func(*args,**kw)
+            finally:
+                done.set()
+                sampler.join()
+
+    def runctx(self,cmd,globs,locs):
+        """Execute cmd (a string or code object) while sampling it."""
+        self.runcall(_run_code,cmd,globs,locs)
+
+    def sample_thread(self,thread_id,duration=None):
+        """Sample another thread from this one, in wall clock time.
+
+        Stops when the thread ends or after duration seconds, if given.
+        KeyboardInterrupt just stops the sampling."""
+        self.mode = 'wall'
+        self._base = None
+        done = threading.Event()
+        if duration is not None:
+            timer = threading.Timer(duration,done.set)
+            timer.setDaemon(True)
+            timer.start()
+        try:
+            self._sample_loop(thread_id,done)
+        except KeyboardInterrupt:
+            pass
+        done.set()
+
+    def _sample_loop(self,thread_id,done):
+        while not done.isSet():
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            self._sample(frame)
+            del frame
+            done.wait(self.interval)
+
+    def _runner_frames(self,stack):
+        """Drop the frame of our own exec helper from a stack."""
+        if stack and stack[0] is _run_code.func_code:
+            return stack[1:]
+        return stack
+
+    def counts(self):
+        """Return two dicts: samples in each function itself, and samples
+        with the function anywhere on the stack (each function is counted
+        once per sample, however deep the recursion)."""
+        own = {}
+        cum = {}
+        for stack,n in self.stacks.items():
+            stack = self._runner_frames(stack)
+            if not stack:
+                continue
+            func = code_key(stack[-1])
+            own[func] = own.get(func,0) + n
+            for func in set([code_key(c) for c in stack]):
+                cum[func] = cum.get(func,0) + n
+        return own,cum
+
+    def report(self,sort='self',limit=None):
+        """Return a table of the top functions, like %prun's, as a list of
+        lines.  sort is 'self' or 'cumulative'; limit works like %prun -l."""
+        own,cum = self.counts()
+        total = max(self.nsamples,1)
+        if sort.startswith('c'):
+            order = cum
+            sortname = 'cumulative samples'
+        else:
+            order = own
+            sortname = 'samples in the function itself'
+        funcs = cum.keys()
+        funcs.sort(key=lambda f: (-order.get(f,0),func_label(f)))
+        nfuncs = len(funcs)
+        if isinstance(limit,basestring):
+            funcs = [f for f in funcs if limit in func_label(f)]
+        elif isinstance(limit,float):
+            funcs = funcs[:int(len(funcs)*limit+0.5)]
+        elif limit is not None:
+            funcs = funcs[:limit]
+        what = {'cpu' : 'CPU', 'wall' : 'wall clock'}.get(self.mode,'')
+        lines = ['%9d samples, every %gs of %s time (~%.2fs)' %
+                 (self.nsamples,self.interval,what,
+                  self.nsamples*self.interval),
+                 '',
+                 '   Ordered by: %s' % sortname]
+        if len(funcs) < nfuncs:
+            lines.append('   List reduced from %d to %d due to restriction '
+                         '<%s>' % (nfuncs,len(funcs),limit))
+        lines.extend(['',
+                      '  samples    self%  cumsamp     cum%  '
+                      'filename:lineno(function)'])
+        for f in funcs:
+            n,c = own.get(f,0),cum.get(f,0)
+            lines.append('%9d %7.2f%% %8d %7.2f%%  %s' %
+                         (n,100.0*n/total,c,100.0*c/total,func_label(f)))
+        return lines
+
+    def tree(self,threshold=0.01):
+        """Return the call tree as a list of indented lines.
+
+        Branches with less than 'threshold' of the samples are left out."""
+        root = {}
+        for stack,n in self.stacks.items():
+            node = root
+            for code in self._runner_frames(stack):
+                entry = node.setdefault(code_key(code),[0,{}])
+                entry[0] += n
+                node = entry[1]
+        total = max(self.nsamples,1)
+        lines = []
+        def walk(node,depth):
+            items = node.items()
+            items.sort(key=lambda i: -i[1][0])
+            for func,(n,children) in items:
+                if float(n)/total < threshold:
+                    continue
+                lines.append('%6.2f%% %s%s' % (100.0*n/total,'  '*depth,
+                                               func_label(func)))
+                walk(children,depth+1)
+        walk(root,0)
+        return lines
+
+    def write_collapsed(self,fname):
+        """Save the samples as collapsed stacks ('f1;f2;f3 count' lines),
+        the input format of flamegraph.pl and similar tools."""
+        out = open(fname,'w')
+        try:
+            for stack,n in self.stacks.items():
+                stack = self._runner_frames(stack)
+                if stack:
+                    out.write('%s %d\n' % (';'.join([func_label(code_key(c))
+                                                     for c in stack]),n))
+        finally:
+            out.close()
+
+def _run_code(cmd,globs,locs):
+    exec cmd in globs,locs
+
+def code_key(code):
+    """pstats style (filename,lineno,name) key for a code object."""
+    return (code.co_filename,code.co_firstlineno,code.co_name)
+
+class LineProfiler:
+    """Deterministic profiler for individual lines of chosen functions.
+
+    Only the code objects given to add_function() are traced line by line
+    (with sys.settrace, in the calling thread), every other call just costs
+    the check of its code object.  For each line, the number of times it ran
+    and the total time spent on it (including the calls it made) are kept in
+    self.timings, a dict {code: {lineno: [hits,time]}}."""
+
+    def __init__(self,timer=time.time):
+        self.timer = timer
+        self.codes = {}
+        self.timings = {}
+
+    def add_function(self,func):
+        """Trace the lines of func (a function, method or code object)."""
+        func = getattr(func,'im_func',func)
+        code = getattr(func,'func_code',func)
+        if not isinstance(code,types.CodeType):
+            raise TypeError('%r is not a python function' % (func,))
+        self.codes[code] = None
+        self.timings.setdefault(code,{})
+
+    def _trace(self,frame,event,arg):
+        if event == 'call' and frame.f_code in self.codes:
+            return self._line_tracer(self.timings[frame.f_code])
+        return None
+
+    def _line_tracer(self,timings):
+        # one tracer per call, keeping the line being run and its start time
+        timer = self.timer
+        state = [None,0.0]
+        def trace(frame,event,arg):
+            if event == 'exception':
+                # the line isn't done yet: the next 'line' (handler) or
+                # 'return' event ends it
+                return trace
+            now = timer()
+            last = state[0]
+            if last is not None:
+                entry = timings.get(last)
+                if entry is None:
+                    entry = timings[last] = [0,0.0]
+                entry[0] += 1
+                entry[1] += now - state[1]
+            if event == 'line':
+                state[0] = frame.f_lineno
+                state[1] = timer()
+            else:
+                state[0] = None
+            return trace
+        return trace
+
+    def runcall(self,func,*args,**kw):
+        """Call func(*args,**kw) while tracing, return its result."""
+        old = sys.gettrace()
+        sys.settrace(self._trace)
+        try:
+            return func(*args,**kw)
+        finally:
+            sys.settrace(old)
+
+    def runctx(self,cmd,globs,locs):
+        """Execute cmd (a string or code object) while tracing."""
+        self.runcall(_run_code,cmd,globs,locs)
+
+    def results(self):
+        """Return the timings keyed by (filename,lineno,name) instead of
+        code objects, as {key: {lineno: (hits,time)}}."""
+        res = {}
+        for code,lines in self.timings.items():
+            res[code_key(code)] = dict([(l,tuple(v))
+                                        for l,v in lines.items()])
+        return res
+
+    def save(self,fname):
+        """Save the results to a file, for load_line_results()."""
+        out = open(fname,'wb')
+        try:
+            pickle.dump(self.results(),out,2)
+        finally:
+            out.close()
+
+    def listing(self,baseline=None,colorize=None):
+        """Return an annotated listing of every traced function, as a list
+        of lines.
+
+        baseline is a results() dict (for example from a file saved in an
+        earlier run) to show the times of next to the current ones.
+        colorize, if given, is called on the source of each function and
+        should return it colored (with the same lines)."""
+
+        lines = []
+        for code in self.codes:
+            key = code_key(code)
+            timings = self.timings.get(code,{})
+            old = None
+            if baseline is not None:
+                old = baseline.get(key)
+            lines.extend(self._listing(key,timings,old,colorize))
+        return lines
+
+    def _listing(self,key,timings,old,colorize):
+        filename,first,name = key
+        total = sum([t for h,t in timings.values()])
+        lines = ['','Function: %s at line %d of %s' % (name,first,filename),
+                 'Total time: %g s' % total]
+        if old is not None:
+            old_total = sum([t for h,t in old.values()])
+            lines[-1] += ' (was %g s)' % old_total
+        src = linecache.getlines(filename)
+        if src:
+            source = ''.join(inspect.getblock(src[first-1:]))
+            if colorize is not None:
+                source = colorize(source)
+            source = source.rstrip('\n').split('\n')
+        else:
+            # typed at the prompt: just the lines that ran, without text
+            linenos = timings.keys()
+            if old is not None:
+                linenos += old.keys()
+            source = [''] * (max(linenos + [first]) - first + 1)
+            lines.append('(source not available)')
+
+        head = '%6s %9s %12s %10s %7s' % ('Line #','Hits','Time (us)',
+                                          'Per hit','% Time')
+        if old is not None:
+            head += ' %12s %7s' % ('Was (us)','Change')
+        lines.extend(['',head + '  Line contents','=' * (len(head)+15)])
+        for i,text in enumerate(source):
+            lineno = first + i
+            hits,t = timings.get(lineno,(0,0.0))
+            if not (text or hits or (old and lineno in old)):
+                continue
+            if hits:
+                row = '%6d %9d %12.1f %10.1f %6.1f%%' % \
+                      (lineno,hits,t*1e6,t*1e6/hits,100.0*t/max(total,1e-12))
+            else:
+                row = '%6d %9s %12s %10s %7s' % (lineno,'','','','')
+            if old is not None:
+                ohits,ot = old.get(lineno,(0,0.0))
+                if ohits and hits:
+                    row += ' %12.1f %+6.0f%%' % (ot*1e6,
+                                                 100.0*(t-ot)/max(ot,1e-12))
+                elif ohits:
+                    row += ' %12.1f %7s' % (ot*1e6,'')
+                else:
+                    row += ' %12s %7s' % ('','')
+            lines.append(row + '  ' + text)
+        return lines
+
+def load_line_results(fname):
+    """Load the results saved by LineProfiler.save()."""
+    f = open(fname,'rb')
+    try:
+        return pickle.load(f)
+    finally:
+        f.close()
+
+#-----------------------------------------------------------------------------
+# Memory usage, for %memit
+
+def memory_usage():
+    """Return (rss,peak): current and peak resident memory of this process,
+    in bytes.
+
+    Either can be None if the system doesn't tell.  The peak is the high
+    water mark since the process started (or reset_peak_memory())."""
+    rss = peak = None
+    try:
+        status = open('/proc/self/status').read()
+    except IOError:
+        pass
+    else:
+        for line in status.splitlines():
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) * 1024
+            elif line.startswith('VmHWM:'):
+                peak = int(line.split()[1]) * 1024
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            # kilobytes everywhere else
+            peak *= 1024
+    return rss,peak
+
+def reset_peak_memory():
+    """Reset the peak resident memory of this process to the current value.
+
+    Only possible on Linux 4.0 and later; returns whether it worked."""
+    peak0 = memory_usage()[1]
+    try:
+        f = open('/proc/self/clear_refs','w')
+        try:
+            f.write('5')
+        finally:
+            f.close()
+    except (IOError,OSError):
+        return False
+    # older kernels take the write but leave the peak alone
+    rss,peak = memory_usage()
+    if rss is None or peak is None:
+        return False
+    return peak <= rss or peak < peak0
+
+def type_census():
+    """Count the objects tracked by the garbage collector, by type.
+
+    Returns two dicts, {type name: count} and {type name: size in bytes}.
+    Only containers (and instances) are tracked by gc, so ints, strings and
+    the like are not seen, except through the size of what holds them."""
+    gc.collect()
+    counts = {}
+    sizes = {}
+    getsizeof = getattr(sys,'getsizeof',lambda obj: 0)
+    for obj in gc.get_objects():
+        t = type(obj)
+        if t is types.InstanceType:
+            t = obj.__class__
+        name = getattr(t,'__name__',str(t))
+        counts[name] = counts.get(name,0) + 1
+        try:
+            sizes[name] = sizes.get(name,0) + getsizeof(obj)
+        except TypeError:
+            pass
+    return counts,sizes
+
+_census_done = False
+
+def measure_memory(func,census=False):
+    """Call func() and return how it changed the memory of the process.
+
+    The result is a dict with the resident memory before and after the call
+    and its peak during the call (in bytes, see memory_usage()), and
+    'exact_peak', false if the peak couldn't be reset before the call: then
+    it is the peak of the whole process so far, which may be higher than the
+    one of the call.  With census true, 'types' has the net change in the
+    number and size of objects of each type, as {name: (count,size)}."""
+    global _census_done
+    if census:
+        if not _census_done:
+            # the first sys.getsizeof() calls on each type create a few
+            # descriptors, keep them out of the results
+            type_census()
+            _census_done = True
+        counts0,sizes0 = type_census()
+    exact = reset_peak_memory()
+    rss0,peak0 = memory_usage()
+    func()
+    rss1,peak1 = memory_usage()
+    if census:
+        counts1,sizes1 = type_census()
+    res = {'before' : rss0, 'after' : rss1, 'peak' : peak1,
+           'exact_peak' : exact or (peak1 is not None and peak1 != peak0)}
+    if rss0 is None:
+        # no current rss, the best guess for the start is the old peak
+        res['before'] = peak0
+    if census:
+        # (the census dicts only hold strings and ints, gc doesn't see them)
+        delta = {}
+        for name in set(counts0) | set(counts1):
+            dc = counts1.get(name,0) - counts0.get(name,0)
+            ds = sizes1.get(name,0) - sizes0.get(name,0)
+            if dc or ds:
+                delta[name] = (dc,ds)
+        res['types'] = delta
+    return res
+
+class ChildError(Exception):
+    """Exception raised in a child process of run_in_child()."""
+    pass
+
+def run_in_child(func,*args):
+    """Call func(*args) in a forked child process and return the result.
+
+    The result must be picklable.  The child gets a copy of everything, so
+    nothing it does affects this process.  If func raises, ChildError is
+    raised here with the child's traceback as its message."""
+    r,w = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(r)
+            try:
+                result = (True,func(*args))
+            except:
+                result = (False,''.join(traceback.format_exception(
+                    *sys.exc_info())))
+            out = os.fdopen(w,'wb')
+            pickle.dump(result,out,2)
+            out.close()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(0)
+    os.close(w)
+    inp = os.fdopen(r,'rb')
+    try:
+        data = inp.read()
+    finally:
+        inp.close()
+        os.waitpid(pid,0)
+    if not data:
+        raise ChildError('the child process died without a result')
+    ok,value = pickle.loads(data)
+    if not ok:
+        raise ChildError(value)
+    return value
+
+#-----------------------------------------------------------------------------
+# Timing, for %timeit
+
+def format_time(t,precision=3):
+    """Format a time in seconds with the most readable unit."""
+    units = ["s", "ms", "\xc2\xb5s", "ns"]
+    scaling = [1, 1e3, 1e6, 1e9]
+    if t > 0.0:
+        order = min(-int(math.floor(math.log10(t)) // 3), 3)
+    else:
+        order = 3
+    order = max(order,0)
+    return "%.*g %s" % (precision, t * scaling[order], units[order])
+
+def calibrate(timer,target=0.2):
+    """Return the number of loops for one timing run of timer (a
+    timeit.Timer) to take about 'target' seconds."""
+    number = 1
+    while True:
+        t = timer.timeit(number)
+        if t >= 0.2 * target or number >= 10**9:
+            break
+        if t < 1e-3:
+            # too short for the clock to tell much, grow fast
+            number *= 10
+        else:
+            number = int(number * 0.2 * target / t) + 1
+    if t <= 0:
+        # the clock never moved (a coarse or fake timer), don't go further
+        return number
+    number = int(number * target / t)
+    if number < 100:
+        return max(1, number)
+    # two significant digits are plenty
+    scale = 10 ** (len(str(number)) - 2)
+    return number // scale * scale
+
+class TimeitResult:
+    """All the timings of a %timeit run (returned by %timeit -o).
+
+    Attributes:
+
+      loops: the number of times the statement ran in each timing.
+      repeat: the number of timings.
+      all_runs: the total time of each timing, in seconds.
+      timings: the time per loop of each timing.
+      best, worst, mean, stdev, median: of the time per loop.
+      compile_time: time taken to compile the statement.
+
+    percentile(p) gives any other percentile of the time per loop."""
+
+    def __init__(self,loops,all_runs,compile_time=0.0,precision=3):
+        self.loops = loops
+        self.repeat = len(all_runs)
+        self.all_runs = list(all_runs)
+        self.timings = [t / loops for t in all_runs]
+        self.compile_time = compile_time
+        self.precision = precision
+        self.best = min(self.timings)
+        self.worst = max(self.timings)
+        self.mean = sum(self.timings) / self.repeat
+        if self.repeat > 1:
+            self.stdev = math.sqrt(sum([(t - self.mean)**2
+                                        for t in self.timings]) /
+                                   (self.repeat - 1))
+        else:
+            self.stdev = 0.0
+        self.median = self.percentile(50)
+
+    def percentile(self,p):
+        """The p-th percentile (0-100) of the time per loop, interpolating
+        between timings."""
+        timings = sorted(self.timings)
+        pos = (len(timings) - 1) * p / 100.0
+        lo = int(math.floor(pos))
+        hi = min(lo + 1, len(timings) - 1)
+        return timings[lo] + (timings[hi] - timings[lo]) * (pos - lo)
+
+    def __str__(self):
+        return "%d loops, best of %d: %s per loop" % \
+               (self.loops, self.repeat,
+                format_time(self.best, self.precision))
+
+    def __repr__(self):
+        return "<TimeitResult: %s (mean %s, stdev %s)>" % \
+               (self, format_time(self.mean, self.precision),
+                format_time(self.stdev, self.precision))
+
+
+def bench_env():
+    """The (host,python version) pair benchmark results are kept apart by."""
+    import socket
+    return socket.gethostname(), sys.version.split()[0]
+
+def bench_record(result,stmt,setup='pass'):
+    """A picklable summary of TimeitResult result, as stored by %bench."""
+    host,python = bench_env()
+    return {'date': time.time(), 'host': host, 'python': python,
+            'best': result.best, 'mean': result.mean, 'stdev': result.stdev,
+            'loops': result.loops, 'repeat': result.repeat,
+            'stmt': stmt, 'setup': setup}
+
+def bench_table(records,baselines={},threshold=0.1,precision=3):
+    """Lines comparing the benchmark records, a list of (name,record).
+
+    Each benchmark is compared to the fastest one, and to its record in the
+    baselines dict if there's one: runs slower than the baseline by more than
+    the threshold fraction are flagged as regressions.  Returns the lines and
+    the names of the regressed benchmarks."""
+
+    fastest = min([rec['best'] for name,rec in records])
+    width = max([len(name) for name,rec in records] + [9])
+    lines = ['%-*s %10s %22s %10s %7s  %s' % (width,'Benchmark','Best',
+                                              'Mean +- stdev','Loops',
+                                              'Ratio','vs baseline')]
+    regressed = []
+    for name,rec in records:
+        spread = '%s +- %s' % (format_time(rec['mean'],precision),
+                               format_time(rec['stdev'],precision))
+        base = baselines.get(name)
+        if base is None or base is rec:
+            change = 'new baseline'
+        else:
+            delta = rec['best'] / base['best'] - 1.0
+            change = '%+.1f%%' % (100 * delta)
+            if delta > threshold:
+                change += '  REGRESSION'
+                regressed.append(name)
+        lines.append('%-*s %s %s %10d %6.2fx  %s' % (
+            width,name,_rjust(format_time(rec['best'],precision),10),
+            _rjust(spread,22),rec['loops'],rec['best'] / fastest,change))
+    return lines,regressed
+
+def bench_history(entry):
+    """Lines listing the results kept by %bench in entry, oldest first."""
+    lines = ['%-16s %-28s %10s %10s %10s' % ('Date','Host/Python','Best',
+                                             'Mean','Loops')]
+    for rec in entry['history']:
+        env = rec['host'] + '/' + rec['python']
+        mark = ''
+        if entry['baseline'].get(env) == rec:
+            mark = '  (baseline)'
+        lines.append('%-16s %-28s %s %s %10d%s' % (
+            time.strftime('%Y-%m-%d %H:%M',time.localtime(rec['date'])),
+            env,_rjust(format_time(rec['best']),10),
+            _rjust(format_time(rec['mean']),10),rec['loops'],mark))
+    return lines
+
+def _rjust(s,width):
+    """s.rjust(width), counting the characters of utf-8 s (format_time may
+    return a micro sign)."""
+    return ' ' * (width - len(s.decode('utf-8'))) + s
+
+
+# Garbage collections are counted with a piece of cyclic trash: every
+# collection frees it (they all include the youngest generation), and the
+# callback of its weak reference counts that and makes the next one.
+_gc_collections = [0]
+_gc_sentinel = []
+
+class _Trash:
+    pass
+
+def _gc_callback(ref):
+    _gc_collections[0] += 1
+    _make_trash()
+
+def _make_trash():
+    trash = _Trash()
+    trash.cycle = trash
+    _gc_sentinel[:] = [weakref.ref(trash,_gc_callback)]
+
+def gc_collections():
+    """Number of garbage collections since the first call."""
+    if not _gc_sentinel:
+        _make_trash()
+    return _gc_collections[0]
+
+def _cpu_and_peak():
+    if resource is None:
+        return time.clock(),0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage[0] + usage[1],usage[2] * _maxrss_unit
+
+# ru_maxrss is in kilobytes, but on OS X
+_maxrss_unit = sys.platform == 'darwin' and 1 or 1024
+
+class CellStats:
+    """Resource use of the last cells run by the shell, in a ring buffer.
+
+    Each record is a tuple (count,wall,cpu,rss,gc): the prompt number of the
+    cell, the wall clock and CPU time it took (seconds), how much it raised
+    the peak resident memory of the process (bytes) and the number of garbage
+    collections meanwhile.
+    All the code run for one prompt number adds up in a single record.
+
+    Usage:
+
+      mark = stats.start()
+      ... run the cell ...
+      stats.stop(mark,count)"""
+
+    fields = ('count','wall','cpu','rss','gc')
+
+    def __init__(self,size=1000):
+        self.size = size
+        self.clear()
+        gc_collections()
+
+    def clear(self):
+        self.records = []
+        self._next = 0  # oldest record, once the buffer is full
+        self._slot = None  # where the last one is
+        self.last = None
+
+    def start(self):
+        """Take the measures before running a cell."""
+        return (time.time(),_cpu_and_peak(),_gc_collections[0])
+
+    def stop(self,mark,count):
+        """Record the cell started at mark, for prompt number count."""
+        wall = time.time()
+        cpu,peak = _cpu_and_peak()
+        wall0,(cpu0,peak0),gcs0 = mark
+        rec = (count,wall - wall0,cpu - cpu0,max(peak - peak0,0),
+               _gc_collections[0] - gcs0)
+        last = self.last
+        if last is not None and last[0] == count:
+            rec = (count,last[1] + rec[1],last[2] + rec[2],last[3] + rec[3],
+                   last[4] + rec[4])
+            self.records[self._slot] = rec
+        elif len(self.records) < self.size:
+            self._slot = len(self.records)
+            self.records.append(rec)
+        else:
+            self._slot = self._next
+            self.records[self._slot] = rec
+            self._next = (self._next + 1) % self.size
+        self.last = rec
+
+    def cells(self):
+        """The records, oldest first."""
+        return self.records[self._next:] + self.records[:self._next]
+
+def cells_table(cells,width=80):
+    """Lines showing cells, (label,wall,cpu,rss,gc,source) tuples.
+
+    The label says which input it is, source is the first line of it."""
+    size = max([len(str(c[0])) for c in cells] + [2])
+    lines = ['%*s %10s %10s %10s %6s  %s' % (size,'In','Wall','CPU',
+                                             'Mem (MiB)','GC','Input')]
+    room = max(width - size - 42,10)
+    for label,wall,cpu,rss,gc,source in cells:
+        if len(source) > room:
+            source = source[:room-3] + '...'
+        lines.append('%*s %s %s %10.1f %6d  %s' % (
+            size,label,_rjust(format_time(wall),10),
+            _rjust(format_time(cpu),10),rss / 1048576.0,gc,source))
+    return lines
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Time the startup of IPython, for the -startup_profile option.
+
+When -startup_profile is on the command line, the IPython package installs
+an import hook as soon as it is imported, which times every module loaded
+from then on.  make_IPython() marks the end of each phase of the
+initialization (command line, rc files, extensions...), and the whole
+breakdown is printed before the first prompt.
+
+Without the option, mark() is a no-op and nothing else is loaded.
+"""
+
+#*****************************************************************************
+#       Copyright (C) 2001-2006 Fernando Perez <fperez@colorado.edu>
+#
+#  Distributed under the terms of the BSD License.  The full license is in
+#  the file COPYING, distributed as part of this software.
+#*****************************************************************************
+
+import __builtin__
+import sys
+import time
+
+# The StartupTimer of this process, if any
+timer = None
+
+class StartupTimer:
+    """Time imports and named phases.
+
+    Phases are consecutive: mark(label) closes the one which started at the
+    previous mark (or when the timer was created).  Imports are timed by
+    module, counting only the modules which weren't loaded yet; the own time
+    of a module excludes the modules it imports itself."""
+
+    def __init__(self):
+        self.start = self.last = time.time()
+        self.phases = []
+        self.imports = []  # (own,cumulative,modules)
+        self._stack = []
+        self._import = None
+
+    def install(self):
+        """Start timing imports."""
+        if self._import is None:
+            self._import = __builtin__.__import__
+            __builtin__.__import__ = self._timed_import
+
+    def uninstall(self):
+        """Stop timing imports."""
+        if self._import is not None:
+            __builtin__.__import__ = self._import
+            self._import = None
+
+    def _timed_import(self,name,globals=None,locals=None,fromlist=None,
+                      *args):
+        modules = sys.modules
+        if not fromlist and modules.get(name) is not None:
+            # already there, not worth timing
+            return self._import(name,globals,locals,fromlist,*args)
+        before = len(modules)
+        self._stack.append(0.0)
+        t0 = time.time()
+        try:
+            return self._import(name,globals,locals,fromlist,*args)
+        finally:
+            elapsed = time.time() - t0
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            if len(modules) > before:
+                self.imports.append((elapsed - children,elapsed,
+                                     self._label(name,globals,fromlist)))
+
+    def _label(self,name,globals,fromlist):
+        """Full name of the module loaded by an import statement."""
+        modules = sys.modules
+        if globals and globals.get('__name__'):
+            # implicit relative import from a package
+            package = globals['__name__']
+            if '__path__' not in globals:
+                package = package[:package.rfind('.')+1].rstrip('.')
+            if package and modules.get(package + '.' + name) is not None:
+                name = package + '.' + name
+        if fromlist:
+            subs = [name + '.' + sub for sub in fromlist
+                    if modules.get(name + '.' + sub) is not None]
+            if subs:
+                return ','.join(subs)
+        return name
+
+    def mark(self,label):
+        """End the current phase, naming it label."""
+        now = time.time()
+        self.phases.append((label,now - self.last))
+        self.last = now
+
+    def report(self,limit=15):
+        """Return the lines of the startup breakdown."""
+        total = self.last - self.start
+        lines = ['IPython startup: %.1f ms' % (1000 * total),'']
+        for label,elapsed in self.phases:
+            lines.append('  %-40s %8.1f ms %5.1f%%' %
+                         (label,1000 * elapsed,
+                          100 * elapsed / max(total,1e-9)))
+        if self.imports:
+            imports = self.imports[:]
+            imports.sort()
+            imports.reverse()
+            own = sum([i[0] for i in imports])
+            lines.append('')
+            lines.append('Imports: %d, %.1f ms; the slowest ones (own and '
+                         'cumulative time):' % (len(imports),1000 * own))
+            for own,cumulative,name in imports[:limit]:
+                lines.append('  %-40s %8.1f ms %8.1f ms' %
+                             (name,1000 * own,1000 * cumulative))
+        return lines
+
+def requested(argv):
+    """Does the command line argv ask for -startup_profile?
+
+    This is needed before the command line is parsed, so it takes every
+    form DPyGetOpt accepts: one or two dashes, and any abbreviation.  An
+    ambiguous one, or an argument of a script, is taken too; make_IPython()
+    stops the timer again when the parsed options don't have it."""
+    for arg in argv:
+        if arg == '--':
+            break
+        name = arg[1 + arg.startswith('--'):]
+        if arg.startswith('-') and name and \
+               'startup_profile'.startswith(name):
+            return True
+    return False
+
+def start(install=True):
+    """Create the timer of this process, timing imports unless install is
+    false.  Returns the timer."""
+    global timer
+    if timer is None:
+        timer = StartupTimer()
+    if install:
+        timer.install()
+    return timer
+
+def mark(label):
+    """End the current startup phase, if startup is being timed."""
+    if timer is not None:
+        timer.mark(label)
+
+def finish():
+    """Stop timing the startup and return the report lines (None if startup
+    wasn't timed)."""
+    global timer
+    if timer is None:
+        return None
+    timer.uninstall()
+    lines = timer.report()
+    timer = None
+    return lines
@@ -187,6 +187,11 @@ REGULAR OPTIONS
               issued).  This limit is defined because otherwise  you'll  spend
               more time re-flushing a too small cache than working.
 
+       -cell_stats <n>
+              Measure the wall clock and CPU time, peak memory growth and
+              garbage collections of every input, keeping the last <n> (0, the
+              default, disables it).  See %perfhist and the \T prompt escape.
+
        -classic|cl
               Gives IPython a similar feel to the classic Python prompt.
 
@@ -209,12 +214,34 @@ REGULAR OPTIONS
               The  magic function @color_info allows you to toggle this inter-
               actively for testing.
 
+       -[no]configcache
+              Keep the merged contents of the  ipythonrc  file  and  all  the
+              files it includes in a binary cache, under IPYTHONDIR/rccache.
+              The cache is reused as long as none of  those  files  changed
+              (path, modification time and size), and it is on by default.
+              Use -noconfigcache to read the files anyway.  Only valid at the
+              command line.
+
        -[no]confirm_exit
               Set to confirm when you try to exit IPython with  an  EOF  (Con-
               trol-D in Unix, Control-Z/Enter in Windows). Note that using the
               magic functions @Exit or @Quit you  can  force  a  direct  exit,
               bypassing any confirmation.
 
+       -db_backend <name>
+              Storage used for the persistent database (%store, bookmarks,
+              shadow history...).  'dir' (default) keeps every key in its own
+              file under IPYTHONDIR/db.  'sqlite' keeps everything in the
+              single file IPYTHONDIR/db.sqlite, which is much faster on
+              network file systems. The first time 'sqlite' is used, the
+              contents of IPYTHONDIR/db are copied over.
+
+       -db_writeback <n>
+              With the 'dir' db_backend, keep values stored in the database in
+              memory and write them out (atomically, from a background thread)
+              at most n seconds later and at exit. Repeated writes to the same
+              key in between cost nothing. Default 0: write immediately.
+
        -[no]debug
               Show  information  about the loading process. Very useful to pin
               down problems with your configuration files or  to  get  details
@@ -266,6 +293,8 @@ REGULAR OPTIONS
               a session, you can quit IPython and reload it as many  times  as
               you  want  and  it  will continue to log its history and restore
               from the beginning every time.
+              Compressed (.gz, .bz2) logs and logs rotated into  several  files
+              by the 'size' and 'time' modes of %logstart are read transparently.
 
               Caveats: there are limitations in this option. The history vari-
               ables  _i*,_* and _dh don't get restored properly. In the future
@@ -350,6 +379,12 @@ REGULAR OPTIONS
               IPython's readline and syntax coloring fine, only  'emacs'  (M-x
               shell and C-c !)  buffers do not.
 
+       -[no]run_bytecache
+              Keep the compiled code of the scripts run with %run under IPY-
+              THONDIR/bytecode and reuse it until the script is modified (the
+              entries are keyed by path, mtime, size and Python version).
+              Enabled by default; %run -B skips the cache for a single run.
+
        -screen_length|sl <n>
               Number  of lines of your screen.  This is used to control print-
               ing of very long strings.  Strings longer than  this  number  of
@@ -374,6 +409,11 @@ REGULAR OPTIONS
        -nosep Shorthand for '-separate_in 0 -separate_out 0 -separate_out2 0'.
               Simply removes all input/output separators.
 
+       -startup_profile
+              Print how long each phase of the startup took (imports, command
+              line, config files, extensions...), and the slowest modules to
+              import, before the first prompt.  Only valid at the command line.
+
        -upgrade
               Allows you to upgrade your  IPYTHONDIR  configuration  when  you
               install  a  new  version  of  IPython.   Since  new versions may
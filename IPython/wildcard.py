@@ -17,7 +17,6 @@ __license__ = Release.license
 
 import __builtin__
 import exceptions
-import pdb
 import pprint
 import re
 import types
@@ -0,0 +1,71 @@
+"""Check that the %run bytecode cache is reused and invalidated correctly.
+
+Run with normal python:
+> python test_bytecache.py
+"""
+import os, sys, time, shutil, tempfile, unittest
+sys.path.append('..')
+
+from IPython.bytecache import ScriptCache
+
+def run(code):
+    ns = {}
+    exec code in ns
+    return ns['x']
+
+class ScriptCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.script = os.path.join(self.tmp, 'script.py')
+        self.write('x = 1\n')
+        self.cache = ScriptCache(os.path.join(self.tmp, 'bytecode'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, source, mtime=None):
+        open(self.script, 'w').write(source)
+        if mtime is not None:
+            os.utime(self.script, (mtime, mtime))
+
+    def test_reuse(self):
+        self.assertEqual(run(self.cache.compile(self.script)), 1)
+        # a fresh cache object finds the entry on disk
+        cache = ScriptCache(self.cache.dirname)
+        self.assertEqual(run(cache.compile(self.script)), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_modified(self):
+        mtime = time.time() - 10
+        self.write('x = 1\n', mtime)
+        self.cache.compile(self.script)
+        # same size, different mtime
+        self.write('x = 2\n', mtime + 1)
+        self.assertEqual(run(self.cache.compile(self.script)), 2)
+        # same mtime, different size
+        self.write('x = 33\n', mtime + 1)
+        self.assertEqual(run(self.cache.compile(self.script)), 33)
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_garbled(self):
+        self.cache.compile(self.script)
+        cname = self.cache.path(self.script)
+        data = open(cname, 'rb').read()
+        for bad in ['', data[:len(data) // 2], 'xxxx' + data[4:]]:
+            open(cname, 'wb').write(bad)
+            self.assertEqual(run(self.cache.compile(self.script)), 1)
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_unwritable(self):
+        # the cache directory can't be created: compile anyway
+        open(self.cache.dirname, 'w').close()
+        self.assertEqual(run(self.cache.compile(self.script)), 1)
+        self.assertEqual(self.cache.errors, 1)
+
+    def test_syntax_error(self):
+        self.write('x = (\n')
+        self.assertRaises(SyntaxError, self.cache.compile, self.script)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Check that the merged rc files are cached, and read again when stale.
+
+Run with normal python:
+> python test_configcache.py
+"""
+import os, sys, time, shutil, tempfile, unittest
+sys.path.append('..')
+
+from IPython.ConfigLoader import CachedConfigLoader
+from IPython.genutils import qwflat
+
+class ConfigCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.conf = os.path.join(self.tmp, 'conf')
+        self.inc = os.path.join(self.tmp, 'inc')
+        os.mkdir(self.conf)
+        os.mkdir(self.inc)
+        self.cachedir = os.path.join(self.tmp, 'rccache')
+        self.write('conf', 'rc', 'a 1\ninclude base\n')
+        self.write('inc', 'base', 'b 2\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, dirname, fname, text, mtime=None):
+        fname = os.path.join(self.tmp, dirname, fname)
+        open(fname, 'w').write(text)
+        if mtime is not None:
+            os.utime(fname, (mtime, mtime))
+
+    def load(self):
+        loader = CachedConfigLoader(self.cachedir)
+        data = loader.load('rc', {int: 'a b', qwflat: 'include'}, 'include',
+                           [self.conf, self.inc])
+        return loader.cache_hit, (data.a, data.get('b'))
+
+    def test_reuse(self):
+        self.assertEqual(self.load(), (False, (1, 2)))
+        self.assertEqual(self.load(), (True, (1, 2)))
+
+    def test_modified(self):
+        mtime = time.time() - 10
+        self.write('inc', 'base', 'b 2\n', mtime)
+        self.load()
+        # same size, different mtime
+        self.write('inc', 'base', 'b 3\n', mtime + 1)
+        self.assertEqual(self.load(), (False, (1, 3)))
+        # same mtime, different size
+        self.write('inc', 'base', 'b 33\n', mtime + 1)
+        self.assertEqual(self.load(), (False, (1, 33)))
+        self.assertEqual(self.load(), (True, (1, 33)))
+
+    def test_shadowed(self):
+        self.load()
+        # a new include earlier in the path takes over
+        self.write('conf', 'base', 'b 4\n')
+        self.assertEqual(self.load(), (False, (1, 4)))
+
+    def test_missing_include(self):
+        os.remove(os.path.join(self.inc, 'base'))
+        self.assertEqual(self.load(), (False, (1, None)))
+        self.assertEqual(self.load(), (False, (1, None)))
+        # and it shows up later
+        self.write('inc', 'base', 'b 5\n')
+        self.assertEqual(self.load(), (False, (1, 5)))
+
+    def test_garbled(self):
+        self.load()
+        cname = os.path.join(self.cachedir, os.listdir(self.cachedir)[0])
+        data = open(cname, 'rb').read()
+        for bad in ['', data[:len(data) // 2], 'xxxx' + data[4:]]:
+            open(cname, 'wb').write(bad)
+            self.assertEqual(self.load(), (False, (1, 2)))
+
+    def test_unwritable(self):
+        open(self.cachedir, 'w').close()
+        self.assertEqual(self.load(), (False, (1, 2)))
+        self.assertEqual(self.load(), (False, (1, 2)))
+
+if __name__ == '__main__':
+    unittest.main()
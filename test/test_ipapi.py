@@ -49,6 +49,50 @@ def test_defalias():
     assert slot[0] == 'testalias foo bar'
         
 
+LAZYEXT = """
+import IPython.ipapi
+ip = IPython.ipapi.get()
+
+def lazy_f(self, arg):
+    self.user_ns['lazy_arg'] = arg
+
+def lazy_completer(self, event):
+    return ['alpha', 'beta']
+
+if __name__ == 'lazymagic':
+    ip.expose_magic('lazymagic', lazy_f)
+else:
+    ip.set_hook('complete_command', lazy_completer, str_key = 'lazycmd')
+"""
+
+def test_lazy_load():
+    import os, shutil, tempfile
+    tmp = tempfile.mkdtemp()
+    sys.path.insert(0, tmp)
+    try:
+        for mod in ['lazymagic', 'lazycompleter']:
+            open(os.path.join(tmp, mod + '.py'), 'w').write(LAZYEXT)
+        ip.load('lazymagic', magics = ['lazymagic'])
+        ip.load('lazycompleter', completers = ['lazycmd'])
+        assert 'lazymagic' not in sys.modules
+        assert 'lazycompleter' not in sys.modules
+        
+        # a magic loads its extension...
+        ip.magic('lazymagic 12')
+        assert ip.user_ns['lazy_arg'] == '12'
+        assert ip.extension_stats['lazymagic'][1] == '%lazymagic'
+        assert 'lazycompleter' not in sys.modules
+        
+        # ...and so does a completion, once
+        for i in range(2):
+            assert ip.IP.Completer.complete('b', 0, 'lazycmd b') == 'beta'
+        assert ip.extension_stats['lazycompleter'][1] == 'completing lazycmd'
+        assert 'lazycompleter' not in ip.lazy_extensions
+    finally:
+        sys.path.remove(tmp)
+        shutil.rmtree(tmp)
+
 test_runlines()
 test_db()
 test_defalias
+test_lazy_load()
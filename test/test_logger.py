@@ -0,0 +1,71 @@
+"""Check that the buffered log writer doesn't fail silently.
+
+Run with normal python:
+> python test_logger.py
+"""
+import errno, os, sys, time, shutil, tempfile, unittest
+from StringIO import StringIO
+sys.path.append('..')
+
+from IPython.Logger import Logger
+
+class WriterErrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmp, 'log.py')
+        self.logger = Logger(None, self.fname, '#header\n')
+        self.logger.flush_interval = 0.01
+        self.logger.logstart(buffered=True)
+
+    def tearDown(self):
+        self.logger.logstop()
+        shutil.rmtree(self.tmp)
+
+    def output(self, func, *args):
+        """What func(*args) prints"""
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            func(*args)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def fail_writes(self):
+        def emit(data):
+            raise IOError(errno.ENOSPC, 'No space left on device')
+        self.logger._emit = emit
+        self.logger.log_write('a = 1')
+        self.logger._writer.join(5)
+        self.failIf(self.logger._writer.isAlive())
+        del self.logger._emit
+
+    def test_reported(self):
+        logger = self.logger
+        self.fail_writes()
+        self.failIf(logger.log_active)
+        out = self.output(logger.log_write, 'b = 2')
+        self.assert_('No space left on device' in out, out)
+        self.assert_('6 bytes of log were lost' in out, out)
+        # only once, and nothing piles up while the log is off
+        self.assertEqual(self.output(logger.log_write, 'c = 3'), '')
+        self.assertEqual(len(logger._buf), 0)
+
+    def test_logstate(self):
+        self.fail_writes()
+        out = self.output(self.logger.logstate)
+        self.assert_('No space left on device' in out, out)
+        self.assert_('temporarily suspended' in out, out)
+
+    def test_logon(self):
+        logger = self.logger
+        self.fail_writes()
+        self.output(logger.switch_log, True)
+        # the writer is gone, so it's written right away
+        self.output(logger.log_write, 'd = 4')
+        logger.logstop()
+        self.assertEqual(open(self.fname).read(), '#header\nd = 4\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Check that replaying a log in chunks runs the same as block by block,
+and that scripts aren't taken for rotated logs.
+
+Run with normal python:
+> python test_logreplay.py
+"""
+
+from StringIO import StringIO
+import os, sys, shutil, tempfile
+sys.path.append('..')
+
+failures = []
+num_tests = 0
+
+tests = [
+    # the SyntaxError is reported on the second line
+    ('q = (\n1\nr = 3\n', ['q = (']),
+    ('a = 1\n'
+     'try:\n    b = 1/0\nexcept ZeroDivisionError:\n    b = 2\n'
+     'else:\n    b = 3\nfinally:\n    c = 4\n'
+     'if a == 2:\n    d = 1\nelif a == 1:\n    d = 2\nelse:\n    d = 3\n'
+     'e = (\nf = 5\n'
+     'g = undefined_name\n'
+     '_ip.magic("autocall 0")\n'
+     'for i in range(3):\n    h = i\nelse:\n    h = 10\n'
+     'x = 1 +\ny = 6\n',
+     ['e = (', 'g = undefined_name', 'x = 1 +']),
+    ]
+
+def replay(src, chunk_size):
+    """Replay log src, return the namespace and the bad blocks"""
+    fd, fname = tempfile.mkstemp()
+    try:
+        os.write(fd, src)
+        os.close(fd)
+        ns = {'_ip' : ip}
+        bad = ip.IP.replay_log(fname, ns, ns, chunk_size = chunk_size)[0]
+    finally:
+        os.remove(fname)
+    del ns['_ip']
+    ns.pop('__builtins__', None)
+    return ns, bad
+
+def check_scripts():
+    """A name.<n> file next to a script isn't a segment of it"""
+    tmp = tempfile.mkdtemp()
+    try:
+        script = os.path.join(tmp, 't.py')
+        open(script, 'w').write('from_script = 1\n')
+        open(script + '.2', 'w').write(ip.IP.loghead_tpl % ('', '') +
+                                       'from_log = 1\n')
+        ns = {}
+        ip.IP.safe_execfile(script, ns)
+        if 'from_script' not in ns or 'from_log' in ns:
+            failures.append('t.py next to t.py.2: ran %r' % ns.keys())
+        # only the sibling exists
+        os.remove(script)
+        err = sys.stderr.tell()
+        ip.IP.safe_execfile(script, ns)
+        sys.stderr.seek(err)
+        if 'Could not open file' not in sys.stderr.read():
+            failures.append('missing t.py with t.py.2: no error')
+    finally:
+        shutil.rmtree(tmp)
+
+# Shutdown stdout/stderr so that ipython isn't noisy during tests.
+old_stdout = sys.stdout
+old_stderr = sys.stderr
+
+sys.stdout = StringIO()
+sys.stderr = StringIO()
+
+import IPython
+import IPython.ipapi
+
+IPython.Shell.start()
+ip = IPython.ipapi.get()
+
+try:
+    for src, expected in tests:
+        # one block per chunk first, then wherever the chunks may end
+        ns, bad = replay(src, 1)
+        num_tests += 1
+        if bad != expected:
+            failures.append('%r: expected %r to fail, got %r' % 
+                            (src, expected, bad))
+        for size in range(2, src.count('\n') + 2):
+            num_tests += 1
+            if replay(src, size) != (ns, bad):
+                failures.append('%r, chunk_size %d: got %r, expected %r' %
+                                (src, size, replay(src, size), (ns, bad)))
+    num_tests += 1
+    check_scripts()
+finally:
+    sys.stdout = old_stdout
+    sys.stderr = old_stderr
+
+print '%s tests run, %s failure%s' % (num_tests,
+                                      len(failures),
+                                      len(failures) != 1 and 's' or '')
+for f in failures:
+    print f
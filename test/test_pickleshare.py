@@ -0,0 +1,151 @@
+"""Hammer one PickleShare database from several processes at once.
+
+Run with normal python:
+> python test_pickleshare.py
+"""
+import os, sys, time, shutil, tempfile, threading, unittest
+sys.path.append('..')
+
+from IPython.Extensions import pickleshare
+
+NPROCS = 4
+NKEYS = 200
+
+def hammer(db, procnum):
+    """Insert NKEYS hashed keys and bump a shared counter NKEYS times"""
+    for i in range(NKEYS):
+        db.hset('hammer', '%d-%d' % (procnum, i), i)
+        db.lock('counter')
+        try:
+            db['counter'] = db.get('counter', 0) + 1
+        finally:
+            db.unlock('counter')
+
+def in_children(n, func):
+    """Run func(i) in n forked processes and wait for all of them"""
+    pids = []
+    for i in range(n):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                func(i)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+class ConcurrencyTest(unittest.TestCase):
+    dbclass = pickleshare.PickleShareDB
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_no_lost_updates(self):
+        def child(i):
+            hammer(self.dbclass(self.path), i)
+        in_children(NPROCS, child)
+        db = self.dbclass(self.path)
+        self.assertEqual(db['counter'], NPROCS * NKEYS)
+        self.assertEqual(len(db.hdict('hammer')), NPROCS * NKEYS)
+
+    def test_threads(self):
+        # made in this thread, used from others (like the threaded shells)
+        db = self.dbclass(self.path)
+        errors = []
+        def run(i):
+            try:
+                hammer(db, i)
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(NPROCS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(db['counter'], NPROCS * NKEYS)
+        self.assertEqual(len(db.hdict('hammer')), NPROCS * NKEYS)
+
+    def test_waitget_wakes_up(self):
+        db = self.dbclass(self.path)
+        def child(i):
+            time.sleep(0.3)
+            self.dbclass(self.path)['ready'] = 'go'
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child(0)
+            finally:
+                os._exit(0)
+        t = time.time()
+        self.assertEqual(db.waitget('ready', 10), 'go')
+        os.waitpid(pid, 0)
+        # polling alone would take at least 0.6 seconds
+        self.assert_(time.time() - t < 0.5)
+
+def old_hdict(path, hashroot):
+    """hdict() the way older versions read it: first pickle of each bucket"""
+    import glob, cPickle
+    d = {}
+    for f in sorted(glob.glob(os.path.join(path, hashroot, '*'))):
+        if os.path.isfile(f):
+            d.update(cPickle.load(open(f, 'rb')))
+    return d
+
+class BucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_old_readers(self):
+        db = pickleshare.PickleShareDB(self.path)
+        db.hcompact_min = 4
+        current = {}
+        for i in range(300):
+            key = i % 37
+            db.hset('h', key, i)
+            current[key] = i
+            # older versions may miss appended values, but never see 
+            # stale ones
+            for k, v in old_hdict(self.path, 'h').items():
+                self.assertEqual(v, current[k])
+        self.assertEqual(db.hdict('h'), current)
+        fresh = pickleshare.PickleShareDB(self.path)
+        for k, v in current.items():
+            self.assertEqual(fresh.hget('h', k), v)
+        fresh.hcompress('h')
+        self.assertEqual(old_hdict(self.path, 'h'), current)
+        self.assertEqual(fresh.hdict('h'), current)
+        self.assertEqual(fresh.hbuckets('h'), ['h/xx'])
+
+    def test_stray_bucket(self):
+        db = pickleshare.PickleShareDB(self.path)
+        db.hset('h', 'a', 1)
+        db.hset('h', 'a', 2)
+        # an older version doesn't see the log and starts a new bucket
+        # for another key that hashes the same
+        hfile = 'h/' + pickleshare.gethashfile('a')
+        b = [k for k in range(10000) 
+             if pickleshare.gethashfile(k) == hfile[2:]][0]
+        pickleshare.PickleShareDB(self.path)[hfile] = {b : 3}
+        db.hset('h', 'a', 4)
+        self.assertEqual(db.hdict('h'), {'a' : 4, b : 3})
+        self.assertEqual(old_hdict(self.path, 'h'), {'a' : 4, b : 3})
+
+if pickleshare.have_sqlite3():
+    class SqliteConcurrencyTest(ConcurrencyTest):
+        dbclass = pickleshare.SqliteShareDB
+
+if __name__ == '__main__':
+    if hasattr(os, 'fork'):
+        unittest.main()
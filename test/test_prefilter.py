@@ -8,6 +8,7 @@ Usage: run from the command line with *normal* python, not ipython:
 > python test_prefilter.py
 
 Fairly quiet output by default.  Pass in -v to get everyone's favorite dots.
+With -b, the lines tested are then used to time the prefilter.
 """
 
 # The prefilter always ends in a call to some self.handle_X method.  We swap
@@ -17,12 +18,18 @@ import sys
 sys.path.append('..')
 import IPython
 import IPython.ipapi
+from IPython import prefilter
 
 verbose = False
-if len(sys.argv) > 1:
-    if sys.argv[1] == '-v':
-        sys.argv = sys.argv[:-1]  # IPython is confused by -v, apparently
+benchmark = False
+for arg in sys.argv[1:]:
+    # IPython is confused by these, apparently
+    if arg == '-v':
+        sys.argv.remove(arg)
         verbose = True
+    elif arg == '-b':
+        sys.argv.remove(arg)
+        benchmark = True
     
 IPython.Shell.start()
 
@@ -117,6 +124,22 @@ def check_handler(expected_handler, line):
                                  handler_called))
     
 
+# Every (line, continue_prompt) tested, for the benchmark
+tested_lines = []
+
+def check_classifier(line, continue_prompt=False):
+    """Verify that prefilter.classify() picks the same handler as the chain
+    of check* functions, with the current options."""
+    tested_lines.append((line, continue_prompt))
+    handlers = []
+    for classify in [prefilter.classify, prefilter.classify_by_checks]:
+        handler = classify(prefilter.LineInfo(line, continue_prompt), ip.IP)
+        handlers.append((handler or ip.IP.handle_normal).im_func.name)
+    check(handlers[0] == handlers[1],
+          "classify() chose %s for %s, the checks %s" % (handlers[0],
+                                                         repr(line),
+                                                         handlers[1]))
+
 def run_handler_tests(h_tests):
     """Loop through a series of (input_line, handler_name) pairs, verifying
     that, for each ip calls the given handler for the given line. 
@@ -130,6 +153,7 @@ def run_handler_tests(h_tests):
         handler_called = None
         ip.runlines(ln)
         check_handler(expected_handler, ln)
+        check_classifier(ln)
 
 def run_one_test(ln, expected_handler):
     run_handler_tests([(ln, expected_handler)])
@@ -194,11 +218,13 @@ for ln in [ '    !ls $f multi_line_specials %s',
     on_ln = ln % 'on'
     ignore = ip.IP.prefilter(on_ln, continue_prompt=True)
     check_handler(handle_shell_escape, on_ln)
+    check_classifier(on_ln, True)
 
     ip.options.multi_line_specials = 0
     off_ln = ln % 'off'
     ignore = ip.IP.prefilter(off_ln, continue_prompt=True)
     check_handler(handle_normal, off_ln)
+    check_classifier(off_ln, True)
 
 ip.options.multi_line_specials = old_mls
 
@@ -243,11 +269,13 @@ ip.options.multi_line_specials = 0
 ln = '    cpaste multi_line off kills magic'
 ignore = ip.IP.prefilter(ln, continue_prompt=True)
 check_handler(handle_normal, ln)
+check_classifier(ln, True)
 
 ip.options.multi_line_specials = 1
 ln = '    cpaste multi_line on enables magic'
 ignore = ip.IP.prefilter(ln, continue_prompt=True)
 check_handler(handle_magic, ln)
+check_classifier(ln, True)
 
 # user namespace shadows the magic one unless shell escaped
 ip.user_ns['cpaste']     = 'user_ns'
@@ -438,3 +466,32 @@ print "%s tests run, %s failure%s" % (num_tests,
 for f in failures:
     print f
 
+# Benchmark
+# =========
+def time_lines(func, repeat=20):
+    """Best time per line of func(line, continue_prompt) over all the lines
+    tested."""
+    import time
+    best = None
+    for i in range(repeat):
+        t = time.time()
+        for ln, continue_prompt in tested_lines:
+            func(ln, continue_prompt)
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+    return best / len(tested_lines)
+
+if benchmark:
+    print
+    print "%d lines, time per line (handlers mocked):" % len(tested_lines)
+    for label, func in [
+        ('prefilter', ip.IP.prefilter),
+        ('LineInfo', prefilter.LineInfo),
+        ('classify', lambda ln, c: prefilter.classify(
+            prefilter.LineInfo(ln, c), ip.IP)),
+        ('classify_by_checks', lambda ln, c: prefilter.classify_by_checks(
+            prefilter.LineInfo(ln, c), ip.IP)),
+        ]:
+        print "  %-20s %6.2f us" % (label, time_lines(func) * 1e6)
+
@@ -0,0 +1,241 @@
+"""Check the callgrind export, accumulation and diff of profiles.
+
+Run with normal python:
+> python test_profiling.py
+"""
+import os, sys, time, shutil, tempfile, threading, unittest
+sys.path.append('..')
+
+from IPython import profiling
+
+try:
+    import cProfile as profile
+except ImportError:
+    import profile
+import pstats
+
+def work(n):
+    return sum(range(n))
+
+def loop(n):
+    for i in range(10):
+        work(n)
+
+def spin(n):
+    for i in range(n):
+        pass
+
+def busy(seconds):
+    """Keep the CPU busy in spin() for that long"""
+    end = time.time() + seconds
+    while time.time() < end:
+        spin(10000)
+
+def profiled(n):
+    prof = profile.Profile()
+    prof.runcall(loop, n)
+    return pstats.Stats(prof)
+
+class ProfilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_callgrind(self):
+        fname = os.path.join(self.tmp, 'callgrind.out')
+        profiling.write_callgrind(profiled(100), fname)
+        lines = open(fname).read().splitlines()
+        self.assertEqual(lines[0], 'version: 1')
+        self.assert_('fn=test_profiling.py:%d(loop)' %
+                     loop.func_code.co_firstlineno in lines)
+        # loop calls work 10 times
+        i = lines.index('cfn=test_profiling.py:%d(work)' %
+                        work.func_code.co_firstlineno)
+        self.assertEqual(lines[i+1].split()[0], 'calls=10')
+
+    def test_accumulate(self):
+        fname = os.path.join(self.tmp, 'acc.prof')
+        profiling.accumulate(profiled(100), fname)
+        total = profiling.accumulate(profiled(100), fname)
+        self.assertEqual(total.total_calls, 2 * profiled(100).total_calls)
+        self.assertEqual(pstats.Stats(fname).total_calls, total.total_calls)
+
+    def test_diff(self):
+        old, new = profiled(10), profiled(10)
+        new.add(profiled(10))
+        lines = profiling.diff_stats(old, new, 'calls', 'work')
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[-1].split()[:2], ['10', '20'])
+        self.assertRaises(ValueError, profiling.diff_stats, old, new, 'foo')
+
+class SamplerTest(unittest.TestCase):
+
+    def check(self, sampler):
+        self.assert_(sampler.nsamples > 5)
+        own, cum = sampler.counts()
+        self.assert_(own[profiling.code_key(spin.func_code)] >
+                     sampler.nsamples * 0.8)
+        self.assert_(cum[profiling.code_key(busy.func_code)] >
+                     sampler.nsamples * 0.9)
+
+    def test_runctx(self):
+        sampler = profiling.Sampler(0.005)
+        sampler.runctx('busy(0.2)', globals(), globals())
+        self.check(sampler)
+        self.assert_(sampler.report()[-len(sampler.counts()[1])].split()[-1]
+                     .endswith('(spin)'))
+        tmp = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmp, 'stacks')
+            sampler.write_collapsed(fname)
+            for line in open(fname):
+                stack, count = line.split()
+                self.assert_(stack.startswith('<string>:1(<module>);'))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_thread(self):
+        sampler = profiling.Sampler(0.005)
+        job = threading.Thread(target=busy, args=(0.2,))
+        job.start()
+        sampler.sample_thread(job.ident)
+        job.join()
+        self.assertEqual(sampler.mode, 'wall')
+        self.check(sampler)
+
+class LineProfilerTest(unittest.TestCase):
+
+    def test_hits(self):
+        prof = profiling.LineProfiler()
+        prof.add_function(loop)
+        prof.runcall(loop, 10)
+        first = loop.func_code.co_firstlineno
+        timings = prof.results()[profiling.code_key(loop.func_code)]
+        # the for line runs once more, to find the loop is over
+        self.assertEqual(timings[first + 1][0], 11)
+        self.assertEqual(timings[first + 2][0], 10)
+        # work() itself isn't traced
+        self.assertEqual(len(prof.results()), 1)
+
+    def test_compare(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmp, 'lprof')
+            prof = profiling.LineProfiler()
+            prof.add_function(loop)
+            prof.runctx('loop(10)', globals(), globals())
+            prof.save(fname)
+            baseline = profiling.load_line_results(fname)
+            self.assertEqual(baseline, prof.results())
+            listing = prof.listing(baseline)
+            self.assert_('Was (us)' in listing[4])
+            self.assert_(listing[-1].endswith('work(n)'))
+        finally:
+            shutil.rmtree(tmp)
+
+class Thing(object):
+    pass
+
+class MemoryTest(unittest.TestCase):
+
+    def test_measure(self):
+        keep = []
+        res = profiling.measure_memory(
+            lambda: keep.append([Thing() for i in range(1000)]), True)
+        self.assertEqual(res['types']['Thing'][0], 1000)
+        if res['before'] is not None:
+            self.assert_(res['peak'] - res['before'] >= 0)
+            self.assert_(res['after'] >= res['before'])
+
+    def test_reset_peak(self):
+        big = ' ' * (20*1024*1024)
+        del big
+        if profiling.reset_peak_memory():
+            rss,peak = profiling.memory_usage()
+            self.assert_(peak - rss < 10*1024*1024, (rss, peak))
+        # a kernel that ignores the request leaves the peak alone
+        memory_usage = profiling.memory_usage
+        profiling.memory_usage = lambda: (100, 200)
+        try:
+            self.assertEqual(profiling.reset_peak_memory(), False)
+        finally:
+            profiling.memory_usage = memory_usage
+
+    if hasattr(os, 'fork'):
+        def test_child(self):
+            keep = []
+            big = lambda: keep.append(' ' * (20*1024*1024))
+            res = profiling.run_in_child(profiling.measure_memory, big)
+            self.assertEqual(keep, [])
+            if res['exact_peak'] and res['before'] is not None:
+                self.assert_(res['peak'] - res['before'] >= 20*1024*1024)
+            self.assertRaises(profiling.ChildError, profiling.run_in_child,
+                              lambda: 1/0)
+
+class TimingTest(unittest.TestCase):
+
+    def test_calibrate(self):
+        import timeit
+        timer = timeit.Timer(lambda: work(100))
+        number = profiling.calibrate(timer, 0.05)
+        t = timer.timeit(number)
+        self.assert_(0.01 < t < 0.25, t)
+        self.assertEqual(int(str(number)[2:] or 0), 0)
+
+    def test_calibrate_stopped_clock(self):
+        class Timer:
+            def timeit(self, number):
+                return 0.0
+        self.assertEqual(profiling.calibrate(Timer()), 10**9)
+
+    def test_result(self):
+        res = profiling.TimeitResult(10, [1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(res.timings, [0.1, 0.2, 0.3, 0.4, 0.5])
+        self.assertEqual((res.best, res.worst), (0.1, 0.5))
+        self.assertAlmostEqual(res.mean, 0.3)
+        self.assertAlmostEqual(res.median, 0.3)
+        self.assertAlmostEqual(res.percentile(90), 0.46)
+        self.assertAlmostEqual(res.stdev, 0.158113883)
+        self.assertEqual(str(res), '10 loops, best of 5: 100 ms per loop')
+
+    def test_bench_table(self):
+        fast = profiling.bench_record(profiling.TimeitResult(10, [1.0]), 'a')
+        slow = profiling.bench_record(profiling.TimeitResult(10, [3.0]), 'b')
+        self.assertEqual(fast['host'], profiling.bench_env()[0])
+        base = profiling.bench_record(profiling.TimeitResult(10, [2.5]), 'b')
+        lines, regressed = profiling.bench_table(
+            [('fast', fast), ('slow', slow)], {'fast': fast, 'slow': base})
+        self.assertEqual(regressed, ['slow'])
+        self.assert_(lines[1].endswith('1.00x  new baseline'))
+        self.assert_(lines[2].endswith('3.00x  +20.0%  REGRESSION'))
+        # within the threshold
+        lines, regressed = profiling.bench_table([('slow', slow)],
+                                                 {'slow': base}, 0.25)
+        self.assertEqual(regressed, [])
+
+class CellStatsTest(unittest.TestCase):
+
+    def test_ring(self):
+        import gc
+        stats = profiling.CellStats(3)
+        for count in range(5):
+            mark = stats.start()
+            gc.collect()
+            stats.stop(mark, count)
+        # code run for the same input adds up
+        mark = stats.start()
+        gc.collect()
+        stats.stop(mark, 4)
+        cells = stats.cells()
+        self.assertEqual([c[0] for c in cells], [2, 3, 4])
+        self.assertEqual([c[4] for c in cells], [1, 1, 2])
+        self.assertEqual(stats.last, cells[-1])
+        lines = profiling.cells_table([c + ('x = 1',) for c in cells])
+        self.assertEqual(len(lines), 4)
+        self.assert_(lines[-1].endswith('2  x = 1'))
+
+if __name__ == '__main__':
+    unittest.main()
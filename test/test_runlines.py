@@ -0,0 +1,100 @@
+"""Check that runlines() in block mode keeps the same history as line mode.
+
+Run with normal python:
+> python test_runlines.py
+
+With -b, also time pastes of growing length in both modes.
+"""
+
+from StringIO import StringIO
+import sys, time
+sys.path.append('..')
+
+failures = []
+num_tests = 0
+
+def big_class(n):
+    """A class with n one line methods, about 2*n lines long"""
+    lines = ['class Big(object):', '    """Docstring with a colon:']
+    lines.append('    """')
+    for i in range(n):
+        lines.append('    def m%d(self, a = (1,' % i)
+        lines.append('            2)): return a # ")"')
+    return '\n'.join(lines) + '\n'
+
+def flat(n):
+    """n top level statements, some of them IPython syntax"""
+    lines = []
+    for i in range(n):
+        if i % 10 == 0:
+            lines.append('%autocall 0')
+        else:
+            lines.append('x%d = %d' % (i, i))
+    return '\n'.join(lines)
+
+tests = [
+    'a = 1\nb = [a,\n     2]\nc = """x:\n(\n"""\n',
+    'def f(x):\n    y = x\n    return y\n\nz = f(3)\n',
+    'for i in range(3):\n    j = i\n\nk = j\n',
+    'if 1:\n    p = 1\nelse:\n    p = 2\n\nq = p \\\n    + 1\n',
+    '%autocall 0\n!true\nr = 5\n',
+    '    s = 1\n    t = s\n',
+    '@staticmethod\ndef g(): pass\n\nclass C:\n    u = 1\n    def v(self): return 1\n\n',
+    big_class(20),
+    ]
+
+def run_both(src):
+    """Run src in line mode, then in block mode, return both records"""
+    records = []
+    for block in (False, True):
+        ih, ihr = len(ip.IP.input_hist), len(ip.IP.input_hist_raw)
+        count = ip.IP.outputcache.prompt_count
+        ip.IP.runlines(src, block)
+        records.append((ip.IP.input_hist[ih:], ip.IP.input_hist_raw[ihr:],
+                        ip.IP.outputcache.prompt_count - count))
+    return records
+
+def bench():
+    print >> old_stdout, '%8s %10s %10s' % ('lines', 'line mode', 'block mode')
+    for n in [125, 250, 500, 1000]:
+        src = big_class(n)
+        times = []
+        for block in (False, True):
+            t = time.time()
+            ip.IP.runlines(src, block)
+            times.append(time.time() - t)
+        print >> old_stdout, '%8d %9.2fs %9.2fs' % ((src.count('\n'),) +
+                                                     tuple(times))
+
+# Shutdown stdout/stderr so that ipython isn't noisy during tests.
+old_stdout = sys.stdout
+old_stderr = sys.stderr
+
+sys.stdout = StringIO()
+sys.stderr = StringIO()
+
+import IPython
+import IPython.ipapi
+
+IPython.Shell.start()
+ip = IPython.ipapi.get()
+ip.system = lambda cmd: None
+
+try:
+    for src in tests + [flat(100)]:
+        num_tests += 1
+        line_mode, block_mode = run_both(src)
+        if line_mode != block_mode:
+            failures.append('%r: line mode %r, block mode %r' %
+                            (src, line_mode, block_mode))
+    if '-b' in sys.argv:
+        bench()
+finally:
+    sys.stdout = old_stdout
+    sys.stderr = old_stderr
+
+print '%s tests run, %s failure%s' % (num_tests,
+                                      len(failures),
+                                      len(failures) != 1 and 's' or '')
+for f in failures:
+    print f
@@ -0,0 +1,113 @@
+"""Check the shadow history lookups, also after %clear shadow_compress.
+
+Run with normal python:
+> python test_shadowhist.py
+"""
+import errno, os, sys, shutil, tempfile, unittest
+sys.path.append('..')
+
+from IPython.Extensions import pickleshare
+from IPython.history import ShadowHist, regex_literals
+
+class ShadowHistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = pickleshare.PickleShareDB(os.path.join(self.tmp, 'db'))
+        self.shist = ShadowHist(self.db)
+        for i in range(300):
+            self.shist.add('cmd_%d = %d' % (i, i))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_get(self):
+        for i in range(300):
+            self.assertEqual(self.shist.get(i + 1), 'cmd_%d = %d' % (i, i))
+        self.assertEqual(self.shist.get(1000), None)
+
+    def test_get_compressed(self):
+        self.shist.compress()
+        for i in range(300, 600):
+            self.shist.add('cmd_%d = %d' % (i, i))
+        # a fresh session, nothing cached
+        shist = ShadowHist(pickleshare.PickleShareDB(self.db.root))
+        for cmd, idx in self.db.hdict('shadowhist').items():
+            self.assertEqual(shist.get(idx), cmd)
+        self.assertEqual(shist.get(1000), None)
+
+    def test_grep_compressed(self):
+        self.shist.compress()
+        for i in range(300, 600):
+            self.shist.add('cmd_%d = %d' % (i, i))
+        shist = ShadowHist(pickleshare.PickleShareDB(self.db.root))
+        self.assertEqual([s for i, s in shist.grep('cmd_5 =*')], 
+                         ['cmd_5 = 5'])
+        self.assertEqual(len(shist.grep('cmd_*')), 600)
+
+    def test_grep_options(self):
+        found = self.shist.grep(r'cmd_1\d = 1(\d)?$', regex = True)
+        self.assertEqual([s for i, s in found], 
+                         ['cmd_1%d = 1%d' % (i, i) for i in range(10)])
+        found = self.shist.grep(r'cmd_1\d = 1(\d)?$', regex = True, 
+                                recent_first = True, limit = 3)
+        self.assertEqual([s for i, s in found], 
+                         ['cmd_19 = 19', 'cmd_18 = 18', 'cmd_17 = 17'])
+
+    def test_regex_literals(self):
+        self.assertEqual(regex_literals(r'foo\.bar'), ['foo.bar'])
+        # optional groups and alternatives don't have to match
+        self.assertEqual(regex_literals(r'a(\.b)?c'), ['a', 'c'])
+        self.assertEqual(regex_literals(r'ab(\.cd|ef)'), ['ab'])
+        self.assertEqual(regex_literals(r'ab|cd'), [])
+        shist = self.shist
+        shist.add('cmd_ac')
+        self.assertEqual(shist.grep(r'cmd_(\.xyz)?ac', regex = True)[0][1],
+                         'cmd_ac')
+
+    def test_gaps(self):
+        shist = self.shist
+        shist.grep('cmd_1 =*')
+        # a session that crashed without giving back its indexes
+        crashed = ShadowHist(self.db)
+        crashed.owner = lambda: (shist.owner()[0], dead_pid())
+        crashed.add('crashed = 1')
+        # and one that is still running
+        other = ShadowHist(self.db)
+        other.add('other = 1')
+        gets = []
+        def get(idx):
+            gets.append(idx)
+            return ShadowHist.get(shist, idx)
+        shist.get = get
+        self.assertEqual(len(shist.grep('crashed =*')), 1)
+        self.assertEqual(len(shist.grep('other =*')), 1)
+        del gets[:]
+        shist.grep('nothing like it*')
+        # only the unused indexes of the running session are looked at
+        self.assertEqual(len(gets), ShadowHist.idx_batch - 1)
+        other.add('other = 2')
+        self.assertEqual(len(shist.grep('other =*')), 2)
+        other.release_idx()
+        shist.grep('nothing like it*')
+        del gets[:]
+        shist.grep('nothing like it*')
+        self.assertEqual(gets, [])
+        # and the saved index has no gaps to look at either
+        shist.save_index()
+        fresh = ShadowHist(pickleshare.PickleShareDB(self.db.root))
+        self.assertEqual(fresh.load_index().missing, set())
+
+def dead_pid():
+    """A pid no process has"""
+    pid = os.getpid()
+    while 1:
+        pid += 1
+        try:
+            os.kill(pid, 0)
+        except OSError, e:
+            if e.errno == errno.ESRCH:
+                return pid
+
+if __name__ == '__main__':
+    unittest.main()
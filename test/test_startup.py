@@ -0,0 +1,101 @@
+"""Check that IPython starts without loading the modules it only needs later,
+and that -startup_profile reports where the startup time goes.
+
+Run with normal python:
+> python test_startup.py
+
+With -b, also time the startup against the bare interpreter.
+"""
+import os, sys, time, shutil, tempfile, unittest
+import subprocess
+
+# Modules which must wait until they are used (see the function level imports
+# in genutils, Shell, Logger, PyColorize, Prompts and pickleshare, and the
+# extensions loaded lazily by ipy_system_conf)
+LAZY = ['doctest', 'unittest', 'optparse', 'sqlite3', 'tempfile', 'gzip',
+        'ctypes', 'socket', 'clearcmd', 'ipy_completers', 'IPython.Debugger',
+        'pdb', 'bdb']
+
+START = '''
+import sys
+sys.argv[1:] = %r
+import IPython
+IPython.Shell.start()
+print 'MODULES', ' '.join(sys.modules.keys())
+'''
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def python(code, ipythondir=None, *args):
+    """Run code in a fresh interpreter, return its output"""
+    env = os.environ.copy()
+    env['PYTHONPATH'] = top
+    env['TERM'] = 'dumb'
+    if ipythondir is not None:
+        code = START % (list(args) + ['-ipythondir', ipythondir])
+    p = subprocess.Popen([sys.executable, '-c', code], env=env,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT)
+    return p.communicate('\n')[0]
+
+def loaded(output):
+    for line in output.splitlines():
+        if line.startswith('MODULES '):
+            return line.split()[1:]
+    raise AssertionError('IPython did not start:\n' + output)
+
+class StartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ipythondir = tempfile.mkdtemp()
+        # the first run installs the config files
+        python('', self.ipythondir)
+
+    def tearDown(self):
+        shutil.rmtree(self.ipythondir)
+
+    def test_lazy(self):
+        for args in [['-quick'], []]:
+            modules = loaded(python('', self.ipythondir, *args))
+            self.assert_('IPython.iplib' in modules)
+            self.assertEqual([m for m in LAZY if m in modules], [], args)
+
+    def test_profile(self):
+        for opt in ['-startup_profile', '--startup_profile', '-startup']:
+            output = python('', self.ipythondir, '-quick', opt)
+            self.assert_('IPython startup: ' in output, output)
+            for phase in ['import IPython', 'command line', 'ipy_user_conf',
+                          'post-config initialization']:
+                self.assert_('  ' + phase + ' ' in output, phase)
+            self.assert_('IPython.iplib' in output, opt)
+
+    def test_other_options(self):
+        # -prof is still short for -profile
+        output = python('', self.ipythondir, '-prof', 'sh')
+        self.assert_('MODULES ' in output, output)
+        self.assert_('IPython startup: ' not in output, output)
+
+def best_time(code, ipythondir=None, *args):
+    times = []
+    for i in range(5):
+        t = time.time()
+        python(code, ipythondir, *args)
+        times.append(time.time() - t)
+    return min(times)
+
+def bench():
+    tmp = tempfile.mkdtemp()
+    try:
+        python('', tmp)
+        for label, args in [('python', ('pass',)),
+                            ('ipython', ('', tmp)),
+                            ('ipython -quick', ('', tmp, '-quick'))]:
+            print '%-15s %6.1f ms' % (label, 1000 * best_time(*args))
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    if '-b' in sys.argv:
+        sys.argv.remove('-b')
+        bench()
+    unittest.main()